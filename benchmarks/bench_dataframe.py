@@ -0,0 +1,57 @@
+### ============================================
+# 比较逐行补齐/截断后构造DataFrame(原 _download_gsheet 的做法)与 values_to_frame 的向量化转换
+#    python benchmarks/bench_dataframe.py --rows 100000 --cols 10
+# 需要安装 pandas
+### ============================================
+
+import argparse
+import copy
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from fake_sheets_server import FakeTab
+from dataframe_engine import require_pandas, values_to_frame
+
+
+def row_loop(values):
+    """对照组: 原先的逐行处理"""
+    pd, _ = require_pandas()
+    values = [row for row in values if any(row)]
+    num_columns = len(values[0])
+    for i in range(1, len(values)):
+        if len(values[i]) < num_columns:
+            values[i].extend([None] * (num_columns - len(values[i])))
+        elif len(values[i]) > num_columns:
+            values[i] = values[i][:num_columns]
+    return pd.DataFrame(values[1:], columns=values[0])
+
+
+def timed(convert, values):
+    values = copy.deepcopy(values)
+    start = time.perf_counter()
+    frame = convert(values)
+    return time.perf_counter() - start, frame.shape
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DataFrame转换基准测试")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--cols", type=int, default=10)
+    parser.add_argument("--blank-every", type=int, default=20, help="每隔多少行插入一个空行")
+    args = parser.parse_args()
+
+    tab = FakeTab("Ragged", args.rows, args.cols, ragged=True)
+    values = [[f"c{c}" for c in range(args.cols)]] + tab.values(2)
+    for i in range(args.blank_every, len(values), args.blank_every):
+        values[i] = []
+
+    for name, convert in (("逐行处理", row_loop), ("向量化", values_to_frame)):
+        elapsed, shape = timed(convert, values)
+        print(f"{name}: {elapsed:6.3f}s  结果 {shape[0]}行 x {shape[1]}列")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+### ============================================
+# 比较各输出格式(xlsx / csv / jsonl / parquet)的写入耗时和输出文件大小
+#    python benchmarks/bench_formats.py --spreadsheets 4 --rows 20000 --cols 10
+# 未安装 pyarrow 时跳过parquet
+### ============================================
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from google.auth.credentials import AnonymousCredentials
+from fake_sheets_server import FakeSheetsServer, make_workbooks
+from download_options import DownloadOptions
+from sheets_writers import OUTPUT_FORMATS, FORMAT_PARQUET
+import gsheet_to_excel_async
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def run(workbooks, output_format, args):
+    options = DownloadOptions(output_format=output_format, requests_per_minute=0, metadata_ttl=0,
+                              streaming=True, transport='pooled')
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        asyncio.run(gsheet_to_excel_async.download_multi_google_sheet_async(
+            list(workbooks), output_dir, max_concurrency=args.max_concurrency,
+            options=options, creds=AnonymousCredentials()
+        ))
+        elapsed = time.perf_counter() - start
+        size = directory_size(output_dir)
+    return elapsed, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="输出格式写入基准测试")
+    parser.add_argument("--spreadsheets", type=int, default=4)
+    parser.add_argument("--tabs", type=int, default=2)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--cols", type=int, default=10)
+    parser.add_argument("--max-concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    formats = list(OUTPUT_FORMATS)
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        print("未安装 pyarrow, 跳过parquet")
+        formats.remove(FORMAT_PARQUET)
+
+    workbooks = make_workbooks(args.spreadsheets, args.tabs, args.rows, args.cols)
+    results = {}
+    with FakeSheetsServer(workbooks) as server:
+        os.environ[gsheet_to_excel_async.API_ENDPOINT_ENV_VAR] = server.endpoint
+        for output_format in formats:
+            results[output_format] = run(workbooks, output_format, args)
+
+    cells = args.spreadsheets * args.tabs * args.rows * args.cols
+    for output_format, (elapsed, size) in results.items():
+        print(f"{output_format:>8}: 耗时 {elapsed:6.2f}s  {cells / elapsed:10.0f} 单元格/秒  "
+              f"输出 {size / 1024 / 1024:.2f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+### ============================================
+# GUI冷启动基准测试: 模块导入耗时、窗口第一次绘制的耗时和Sheet列表的批量导入
+#    python benchmarks/bench_gui_startup.py --sheets 5000 --runs 3
+# 导入耗时使用 python -X importtime 统计; 第一次绘制需要图形界面(DISPLAY), 没有时跳过
+### ============================================
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, SRC_DIR)
+
+from config_manager import ConfigManager, parse_sheet_list
+
+# 这些模块应当在第一次下载或认证时才导入
+HEAVY_MODULES = ('gsheet_to_excel_async', 'googleapiclient', 'google.auth', 'google_auth_oauthlib', 'openpyxl',
+                 'httplib2')
+
+FIRST_PAINT_SCRIPT = """
+import sys
+sys.path.insert(0, {src!r})
+import gui_main
+app = gui_main.GSheetDownloaderGUI()
+# 处理完所有待绘制事件, 相当于窗口第一次显示完成
+app.root.update()
+print('painted', flush=True)
+loaded = [name for name in {heavy!r} if name in sys.modules]
+print('loaded ' + ','.join(loaded), flush=True)
+app.root.destroy()
+"""
+
+
+def sheet_urls(count):
+    return [f"https://docs.google.com/spreadsheets/d/bench{i:06d}{'x' * 30}/edit" for i in range(count)]
+
+
+def import_times():
+    """返回 (gui_main的累计导入耗时ms, [(模块, 自身耗时ms)] 前10名)"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import gui_main'],
+                            cwd=SRC_DIR, capture_output=True, text=True, check=True)
+    total = None
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        modules.append((name, int(self_us) / 1000))
+        if name == 'gui_main':
+            total = int(cumulative_us) / 1000
+    modules.sort(key=lambda item: -item[1])
+    return total, modules[:10]
+
+
+def first_paint(home):
+    """返回 (从启动进程到第一次绘制完成的秒数, 绘制时已导入的重量级模块); 没有图形界面时返回None"""
+    env = dict(os.environ, HOME=home, USERPROFILE=home)
+    script = FIRST_PAINT_SCRIPT.format(src=SRC_DIR, heavy=HEAVY_MODULES)
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', script], cwd=home, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    painted = None
+    loaded = []
+    for line in process.stdout:
+        if line.startswith('painted'):
+            painted = time.perf_counter() - start
+        elif line.startswith('loaded'):
+            loaded = [name for name in line[len('loaded '):].strip().split(',') if name]
+    process.wait()
+    if painted is None:
+        return None
+    return painted, loaded
+
+
+def bench_registry(home, count, per_item_sample):
+    config_path = os.path.join(home, 'registry.json')
+    urls = sheet_urls(count)
+    if os.path.exists(config_path):
+        os.remove(config_path)
+    manager = ConfigManager(config_path)
+    start = time.perf_counter()
+    added = manager.add_sheets(urls)
+    bulk = time.perf_counter() - start
+
+    os.remove(config_path)
+    manager = ConfigManager(config_path)
+    manager.add_sheets(urls[per_item_sample:])
+    # 已有大量sheet时逐个添加: 每次添加都写入一次配置文件
+    start = time.perf_counter()
+    for url in urls[:per_item_sample]:
+        manager.add_sheet(url)
+    per_item = (time.perf_counter() - start) / per_item_sample
+    return len(added), bulk, per_item
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GUI冷启动基准测试")
+    parser.add_argument("--sheets", type=int, default=5000, help="配置中的Sheet数量")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--per-item-sample", type=int, default=200, help="测量逐个添加时的采样数")
+    args = parser.parse_args()
+
+    total, top = import_times()
+    print(f"import gui_main: {total:.1f}ms")
+    for name, self_ms in top:
+        print(f"  {self_ms:7.1f}ms  {name}")
+
+    with tempfile.TemporaryDirectory() as home:
+        added, bulk, per_item = bench_registry(home, args.sheets, min(args.per_item_sample, args.sheets))
+        print(f"批量导入 {added} 个Sheet: {bulk * 1000:.1f}ms; "
+              f"已有 {args.sheets} 个时逐个添加: 每个 {per_item * 1000:.1f}ms")
+
+        # 第一次绘制时加载包含 --sheets 个Sheet的配置
+        with open(os.path.join(home, 'config.json'), 'w', encoding='utf-8') as f:
+            json.dump({'recent_sheets': [{'id': sheet_id, 'url': url, 'name': ''}
+                                         for sheet_id, url in parse_sheet_list(sheet_urls(args.sheets))]}, f)
+        for i in range(args.runs):
+            outcome = first_paint(home)
+            if outcome is None:
+                print("第一次绘制: 跳过(没有图形界面或Tk无法启动)")
+                break
+            painted, loaded = outcome
+            print(f"第一次绘制 #{i + 1}: {painted * 1000:.0f}ms  已导入的重量级模块: {loaded or '无'}")
+
+
+if __name__ == "__main__":
+    main()
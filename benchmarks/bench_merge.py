@@ -0,0 +1,141 @@
+### ============================================
+# 合并模式基准测试: 比较 "逐个下载后再用脚本重新打开所有文件拼接" 与 --merge concat 一次写入
+#    python benchmarks/bench_merge.py --spreadsheets 24 --rows 5000 --format xlsx
+# 每种方式在单独的子进程中运行, 输出总耗时、子进程峰值RSS和写入磁盘的字节数
+### ============================================
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, '..', 'src')
+
+from fake_sheets_server import FakeSheetsServer, make_workbooks
+from bench_suite import wait_with_rusage
+
+APPROACHES = ('separate+concat', 'merge')
+
+
+def concat_xlsx_files(paths, output_path):
+    """下载后拼接的常见做法: 逐个只读打开, 同名工作表按行拼接, 第一列为来源"""
+    from openpyxl import Workbook, load_workbook
+    wb = Workbook(write_only=True)
+    sheets = {}
+    for path in paths:
+        source = os.path.splitext(os.path.basename(path))[0]
+        src = load_workbook(path, read_only=True)
+        for ws in src.worksheets:
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            target = sheets.get(ws.title)
+            if target is None:
+                target = sheets[ws.title] = wb.create_sheet(ws.title)
+                target.append(['source', *header])
+            for row in rows:
+                target.append([source, *row])
+        src.close()
+    wb.save(output_path)
+
+
+def concat_tab_dirs(paths, output_dir, extension):
+    """csv: 每个spreadsheet一个目录, 同名文件按行拼接"""
+    import csv
+    os.makedirs(output_dir, exist_ok=True)
+    writers = {}
+    files = []
+    for path in paths:
+        source = os.path.basename(path)
+        for name in sorted(os.listdir(path)):
+            with open(os.path.join(path, name), encoding='utf-8', newline='') as f:
+                rows = csv.reader(f)
+                header = next(rows, None)
+                if header is None:
+                    continue
+                writer = writers.get(name)
+                if writer is None:
+                    out = open(os.path.join(output_dir, name), 'w', encoding='utf-8', newline='')
+                    files.append(out)
+                    writer = writers[name] = csv.writer(out)
+                    writer.writerow(['source', *header])
+                for row in rows:
+                    writer.writerow([source, *row])
+    for out in files:
+        out.close()
+
+
+def run_child(config):
+    sys.path.insert(0, SRC_DIR)
+    from google.auth.credentials import AnonymousCredentials
+    from download_options import DownloadOptions
+    from tracing import configure_logging
+    import gsheet_to_excel_async
+
+    configure_logging('WARNING')
+    merge = 'concat' if config['approach'] == 'merge' else 'off'
+    options = DownloadOptions(requests_per_minute=0, metadata_ttl=0, output_format=config['format'],
+                              streaming=True, merge=merge)
+    report = asyncio.run(gsheet_to_excel_async.download_multi_google_sheet_async(
+        config['ids'], config['output_dir'], max_concurrency=config['max_concurrency'],
+        options=options, creds=AnonymousCredentials()
+    ))
+    if config['approach'] != 'merge':
+        paths = [result.output_path for result in report.results]
+        if config['format'] == 'xlsx':
+            concat_xlsx_files(paths, os.path.join(config['output_dir'], 'merged.xlsx'))
+        else:
+            concat_tab_dirs(paths, os.path.join(config['output_dir'], 'merged'), config['format'])
+    sys.exit(0 if report.success else 1)
+
+
+def bytes_written(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            if not name.startswith('.') and not name.endswith('.json'):
+                total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合并模式基准测试")
+    parser.add_argument("--spreadsheets", type=int, default=24)
+    parser.add_argument("--tabs", type=int, default=2)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--cols", type=int, default=10)
+    parser.add_argument("--format", choices=('xlsx', 'csv'), default='xlsx')
+    parser.add_argument("--max-concurrency", type=int, default=4)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(json.loads(args.child))
+        return
+
+    workbooks = make_workbooks(args.spreadsheets, args.tabs, args.rows, args.cols)
+    print(f"{args.spreadsheets}个spreadsheet x {args.tabs}个工作表 x {args.rows}行, 格式 {args.format}")
+    with FakeSheetsServer(workbooks) as server:
+        for approach in APPROACHES:
+            with tempfile.TemporaryDirectory() as home:
+                output_dir = os.path.join(home, 'out')
+                config = {'approach': approach, 'ids': list(workbooks), 'output_dir': output_dir,
+                          'format': args.format, 'max_concurrency': args.max_concurrency}
+                env = dict(os.environ, HOME=home, USERPROFILE=home, GSHEET_API_ENDPOINT=server.endpoint)
+                start = time.perf_counter()
+                process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--child', json.dumps(config)],
+                                           env=env)
+                exit_code, peak_rss = wait_with_rusage(process)
+                elapsed = time.perf_counter() - start
+                rss = f"{peak_rss / 1e6:.0f}MB" if peak_rss is not None else '-'
+                print(f"{approach:<16} 退出码 {exit_code}  耗时 {elapsed:6.2f}s  峰值RSS {rss:>6}  "
+                      f"写入 {bytes_written(output_dir) / 1e6:.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+### ============================================
+# 比较下载开始前逐个请求元数据与multipart批量请求元数据的准备耗时
+#    python benchmarks/bench_metadata_batch.py --spreadsheets 300 --latency 0.1
+# 工作负载: 大量只有一个小工作表的spreadsheet, 准备阶段(获取所有元数据)占总耗时的大部分
+# 模拟服务器对每个HTTP请求(包括批量请求)只加一次延迟, 即只模拟往返次数的差别
+### ============================================
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from google.auth.credentials import AnonymousCredentials
+from fake_sheets_server import FakeSheetsServer, make_workbooks
+from download_options import DownloadOptions
+from tracing import configure_logging
+import gsheet_to_excel_async
+
+
+def main():
+    parser = argparse.ArgumentParser(description="元数据批量请求基准测试")
+    parser.add_argument("--spreadsheets", type=int, default=300)
+    parser.add_argument("--rows", type=int, default=20)
+    parser.add_argument("--cols", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--max-concurrency", type=int, default=4)
+    parser.add_argument("--batch-sizes", type=int, nargs='+', default=[0, 50, 100])
+    args = parser.parse_args()
+    configure_logging('WARNING')
+
+    workbooks = make_workbooks(args.spreadsheets, 1, args.rows, args.cols)
+    print(f"{args.spreadsheets}个spreadsheet, 每个请求延迟 {args.latency}s, 并发 {args.max_concurrency}")
+    with FakeSheetsServer(workbooks, latency=args.latency) as server:
+        os.environ[gsheet_to_excel_async.API_ENDPOINT_ENV_VAR] = server.endpoint
+        for batch_size in args.batch_sizes:
+            server.reset_counters()
+            options = DownloadOptions(requests_per_minute=0, metadata_ttl=0, output_format='csv',
+                                      metadata_batch_size=batch_size)
+            with tempfile.TemporaryDirectory() as output_dir:
+                report = asyncio.run(gsheet_to_excel_async.download_multi_google_sheet_async(
+                    list(workbooks), output_dir, max_concurrency=args.max_concurrency,
+                    options=options, creds=AnonymousCredentials()
+                ))
+            elapsed = report.finished_at - report.started_at
+            label = "逐个请求" if not batch_size else f"每批{batch_size}个"
+            print(f"{label:<8} 准备 {report.metadata_prefetch_seconds:6.2f}s  总耗时 {elapsed:6.2f}s  "
+                  f"HTTP请求 {server.counters['requests']:4d}  失败 {len(report.failed_ids)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+### ============================================
+# 共享工作队列(--queue)的多worker测试: 每个worker是单独的命令行进程, 与多台主机的运行方式相同
+#    python benchmarks/bench_queue.py --spreadsheets 24 --workers 3 --latency 0.2
+# 场景:
+#   join_first: 不指定ID的worker先启动, 等待之后指定了ID的worker创建队列
+#   crash: 一个worker在下载中途被强制结束, 它持有的租约过期后由其他worker重新领取
+# 每个场景最后运行 --merge-reports, 检查所有ID都有结果且都下载成功; 有问题时以状态码1退出
+### ============================================
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CLI_PATH = os.path.join(BENCH_DIR, '..', 'src', 'gsheet_to_excel_async.py')
+
+from fake_sheets_server import FakeSheetsServer, make_workbooks
+from bench_startup import write_fake_auth
+
+SCENARIOS = ('join_first', 'crash')
+# crash场景使用较短的租约, 让被结束的worker的租约很快过期
+CRASH_LEASE_SECONDS = 3
+
+
+def worker_command(ids, output_dir, queue_dir, worker_name, lease_seconds):
+    return [sys.executable, CLI_PATH, *ids, '--output-dir', output_dir, '--queue', queue_dir,
+            '--worker-name', worker_name, '--lease-seconds', str(lease_seconds), '--format', 'csv',
+            '--max-concurrency', '1', '--requests-per-minute', '0', '--metadata-ttl', '0', '--log-level', 'WARNING']
+
+
+def run_scenario(name, ids, env, args):
+    with tempfile.TemporaryDirectory() as work_dir:
+        output_dir = os.path.join(work_dir, 'out')
+        queue_dir = os.path.join(work_dir, 'queue')
+        lease_seconds = CRASH_LEASE_SECONDS if name == 'crash' else 300
+        start = time.perf_counter()
+        workers = []
+        if name == 'join_first':
+            # 不指定ID的worker先启动, 不能用空列表创建队列
+            for i in range(1, args.workers):
+                workers.append(subprocess.Popen(worker_command([], output_dir, queue_dir, f"w{i}", lease_seconds),
+                                                env=env))
+            time.sleep(1.0)
+            workers.insert(0, subprocess.Popen(worker_command(ids, output_dir, queue_dir, 'w0', lease_seconds),
+                                               env=env))
+        else:
+            victim = subprocess.Popen(worker_command(ids, output_dir, queue_dir, 'victim', lease_seconds), env=env)
+            time.sleep(args.latency * 6 + 2)
+            for i in range(args.workers - 1):
+                workers.append(subprocess.Popen(worker_command([], output_dir, queue_dir, f"w{i}", lease_seconds),
+                                                env=env))
+            time.sleep(args.latency * 2)
+            victim.send_signal(signal.SIGKILL)
+            victim.wait()
+        exit_codes = [worker.wait() for worker in workers]
+        elapsed = time.perf_counter() - start
+
+        merge = subprocess.run([sys.executable, CLI_PATH, '--output-dir', output_dir, '--queue', queue_dir,
+                                '--merge-reports', '--log-level', 'WARNING'], env=env)
+        with open(os.path.join(output_dir, 'gsheet_run_report.json'), encoding='utf-8') as f:
+            report = json.load(f)
+
+    problems = []
+    if any(exit_codes):
+        problems.append(f"worker退出码 {exit_codes}")
+    if merge.returncode:
+        problems.append(f"--merge-reports 退出码 {merge.returncode}")
+    if report['missing_ids'] or report['failed_ids']:
+        problems.append(f"缺失 {report['missing_ids']}, 失败 {report['failed_ids']}")
+    if report['queue']['done'] != len(ids):
+        problems.append(f"队列完成 {report['queue']['done']}/{len(ids)}")
+    per_worker = {worker['worker']: (worker['counts'] or {}).get('downloaded', 0) for worker in report['workers']}
+    status = '通过' if not problems else '失败: ' + '; '.join(problems)
+    print(f"{name:<10} 耗时 {elapsed:6.2f}s  各worker下载数 {per_worker}  重复 {len(report['duplicate_ids'])}  {status}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="共享工作队列的多worker测试")
+    parser.add_argument("--spreadsheets", type=int, default=24)
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--scenarios", nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    args = parser.parse_args()
+    if args.workers < 2:
+        parser.error("--workers 至少为2")
+
+    workbooks = make_workbooks(args.spreadsheets, 2, 200, 6)
+    ids = list(workbooks)
+    print(f"{args.spreadsheets}个spreadsheet, {args.workers}个worker, 每个请求延迟 {args.latency}s")
+    failed = False
+    with FakeSheetsServer(workbooks, latency=args.latency) as server, tempfile.TemporaryDirectory() as home:
+        credentials_path, token_path = write_fake_auth(os.path.join(home, '.gsheet_downloader'))
+        env = dict(os.environ, HOME=home, USERPROFILE=home,
+                   GCP_CREDENTIALS_JSON=credentials_path, GCP_TOKEN_JSON=token_path,
+                   GSHEET_API_ENDPOINT=server.endpoint)
+        for name in args.scenarios:
+            failed |= bool(run_scenario(name, ids, env, args))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+### ============================================
+# 在返回429的模拟服务器上运行完整下载, 检查重试和限流计数
+#    python benchmarks/bench_retry.py --throttle-rate 0.2 --requests-per-minute 600
+### ============================================
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from google.auth.credentials import AnonymousCredentials
+from fake_sheets_server import FakeSheetsServer, make_workbooks
+from download_options import DownloadOptions
+import gsheet_to_excel_async
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重试与限流基准测试")
+    parser.add_argument("--spreadsheets", type=int, default=8)
+    parser.add_argument("--tabs", type=int, default=3)
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--throttle-rate", type=float, default=0.2)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--requests-per-minute", type=int, default=600)
+    parser.add_argument("--max-concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    workbooks = make_workbooks(args.spreadsheets, args.tabs, args.rows)
+    with FakeSheetsServer(workbooks, throttle_rate=args.throttle_rate,
+                          retry_after=args.retry_after) as server, \
+            tempfile.TemporaryDirectory() as output_dir:
+        os.environ[gsheet_to_excel_async.API_ENDPOINT_ENV_VAR] = server.endpoint
+        options = DownloadOptions(requests_per_minute=args.requests_per_minute)
+        start = time.perf_counter()
+        report = asyncio.run(gsheet_to_excel_async.download_multi_google_sheet_async(
+            list(workbooks), output_dir, max_concurrency=args.max_concurrency,
+            options=options, creds=AnonymousCredentials()
+        ))
+        elapsed = time.perf_counter() - start
+
+    print(f"耗时: {elapsed:.2f}s")
+    print(f"服务器计数: {server.counters}")
+    print(f"客户端计数: {report.request_stats}")
+    print(f"失败: {report.failed_ids}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+### ============================================
+# 测量从启动命令行到第一个请求到达服务器的耗时
+#    python benchmarks/bench_startup.py --runs 5
+# 第一次运行使用空的 ~/.gsheet_downloader (冷启动, 没有元数据缓存), 之后的运行为热启动
+# 使用本地模拟服务器和一个未过期的假token, 不会访问Google
+### ============================================
+
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CLI_PATH = os.path.join(BENCH_DIR, '..', 'src', 'gsheet_to_excel_async.py')
+
+from fake_sheets_server import FakeSheetsServer, make_workbooks
+
+
+def write_fake_auth(app_data_dir):
+    """写入假的客户端配置和一小时后才过期的token, 下载器不会尝试刷新或重新认证"""
+    os.makedirs(app_data_dir, exist_ok=True)
+    credentials_path = os.path.join(app_data_dir, "credentials.json")
+    token_path = os.path.join(app_data_dir, "token.json")
+    with open(credentials_path, 'w') as f:
+        json.dump({'installed': {'client_id': 'bench', 'client_secret': 'bench',
+                                 'auth_uri': 'https://accounts.google.com/o/oauth2/auth',
+                                 'token_uri': 'https://oauth2.googleapis.com/token'}}, f)
+    expiry = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+    with open(token_path, 'w') as f:
+        json.dump({'token': 'bench-token', 'refresh_token': 'bench-refresh',
+                   'client_id': 'bench', 'client_secret': 'bench',
+                   'token_uri': 'https://oauth2.googleapis.com/token',
+                   'scopes': ['https://www.googleapis.com/auth/spreadsheets.readonly'],
+                   'expiry': expiry.strftime('%Y-%m-%dT%H:%M:%SZ')}, f)
+    return credentials_path, token_path
+
+
+def run_cli(server, home, spreadsheet_ids, output_dir, extra_args):
+    credentials_path, token_path = write_fake_auth(os.path.join(home, '.gsheet_downloader'))
+    env = dict(os.environ, HOME=home, USERPROFILE=home,
+               GCP_CREDENTIALS_JSON=credentials_path, GCP_TOKEN_JSON=token_path,
+               GSHEET_API_ENDPOINT=server.endpoint)
+    server.reset_counters()
+    start = time.time()
+    subprocess.run([sys.executable, CLI_PATH, *spreadsheet_ids, '--output-dir', output_dir,
+                    '--requests-per-minute', '0', *extra_args],
+                   env=env, check=True, stdout=subprocess.DEVNULL)
+    total = time.time() - start
+    first_request = server.first_request_at - start if server.first_request_at else float('nan')
+    return first_request, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="命令行启动耗时基准测试")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--spreadsheets", type=int, default=4)
+    args, extra_args = parser.parse_known_args()
+
+    workbooks = make_workbooks(args.spreadsheets, tabs=2, rows=100, cols=5)
+    with FakeSheetsServer(workbooks) as server, tempfile.TemporaryDirectory() as home:
+        output_dir = os.path.join(home, 'out')
+        for i in range(args.runs):
+            first_request, total = run_cli(server, home, list(workbooks), output_dir, extra_args)
+            label = '冷启动' if i == 0 else '热启动'
+            print(f"{label} #{i + 1}: 首个请求 {first_request * 1000:7.1f}ms  "
+                  f"总耗时 {total * 1000:7.1f}ms  请求数 {server.counters['requests']}")
+
+
+if __name__ == "__main__":
+    main()
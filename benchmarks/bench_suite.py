@@ -0,0 +1,211 @@
+### ============================================
+# 端到端基准测试套件: 在本地模拟服务器上运行多个场景, 比较发布前后的性能
+#    python benchmarks/bench_suite.py                          # 所有场景, API和命令行两种方式
+#    python benchmarks/bench_suite.py --scenarios small_many throttled --modes api
+#    python benchmarks/bench_suite.py --json after.json --baseline before.json
+# 每次运行在单独的子进程中执行, 峰值内存(RSS)互不影响:
+#   api: 子进程直接调用 download_multi_google_sheet_async
+#   cli: 子进程运行 gsheet_to_excel_async.py 命令行(使用假token)
+# 输出吞吐量(spreadsheet/s, 行/s, MB/s)、每个spreadsheet耗时的p50/p99和子进程的峰值RSS
+### ============================================
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, '..', 'src')
+CLI_PATH = os.path.join(SRC_DIR, 'gsheet_to_excel_async.py')
+
+from fake_sheets_server import FakeSheetsServer, make_workbooks
+from bench_startup import write_fake_auth
+
+MODES = ('api', 'cli')
+
+# 名称: (工作簿形状, 服务器参数)
+SCENARIOS = {
+    # 大量小spreadsheet: 请求数和每个请求的固定开销占主导
+    'small_many': (dict(spreadsheets=16, tabs=3, rows=200, cols=8), {}),
+    # 宽且长短不一的行
+    'wide_ragged': (dict(spreadsheets=4, tabs=2, rows=2000, cols=60, ragged=True), {}),
+    # 超过 page_cells 的大工作表, 走分页获取
+    'large_paged': (dict(spreadsheets=2, tabs=1, rows=50000, cols=10, cell_size=12), {}),
+    # 每个请求额外50ms延迟, 测量并发能否掩盖网络延迟
+    'latency': (dict(spreadsheets=8, tabs=3, rows=500, cols=10), dict(latency=0.05)),
+    # 10%的请求返回429, 测量重试和退避的开销
+    'throttled': (dict(spreadsheets=8, tabs=3, rows=500, cols=10), dict(throttle_rate=0.1, retry_after=0)),
+    # 元数据缓存命中时的分页工作表: 分页之后探测缓存的rowCount之后是否还有行(超出网格时服务器返回400)
+    'cached_paged': (dict(spreadsheets=2, tabs=1, rows=50000, cols=10, cell_size=12), {}),
+}
+# 这些场景先不计时地运行一次, 写入元数据缓存, 计时的运行使用缓存的元数据
+WARM_CACHE_SCENARIOS = ('cached_paged',)
+WARM_CACHE_TTL = 300
+
+
+def percentile(values, fraction):
+    """最近秩法的百分位数"""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    index = max(int(round(fraction * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def wait_with_rusage(process):
+    """等待子进程结束, 返回 (退出码, 峰值RSS字节数); 不支持 wait4 的平台上RSS为None"""
+    if not hasattr(os, 'wait4'):
+        return process.wait(), None
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # Linux上ru_maxrss的单位是KB, macOS上是字节
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return process.returncode, rusage.ru_maxrss * scale
+
+
+def child_command(mode, spreadsheet_ids, output_dir, args, metadata_ttl=0):
+    if mode == 'cli':
+        return [sys.executable, CLI_PATH, *spreadsheet_ids, '--output-dir', output_dir,
+                '--max-concurrency', str(args.max_concurrency), '--requests-per-minute', '0',
+                '--metadata-ttl', str(metadata_ttl), '--log-level', 'WARNING']
+    config = {'ids': spreadsheet_ids, 'output_dir': output_dir, 'max_concurrency': args.max_concurrency,
+              'metadata_ttl': metadata_ttl}
+    return [sys.executable, os.path.abspath(__file__), '--child', json.dumps(config)]
+
+
+def run_child_api(config):
+    """api模式的子进程: 在进程内调用下载函数, 运行报告写入输出目录"""
+    sys.path.insert(0, SRC_DIR)
+    from google.auth.credentials import AnonymousCredentials
+    from download_options import DownloadOptions
+    from tracing import configure_logging
+    import gsheet_to_excel_async
+
+    configure_logging('WARNING')
+    options = DownloadOptions(requests_per_minute=0, metadata_ttl=config['metadata_ttl'])
+    report = asyncio.run(gsheet_to_excel_async.download_multi_google_sheet_async(
+        config['ids'], config['output_dir'], max_concurrency=config['max_concurrency'],
+        options=options, creds=AnonymousCredentials()
+    ))
+    sys.exit(0 if report.success else 1)
+
+
+def run_scenario(name, mode, args):
+    shape, server_kwargs = SCENARIOS[name]
+    workbooks = make_workbooks(**shape)
+    spreadsheet_ids = list(workbooks)
+    with FakeSheetsServer(workbooks, **server_kwargs) as server, tempfile.TemporaryDirectory() as home:
+        output_dir = os.path.join(home, 'out')
+        credentials_path, token_path = write_fake_auth(os.path.join(home, '.gsheet_downloader'))
+        # 使用临时HOME, 不读写真实的元数据缓存和同步状态
+        env = dict(os.environ, HOME=home, USERPROFILE=home,
+                   GCP_CREDENTIALS_JSON=credentials_path, GCP_TOKEN_JSON=token_path,
+                   GSHEET_API_ENDPOINT=server.endpoint)
+        metadata_ttl = 0
+        if name in WARM_CACHE_SCENARIOS:
+            metadata_ttl = WARM_CACHE_TTL
+            subprocess.run(child_command(mode, spreadsheet_ids, os.path.join(home, 'warmup'), args, metadata_ttl),
+                           env=env, stdout=subprocess.DEVNULL)
+            server.reset_counters()
+        start = time.perf_counter()
+        process = subprocess.Popen(child_command(mode, spreadsheet_ids, output_dir, args, metadata_ttl), env=env,
+                                   stdout=subprocess.DEVNULL)
+        exit_code, peak_rss = wait_with_rusage(process)
+        wall_seconds = time.perf_counter() - start
+        with open(os.path.join(output_dir, 'gsheet_run_report.json'), encoding='utf-8') as f:
+            report = json.load(f)
+        server_counters = dict(server.counters)
+
+    results = report['results']
+    latencies = [result['total_seconds'] for result in results]
+    # 吞吐量按下载本身的耗时计算, 不包括解释器启动
+    run_seconds = max(report['finished_at'] - report['started_at'], 1e-9)
+    rows = sum(result['rows'] for result in results)
+    fetched = sum(result['bytes_fetched'] for result in results)
+    return {
+        'scenario': name,
+        'mode': mode,
+        'exit_code': exit_code,
+        'failed': len(report['failed_ids']),
+        'spreadsheets': len(results),
+        'rows': rows,
+        'wall_seconds': round(wall_seconds, 3),
+        'run_seconds': round(run_seconds, 3),
+        'spreadsheets_per_second': round(len(results) / run_seconds, 2),
+        'rows_per_second': round(rows / run_seconds),
+        'mb_per_second': round(fetched / run_seconds / 1e6, 2),
+        'p50_seconds': round(percentile(latencies, 0.50), 3),
+        'p99_seconds': round(percentile(latencies, 0.99), 3),
+        'peak_rss_mb': round(peak_rss / 1e6, 1) if peak_rss is not None else None,
+        'requests': server_counters['requests'],
+        'throttled': server_counters['throttled'],
+    }
+
+
+def print_table(results):
+    print(f"{'场景':<12} {'方式':<4} {'失败':>4} {'耗时s':>7} {'表/s':>7} {'行/s':>9} {'MB/s':>7} "
+          f"{'p50 s':>7} {'p99 s':>7} {'RSS MB':>7} {'请求':>6} {'429':>4}")
+    for r in results:
+        rss = f"{r['peak_rss_mb']:7.1f}" if r['peak_rss_mb'] is not None else f"{'n/a':>7}"
+        print(f"{r['scenario']:<12} {r['mode']:<4} {r['failed']:>4} {r['run_seconds']:>7.2f} "
+              f"{r['spreadsheets_per_second']:>7.2f} {r['rows_per_second']:>9} {r['mb_per_second']:>7.2f} "
+              f"{r['p50_seconds']:>7.3f} {r['p99_seconds']:>7.3f} {rss} {r['requests']:>6} {r['throttled']:>4}")
+
+
+def compare_with_baseline(results, baseline_path, tolerance):
+    """与之前保存的结果比较, 返回退化的项目列表"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['scenario'], r['mode']): r for r in json.load(f)}
+    regressions = []
+    for r in results:
+        before = baseline.get((r['scenario'], r['mode']))
+        if before is None:
+            continue
+        label = f"{r['scenario']}/{r['mode']}"
+        if r['rows_per_second'] < before['rows_per_second'] * (1 - tolerance):
+            regressions.append(f"{label}: 行/s {before['rows_per_second']} -> {r['rows_per_second']}")
+        if r['p99_seconds'] > before['p99_seconds'] * (1 + tolerance):
+            regressions.append(f"{label}: p99 {before['p99_seconds']}s -> {r['p99_seconds']}s")
+        if r['peak_rss_mb'] and before.get('peak_rss_mb') and r['peak_rss_mb'] > before['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{label}: RSS {before['peak_rss_mb']}MB -> {r['peak_rss_mb']}MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端下载基准测试套件")
+    parser.add_argument("--scenarios", nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--modes", nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument("--max-concurrency", type=int, default=4)
+    parser.add_argument("--json", dest="json_path", help="把结果保存为JSON, 作为以后比较的基线")
+    parser.add_argument("--baseline", help="与之前保存的JSON结果比较, 有退化时以状态码1退出")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="允许的退化比例 (默认: 0.2, 即吞吐量下降或p99/RSS增加超过20%%视为退化)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child_api(json.loads(args.child))
+        return
+
+    results = []
+    for name in args.scenarios:
+        for mode in args.modes:
+            results.append(run_scenario(name, mode, args))
+    print_table(results)
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"退化: {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
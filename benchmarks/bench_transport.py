@@ -0,0 +1,64 @@
+### ============================================
+# 比较 httplib2 (每个线程独立连接) 和 pooled (共享keep-alive连接池 + gzip) 两种传输层的吞吐量
+#    python benchmarks/bench_transport.py --spreadsheets 16 --rows 2000 --latency 0.02
+# 模拟服务器在客户端请求gzip时压缩响应, 并统计建立的TCP连接数和发送的字节数
+### ============================================
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from google.auth.credentials import AnonymousCredentials
+from fake_sheets_server import FakeSheetsServer, make_workbooks
+from download_options import DownloadOptions
+from http_transport import TRANSPORTS
+import gsheet_to_excel_async
+
+
+def run(server, workbooks, transport, args):
+    server.reset_counters()
+    options = DownloadOptions(transport=transport, requests_per_minute=0, metadata_ttl=0,
+                              streaming=True, page_cells=args.page_cells)
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        asyncio.run(gsheet_to_excel_async.download_multi_google_sheet_async(
+            list(workbooks), output_dir, max_concurrency=args.max_concurrency,
+            options=options, creds=AnonymousCredentials()
+        ))
+        elapsed = time.perf_counter() - start
+    counters = dict(server.counters)
+    return elapsed, counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP传输层吞吐量基准测试")
+    parser.add_argument("--spreadsheets", type=int, default=16)
+    parser.add_argument("--tabs", type=int, default=2)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--cols", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--page-cells", type=int, default=5000)
+    args = parser.parse_args()
+
+    workbooks = make_workbooks(args.spreadsheets, args.tabs, args.rows, args.cols)
+    results = {}
+    with FakeSheetsServer(workbooks, latency=args.latency) as server:
+        os.environ[gsheet_to_excel_async.API_ENDPOINT_ENV_VAR] = server.endpoint
+        for transport in TRANSPORTS:
+            results[transport] = run(server, workbooks, transport, args)
+
+    cells = args.spreadsheets * args.tabs * args.rows * args.cols
+    for transport, (elapsed, counters) in results.items():
+        print(f"{transport:>9}: 耗时 {elapsed:6.2f}s  {cells / elapsed:10.0f} 单元格/秒  "
+              f"请求 {counters['requests']}  连接 {counters['connections']}  "
+              f"传输 {counters['bytes_sent'] / 1024 / 1024:.2f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+### ============================================
+# typed取值方式的类型转换开销: 逐单元格判断 vs 按列批量转换, 以及两种取值方式的响应大小
+#    python benchmarks/bench_value_types.py --rows 100000 --cols 10     # 100万个单元格
+### ============================================
+
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from fake_sheets_server import FakeTab
+from value_types import typed_rows, _CONVERTERS
+
+
+def per_cell(rows, column_types):
+    """对照组: 每个单元格都查找所在列的格式并判断类型"""
+    for row in rows:
+        for index, value in enumerate(row):
+            number_format = column_types[index] if index < len(column_types) else None
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and number_format in _CONVERTERS:
+                row[index] = _CONVERTERS[number_format](value)
+        yield row
+
+
+def timed(convert, rows, column_types):
+    rows = copy.deepcopy(rows)
+    start = time.perf_counter()
+    for _ in convert(rows, column_types):
+        pass
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="typed取值方式的类型转换基准测试")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--cols", type=int, default=10)
+    args = parser.parse_args()
+
+    tab = FakeTab("Typed", args.rows, args.cols, typed=True)
+    column_types = [tab.column_format(c) for c in range(args.cols)]
+    formatted = tab.values()
+    unformatted = tab.values(unformatted=True)
+    cells = args.rows * args.cols
+
+    formatted_size = len(json.dumps({'values': formatted}).encode('utf-8'))
+    unformatted_size = len(json.dumps({'values': unformatted}).encode('utf-8'))
+    print(f"单元格数: {cells}  列格式: {column_types}")
+    print(f"响应大小: FORMATTED_VALUE {formatted_size / 1024 / 1024:.2f}MB  "
+          f"UNFORMATTED_VALUE {unformatted_size / 1024 / 1024:.2f}MB")
+
+    for name, convert in (("逐单元格", per_cell), ("按列批量", typed_rows)):
+        elapsed = timed(convert, unformatted, column_types)
+        print(f"{name}: {elapsed:6.3f}s  {cells / elapsed:12.0f} 单元格/秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+### ============================================
+# 比较在下载线程中写入和使用写入进程池时的吞吐量
+#    python benchmarks/bench_writer_processes.py --spreadsheets 16 --rows 20000 --processes 0 2 4 8 16
+# 写入进程数超过CPU核数时不会再有提升; 单核机器上只能看到进程间传输的开销
+### ============================================
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from google.auth.credentials import AnonymousCredentials
+from fake_sheets_server import FakeSheetsServer, make_workbooks
+from download_options import DownloadOptions
+import gsheet_to_excel_async
+
+
+def run(workbooks, writer_processes, args):
+    options = DownloadOptions(output_format=args.format, requests_per_minute=0, metadata_ttl=0,
+                              transport='pooled', writer_processes=writer_processes)
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        asyncio.run(gsheet_to_excel_async.download_multi_google_sheet_async(
+            list(workbooks), output_dir, max_concurrency=args.max_concurrency,
+            options=options, creds=AnonymousCredentials()
+        ))
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="写入进程池吞吐量基准测试")
+    parser.add_argument("--spreadsheets", type=int, default=8)
+    parser.add_argument("--tabs", type=int, default=2)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--cols", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--format", default='xlsx')
+    parser.add_argument("--processes", type=int, nargs='+', default=[0, 2, 4])
+    args = parser.parse_args()
+
+    workbooks = make_workbooks(args.spreadsheets, args.tabs, args.rows, args.cols)
+    results = {}
+    with FakeSheetsServer(workbooks, latency=args.latency) as server:
+        os.environ[gsheet_to_excel_async.API_ENDPOINT_ENV_VAR] = server.endpoint
+        for writer_processes in args.processes:
+            results[writer_processes] = run(workbooks, writer_processes, args)
+
+    cells = args.spreadsheets * args.tabs * args.rows * args.cols
+    print(f"CPU核数: {os.cpu_count()}")
+    for writer_processes, elapsed in results.items():
+        print(f"写入进程 {writer_processes:>3}: 耗时 {elapsed:6.2f}s  {cells / elapsed:10.0f} 单元格/秒")
+
+
+if __name__ == "__main__":
+    main()
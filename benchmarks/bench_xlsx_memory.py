@@ -0,0 +1,65 @@
+### ============================================
+# 比较普通Workbook和write-only流式写入的内存峰值
+#    python benchmarks/bench_xlsx_memory.py --rows 200000 --cols 10 --tabs 3
+# 每种模式在独立的子进程中运行, 以进程的最大RSS作为内存峰值
+### ============================================
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from sheets_writers import XlsxWorkbookWriter, StreamingXlsxWriter
+
+WRITERS = {
+    'workbook': XlsxWorkbookWriter,
+    'streaming': StreamingXlsxWriter,
+}
+
+
+def make_tab(rows, cols):
+    # 与API返回格式相同: 每个单元格都是字符串
+    return [[f"r{r}c{c}" for c in range(cols)] for r in range(rows)]
+
+
+def run_single(mode, rows, cols, tabs):
+    writer_cls = WRITERS[mode]
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        writer = writer_cls(os.path.join(tmp, 'bench.xlsx'))
+        for i in range(tabs):
+            values = make_tab(rows, cols)
+            writer.write_tab(f"tab{i}", values)
+            del values
+        writer.close()
+        elapsed = time.perf_counter() - start
+    max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{mode:>10}: 耗时 {elapsed:7.2f}s  最大RSS {max_rss_kb / 1024:8.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Excel写入内存基准测试")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--cols", type=int, default=10)
+    parser.add_argument("--tabs", type=int, default=3)
+    parser.add_argument("--mode", choices=WRITERS, help="只运行一种模式(内部使用)")
+    args = parser.parse_args()
+
+    if args.mode:
+        run_single(args.mode, args.rows, args.cols, args.tabs)
+        return
+
+    print(f"{args.tabs}个工作表, 每个 {args.rows}行 x {args.cols}列")
+    for mode in WRITERS:
+        subprocess.run([sys.executable, __file__, '--mode', mode,
+                        '--rows', str(args.rows), '--cols', str(args.cols), '--tabs', str(args.tabs)],
+                       check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+### ============================================
+# 本地模拟的 Sheets v4 API 服务器, 用于基准测试和重试/限流验证
+# 支持 spreadsheets.get / values.get / values.batchGet, 以及 valueRenderOption=UNFORMATTED_VALUE
+# 和 POST /batch 的multipart批量请求(每个部分是一个GET请求)
+#    python benchmarks/fake_sheets_server.py --port 8089 --spreadsheets 10 --tabs 5 --rows 1000 --cols 10
+# 然后设置环境变量 GSHEET_API_ENDPOINT=http://127.0.0.1:8089/ 即可让下载器连接该服务器
+### ============================================
+
+import argparse
+import gzip
+import json
+import random
+import re
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+
+_PATH_RE = re.compile(r"^/v4/spreadsheets/([^/:]+)(?:/values/([^/]+)|/values:batchGet)?$")
+_WINDOW_RE = re.compile(r"!([A-Z]*)(\d+):([A-Z]*)(\d*)$")
+
+
+def _parse_range(a1_range):
+    """返回 (工作表名, 起始行, 结束行), 行号从1开始; 整表范围的行号为None, 没有结束行(B2:F)时结束行为None"""
+    window = _WINDOW_RE.search(a1_range)
+    sheet_part = a1_range[:window.start()] if window else a1_range
+    if sheet_part.startswith("'") and sheet_part.endswith("'"):
+        sheet_part = sheet_part[1:-1].replace("''", "'")
+    if not window:
+        return sheet_part, None, None
+    return sheet_part, int(window.group(2)), int(window.group(4)) if window.group(4) else None
+
+
+class ExceedsGridLimits(Exception):
+    """与API一致: 起始行超出工作表网格的范围返回400"""
+
+
+def _column_index(letters):
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def _column_slice(a1_range):
+    """范围指定了列时(如 !B2:D9) 返回对应的列切片, 否则返回None"""
+    window = _WINDOW_RE.search(a1_range)
+    if not window or not window.group(1):
+        return None
+    return slice(_column_index(window.group(1)), _column_index(window.group(3)) + 1)
+
+
+# typed工作表各列依次使用的数字格式
+TYPED_COLUMN_FORMATS = ('TEXT', 'NUMBER', 'NUMBER', 'DATE', 'DATE_TIME', 'TIME')
+
+
+def _typed_cell(number_format, index, column):
+    """返回 (显示文本, 未格式化的值)"""
+    if number_format == 'NUMBER':
+        value = index * 10 + column if column % 2 else index * 1.25
+        return f"{value:,}", value
+    if number_format == 'DATE':
+        serial = 45000 + index % 3000
+        return f"serial {serial}", serial
+    if number_format == 'DATE_TIME':
+        serial = 45000 + index % 3000 + (index % 24) / 24
+        return f"serial {serial}", serial
+    if number_format == 'TIME':
+        serial = (index % 96) / 96
+        return f"serial {serial}", serial
+    text = f"r{index}c{column}"
+    return text, text
+
+
+class FakeTab:
+    """按需生成单元格数据的工作表, 不在内存中保存整张表
+
+    typed: 第1行为表头, 其余各列按 TYPED_COLUMN_FORMATS 生成数字/日期
+    """
+
+    def __init__(self, title, rows, cols, cell_size=8, ragged=False, hidden=False, seed=0, typed=False):
+        self.title = title
+        self.rows = rows
+        self.cols = cols
+        self.cell_size = cell_size
+        self.ragged = ragged
+        self.hidden = hidden
+        self.seed = seed
+        self.typed = typed
+
+    def column_format(self, column):
+        return TYPED_COLUMN_FORMATS[column % len(TYPED_COLUMN_FORMATS)] if self.typed else 'TEXT'
+
+    def row(self, index, unformatted=False):
+        cols = self.cols
+        if self.ragged:
+            # 模拟API省略行尾空单元格的情况
+            cols = 1 + (index * 7919 + self.seed) % self.cols
+        if self.typed:
+            if index == 1:
+                return [f"{self.column_format(c)}_{c}" for c in range(cols)]
+            return [_typed_cell(self.column_format(c), index, c)[1 if unformatted else 0] for c in range(cols)]
+        return [f"{index}:{c}".ljust(self.cell_size, 'x')[:max(self.cell_size, 1)] for c in range(cols)]
+
+    def values(self, start=None, end=None, unformatted=False):
+        start = 1 if start is None else start
+        end = self.rows if end is None else min(end, self.rows)
+        return [self.row(i, unformatted) for i in range(start, end + 1)]
+
+    def format_row(self, index):
+        """spreadsheets.get 的rowData: 每个单元格的 effectiveFormat.numberFormat.type"""
+        if index > self.rows:
+            return {}
+        return {'values': [{'effectiveFormat': {'numberFormat': {'type': self.column_format(c)}}}
+                           for c in range(self.cols)]}
+
+
+class FakeSpreadsheet:
+    def __init__(self, spreadsheet_id, title, tabs):
+        self.spreadsheet_id = spreadsheet_id
+        self.title = title
+        self.tabs = {tab.title: tab for tab in tabs}
+
+    def metadata(self):
+        return {
+            'spreadsheetId': self.spreadsheet_id,
+            'properties': {'title': self.title},
+            'sheets': [
+                {'properties': {
+                    'title': tab.title,
+                    'hidden': tab.hidden,
+                    'gridProperties': {'rowCount': tab.rows, 'columnCount': tab.cols},
+                }}
+                for tab in self.tabs.values()
+            ],
+        }
+
+    def format_data(self, ranges):
+        """spreadsheets.get?ranges=... : 每个工作表只返回请求的第一行的格式"""
+        sheets = []
+        for a1_range in ranges:
+            sheet_name, start, _ = _parse_range(a1_range)
+            tab = self.tabs[sheet_name]
+            row_data = tab.format_row(start or 1)
+            columns = _column_slice(a1_range)
+            if columns is not None and row_data:
+                row_data = {'values': row_data['values'][columns]}
+            sheets.append({'properties': {'title': tab.title}, 'data': [{'rowData': [row_data]}]})
+        return {'sheets': sheets}
+
+    def value_range(self, a1_range, unformatted=False):
+        sheet_name, start, end = _parse_range(a1_range)
+        tab = self.tabs[sheet_name]
+        if start is not None and start > tab.rows:
+            raise ExceedsGridLimits(f"Range ({a1_range}) exceeds grid limits. Max rows: {tab.rows}, "
+                                    f"max columns: {tab.cols}")
+        body = {'range': a1_range, 'majorDimension': 'ROWS'}
+        values = tab.values(start, end, unformatted)
+        columns = _column_slice(a1_range)
+        if columns is not None:
+            # 与API一致: 去掉范围外的列, 以及之后全部为空的行尾
+            values = [row[columns] for row in values]
+            while values and not values[-1]:
+                values.pop()
+        if values:
+            body['values'] = values
+        return body
+
+
+def make_workbooks(spreadsheets=4, tabs=3, rows=1000, cols=10, cell_size=8, ragged=False, typed=False):
+    books = {}
+    for i in range(spreadsheets):
+        spreadsheet_id = f"fake{i:04d}"
+        books[spreadsheet_id] = FakeSpreadsheet(spreadsheet_id, f"Fake Sheet {i}", [
+            FakeTab(f"Tab {j}", rows, cols, cell_size, ragged, seed=i * 31 + j, typed=typed)
+            for j in range(tabs)
+        ])
+    return books
+
+
+class FakeSheetsServer:
+    """在后台线程中运行的模拟服务器
+
+    latency: 每个请求的额外延迟(秒)
+    throttle_rate: 以该概率返回429
+    retry_after: 429响应中的 Retry-After 秒数, None表示不返回该响应头
+    """
+
+    def __init__(self, workbooks, host='127.0.0.1', port=0, latency=0.0, throttle_rate=0.0,
+                 retry_after=1, seed=0):
+        self.workbooks = workbooks
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counters = {'requests': 0, 'throttled': 0, 'bytes_sent': 0, 'connections': 0}
+        # 第一个请求到达的时间(time.time()), 用于测量客户端启动耗时
+        self.first_request_at = None
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def reset_counters(self):
+        with self._lock:
+            for name in self.counters:
+                self.counters[name] = 0
+            self.first_request_at = None
+
+    def _mark_request(self):
+        with self._lock:
+            self.counters['requests'] += 1
+            if self.first_request_at is None:
+                self.first_request_at = time.time()
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def _should_throttle(self):
+        with self._lock:
+            return self._random.random() < self.throttle_rate
+
+    def _respond(self, path):
+        """处理一个GET请求, 返回 (状态码, JSON响应, 额外的响应头)"""
+        if self.throttle_rate and self._should_throttle():
+            self._count('throttled')
+            headers = {}
+            if self.retry_after is not None:
+                headers['Retry-After'] = str(self.retry_after)
+            return 429, {'error': {'code': 429, 'status': 'RESOURCE_EXHAUSTED', 'message': 'Quota exceeded'}}, headers
+
+        url = urlparse(path)
+        match = _PATH_RE.match(url.path)
+        book = self.workbooks.get(match.group(1)) if match else None
+        if book is None:
+            return 404, {'error': {'code': 404, 'status': 'NOT_FOUND',
+                                   'message': 'Requested entity was not found.'}}, {}
+        query = parse_qs(url.query)
+        unformatted = query.get('valueRenderOption', [''])[0] == 'UNFORMATTED_VALUE'
+        try:
+            if url.path.endswith('/values:batchGet'):
+                body = {'spreadsheetId': book.spreadsheet_id,
+                        'valueRanges': [book.value_range(r, unformatted) for r in query.get('ranges', [])]}
+            elif match.group(2):
+                body = book.value_range(unquote(match.group(2)), unformatted)
+            elif 'ranges' in query:
+                body = book.format_data(query['ranges'])
+            else:
+                body = book.metadata()
+        except KeyError as e:
+            return 400, {'error': {'code': 400, 'status': 'INVALID_ARGUMENT',
+                                   'message': f'Unable to parse range: {e}'}}, {}
+        except ExceedsGridLimits as e:
+            return 400, {'error': {'code': 400, 'status': 'INVALID_ARGUMENT', 'message': str(e)}}, {}
+        return 200, body, {}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                server._count('connections')
+
+            def _send_json(self, status, body, headers=None):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=UTF-8')
+                if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    data = gzip.compress(data, compresslevel=6)
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+                server._count('bytes_sent', len(data))
+
+            def do_GET(self):
+                server._mark_request()
+                if server.latency:
+                    time.sleep(server.latency)
+                self._send_json(*server._respond(self.path))
+
+            def do_POST(self):
+                """multipart/mixed 批量请求: 整体只计一次请求和一次延迟, 每个部分单独判断是否限流"""
+                server._mark_request()
+                if server.latency:
+                    time.sleep(server.latency)
+                if urlparse(self.path).path.rstrip('/') != '/batch':
+                    self._send_json(404, {'error': {'code': 404, 'status': 'NOT_FOUND', 'message': 'Not found.'}})
+                    return
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                message = BytesParser(policy=HTTP).parsebytes(
+                    f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode('utf-8') + body)
+                boundary = f"batch_{random.getrandbits(64):016x}"
+                parts = []
+                for part in message.iter_parts():
+                    request_line = part.get_payload(decode=True).decode('utf-8').split('\r\n', 1)[0]
+                    status, response, headers = server._respond(request_line.split(' ')[1])
+                    content_id = part['Content-ID'].strip().replace('<', '<response-', 1)
+                    lines = [f"--{boundary}", "Content-Type: application/http", f"Content-ID: {content_id}", "",
+                             f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}",
+                             "Content-Type: application/json; charset=UTF-8",
+                             *(f"{name}: {value}" for name, value in headers.items()), "", json.dumps(response)]
+                    parts.append("\r\n".join(lines))
+                data = ("\r\n".join(parts) + f"\r\n--{boundary}--\r\n").encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', f'multipart/mixed; boundary={boundary}')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                server._count('bytes_sent', len(data))
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的Sheets v4 API服务器")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--spreadsheets", type=int, default=4)
+    parser.add_argument("--tabs", type=int, default=3)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--cols", type=int, default=10)
+    parser.add_argument("--cell-size", type=int, default=8)
+    parser.add_argument("--ragged", action="store_true", help="生成长度不一的行")
+    parser.add_argument("--typed", action="store_true", help="生成数字和日期列")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的额外延迟(秒)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="返回429的概率")
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+
+    workbooks = make_workbooks(args.spreadsheets, args.tabs, args.rows, args.cols,
+                               args.cell_size, args.ragged, args.typed)
+    server = FakeSheetsServer(workbooks, port=args.port, latency=args.latency,
+                              throttle_rate=args.throttle_rate, retry_after=args.retry_after)
+    print(f"模拟服务器已启动: {server.endpoint}")
+    print(f"spreadsheet ID: {' '.join(workbooks)}")
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
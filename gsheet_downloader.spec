@@ -10,6 +10,7 @@ a = Analysis(
     hiddenimports=[
         'google.auth.transport.requests',
         'google.oauth2.credentials',
+        'google_auth_httplib2',
         'google_auth_oauthlib.flow',
         'googleapiclient.discovery',
         'openpyxl'
@@ -17,7 +18,8 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=['runtime_hook.py'],
-    excludes=[],
+    # DataFrame引擎在函数内导入pandas, GUI不使用, 避免把pandas打包进来
+    excludes=['pandas'],
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
@@ -37,7 +39,8 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    # UPX压缩的DLL每次启动都要解压, 关闭以缩短启动时间
+    upx=False,
     upx_exclude=[],
     runtime_tmpdir=None,
     console=False,
@@ -2,18 +2,8 @@
 import sys
 import os
 
-def _pyi_rth_encodings():
-    import encodings
-    import encodings.aliases
-    import encodings.utf_8
-    import encodings.ascii
-    import encodings.latin_1
-    import encodings.cp1252
-    import encodings.utf_16
-    import encodings.utf_32
-
-# 初始化编码
-_pyi_rth_encodings()
+# 编码模块由Python在启动时和第一次使用时自动加载(PyInstaller已打包整个encodings包),
+# 这里不再预先导入, 减少启动时间
 
 # 确保Python能找到基础库
 if hasattr(sys, '_MEIPASS'):
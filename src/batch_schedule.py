@@ -0,0 +1,65 @@
+import heapq
+
+# input: 按输入顺序提交; largest-first: 先获取所有元数据, 按预计工作量从大到小提交(LPT)
+SCHEDULE_INPUT = 'input'
+SCHEDULE_LARGEST_FIRST = 'largest-first'
+SCHEDULES = (SCHEDULE_INPUT, SCHEDULE_LARGEST_FIRST)
+
+# 每个spreadsheet的固定开销(元数据和至少一次取值请求), 折算为单元格数
+SPREADSHEET_OVERHEAD_CELLS = 20_000
+
+
+def estimate_spreadsheet_cells(metadata, selection=None):
+    """按 gridProperties 估算可见工作表(经过 selection 筛选)的单元格总数(网格可能大于实际数据, 是上限)"""
+    visible = [sheet.get('properties', {}) for sheet in metadata.get('sheets', [])
+               if not sheet.get('properties', {}).get('hidden', False)]
+    if selection is not None:
+        visible = selection.apply(visible, quiet=True)
+    cells = 0
+    for props in visible:
+        grid = props.get('gridProperties', {})
+        cells += grid.get('rowCount', 0) * grid.get('columnCount', 0)
+    return cells
+
+
+def estimated_cost(cells):
+    return cells + SPREADSHEET_OVERHEAD_CELLS
+
+
+def largest_first(spreadsheet_ids, costs):
+    """按预计工作量从大到小排序, 工作量相同时保持输入顺序"""
+    return sorted(spreadsheet_ids, key=lambda spreadsheet_id: -costs.get(spreadsheet_id, 0))
+
+
+def simulate_makespan(ordered_costs, workers):
+    """按顺序把任务交给最先空闲的工作线程(与线程池的先进先出队列一致), 返回最后完成的时间"""
+    if not ordered_costs:
+        return 0
+    finish_times = [0] * max(min(workers, len(ordered_costs)), 1)
+    for cost in ordered_costs:
+        heapq.heapreplace(finish_times, finish_times[0] + cost)
+    return max(finish_times)
+
+
+def makespan_summary(input_order, scheduled_order, costs, durations, workers, actual_seconds):
+    """比较预计与实际的makespan
+
+    预计值先按成本模拟, 再用本次运行的平均速度(成本合计 / 各spreadsheet耗时合计)换算为秒;
+    input_order_estimated_makespan_seconds 是同一模型下按输入顺序提交的预计值, 用于对比调度的效果。
+    """
+    measured = [spreadsheet_id for spreadsheet_id in durations if spreadsheet_id in costs]
+    total_seconds = sum(durations[spreadsheet_id] for spreadsheet_id in measured)
+    rate = sum(costs[spreadsheet_id] for spreadsheet_id in measured) / total_seconds if total_seconds > 0 else None
+
+    def estimate(order):
+        if rate is None:
+            return None
+        return round(simulate_makespan([costs[spreadsheet_id] for spreadsheet_id in order], workers) / rate, 3)
+
+    return {
+        'order': list(scheduled_order),
+        'workers': workers,
+        'estimated_makespan_seconds': estimate(scheduled_order),
+        'input_order_estimated_makespan_seconds': estimate(input_order),
+        'actual_makespan_seconds': round(actual_seconds, 3),
+    }
@@ -1,17 +1,48 @@
+import contextlib
 import json
 import os
+from sheets_writers import write_json_atomically
+from tab_selection import FILTER_KEYS, TabSelection
+from tracing import logger
+
+
+def parse_sheet_list(lines):
+    """解析每行一个的Sheet URL或ID, 忽略空行和以#开头的注释行; 按出现顺序去重, 返回 [(sheet_id, url)]"""
+    sheets = []
+    seen = set()
+    for line in lines:
+        url = line.strip()
+        if not url or url.startswith('#'):
+            continue
+        sheet_id = ConfigManager.extract_sheet_id(url)
+        if not sheet_id or sheet_id in seen:
+            continue
+        seen.add(sheet_id)
+        sheets.append((sheet_id, url))
+    return sheets
+
 
 class ConfigManager:
+    """配置文件和Sheet列表; recent_sheets 按顺序保存在配置中, 同时按ID建立索引用于去重和查找"""
+
     def __init__(self, config_file='config.json'):
         self.config_file = config_file
+        self._batch_depth = 0
+        self._dirty = False
+        self.reload()
+
+    def reload(self):
+        """重新读取配置文件(例如被其他程序修改后)"""
         self.config = self.load_config()
+        self._index = {sheet['id']: sheet for sheet in self.config['recent_sheets'] if sheet.get('id')}
 
     def load_config(self):
         default_config = {
             'recent_sheets': [],
-            'output_dir': os.path.join(os.path.expanduser("~"), "Downloads")  # 设置默认下载目录
+            'output_dir': os.path.join(os.path.expanduser("~"), "Downloads"),  # 设置默认下载目录
+            'output_format': 'xlsx'
         }
-        
+
         if os.path.exists(self.config_file):
             try:
                 with open(self.config_file, 'r', encoding='utf-8') as f:
@@ -23,41 +54,120 @@ class ConfigManager:
                 return default_config
         return default_config
 
+    @contextlib.contextmanager
+    def batch(self):
+        """批量修改: 期间的 save_config() 只做标记, 退出时统一写入一次"""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and self._dirty:
+                self.save_config()
+
     def save_config(self):
+        if self._batch_depth:
+            self._dirty = True
+            return
+        self._dirty = False
         # 确保目录存在
         config_dir = os.path.dirname(os.path.abspath(self.config_file))
         os.makedirs(config_dir, exist_ok=True)
-        
+
         # 确保配置完整
         if 'recent_sheets' not in self.config:
             self.config['recent_sheets'] = []
         if 'output_dir' not in self.config:
             self.config['output_dir'] = ''
-        
-        with open(self.config_file, 'w', encoding='utf-8') as f:
-            json.dump(self.config, f, ensure_ascii=False, indent=2)
+
+        # 先写临时文件再替换, 程序中途退出或GUI与同步服务同时保存时不会留下写了一半的配置
+        write_json_atomically(self.config_file, self.config, indent=2)
+
+    def get_sheet(self, sheet_id):
+        return self._index.get(sheet_id)
+
+    def sheet_ids(self):
+        return [sheet['id'] for sheet in self.config['recent_sheets'] if sheet.get('id')]
 
     def add_sheet(self, sheet_url, sheet_name=''):
-        print(f"[ConfigManager] 添加sheet, URL: {sheet_url}")
-        sheet_id = self.extract_sheet_id(sheet_url)
-        print(f"[ConfigManager] 提取的sheet_id: {sheet_id}")
-        
-        if sheet_id:
-            recent_sheets = self.config['recent_sheets']
-            # 检查是否已存在
-            for sheet in recent_sheets:
-                if sheet['id'] == sheet_id:
-                    print(f"[ConfigManager] Sheet已存在: {sheet_id}")
-                    return
-            # 添加新的sheet
+        """添加一个sheet, 返回新添加的条目; 无法识别或已存在时返回None"""
+        logger.debug("[ConfigManager] 添加sheet, URL: %s", sheet_url)
+        added = self.add_sheets([sheet_url], sheet_name)
+        return added[0] if added else None
+
+    def add_sheets(self, sheet_urls, sheet_name=''):
+        """批量添加, 每行一个URL或ID, 重复和已存在的跳过; 只写入一次配置文件, 返回新添加的条目列表"""
+        added = []
+        for sheet_id, url in parse_sheet_list(sheet_urls):
+            if sheet_id in self._index:
+                logger.debug("[ConfigManager] Sheet已存在: %s", sheet_id)
+                continue
             new_sheet = {
                 'id': sheet_id,
-                'url': sheet_url,
+                'url': url,
                 'name': sheet_name
             }
-            print(f"[ConfigManager] 添加新sheet: {new_sheet}")
-            recent_sheets.append(new_sheet)
+            self.config['recent_sheets'].append(new_sheet)
+            self._index[sheet_id] = new_sheet
+            added.append(new_sheet)
+        if added:
+            logger.debug("[ConfigManager] 添加 %s 个sheet", len(added))
             self.save_config()
+        return added
+
+    def update_sheet(self, sheet_id, new_url):
+        """修改sheet的URL, 返回修改后的条目; 新URL无法识别或与其他sheet重复时抛出ValueError"""
+        sheet = self._index.get(sheet_id)
+        if sheet is None:
+            raise ValueError(f"Sheet不存在: {sheet_id}")
+        new_id = self.extract_sheet_id(new_url)
+        if not new_id:
+            raise ValueError(f"无法识别的Sheet URL: {new_url}")
+        if new_id != sheet_id and new_id in self._index:
+            raise ValueError(f"Sheet已存在: {new_id}")
+        del self._index[sheet_id]
+        sheet['url'] = new_url
+        sheet['id'] = new_id
+        self._index[new_id] = sheet
+        self.save_config()
+        return sheet
+
+    def remove_sheets(self, sheet_ids):
+        """删除多个sheet, 返回删除的数量"""
+        removed = {sheet_id for sheet_id in sheet_ids if sheet_id in self._index}
+        if not removed:
+            return 0
+        for sheet_id in removed:
+            del self._index[sheet_id]
+        self.config['recent_sheets'] = [sheet for sheet in self.config['recent_sheets']
+                                        if sheet.get('id') not in removed]
+        self.save_config()
+        return len(removed)
+
+    def tab_filters(self, sheet_ids=None):
+        """设置了工作表筛选的条目 {ID: {'include_tabs', 'exclude_tabs', 'tab_ranges'}}, 用于 DownloadOptions.sheet_tab_filters"""
+        filters = {}
+        for sheet_id in (self.sheet_ids() if sheet_ids is None else sheet_ids):
+            sheet = self._index.get(sheet_id)
+            if sheet is not None and any(sheet.get(key) for key in FILTER_KEYS):
+                filters[sheet_id] = {key: sheet.get(key) or ([] if key != 'tab_ranges' else {}) for key in FILTER_KEYS}
+        return filters
+
+    def set_tab_filters(self, sheet_id, include_tabs=(), exclude_tabs=(), tab_ranges=None):
+        """设置sheet的工作表筛选, 全部为空时清除; 模式或A1范围无效时抛出ValueError"""
+        sheet = self._index.get(sheet_id)
+        if sheet is None:
+            raise ValueError(f"Sheet不存在: {sheet_id}")
+        values = {'include_tabs': list(include_tabs), 'exclude_tabs': list(exclude_tabs),
+                  'tab_ranges': dict(tab_ranges or {})}
+        TabSelection.from_filters(values)
+        for key in FILTER_KEYS:
+            if values[key]:
+                sheet[key] = values[key]
+            else:
+                sheet.pop(key, None)
+        self.save_config()
+        return sheet
 
     @staticmethod
     def extract_sheet_id(input_str: str) -> str | None:
@@ -71,4 +181,4 @@ class ConfigManager:
                 parts = input_str.split('/spreadsheets/')
                 return parts[1].split('/')[0].split('?')[0]
             case _:
-                return None 
\ No newline at end of file
+                return None
@@ -0,0 +1,70 @@
+import itertools
+from download_options import DownloadOptions
+from sheets_fetch import fetch_spreadsheet_metadata, fetch_tab_values, VALUE_RENDER_TYPED
+from value_types import fetch_column_types, typed_rows
+from tracing import logger, tracer
+
+
+def require_pandas():
+    """DataFrame引擎依赖可选的 pandas 和 numpy, 返回 (pandas, numpy)"""
+    try:
+        import numpy
+        import pandas
+    except ImportError:
+        raise ValueError("DataFrame引擎需要安装 pandas: pip install pandas")
+    return pandas, numpy
+
+
+def values_to_frame(values):
+    """把API返回的行转换为DataFrame, 第一个非空行作为表头; 整个工作表为空时返回None
+
+    长短不一的行一次性填入二维数组(缺少的单元格为None), 空行用向量掩码删除,
+    超出表头宽度的单元格被截断。
+    """
+    pd, np = require_pandas()
+    values = values if isinstance(values, list) else list(values)
+    if not values:
+        return None
+    lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+    width = int(lengths.max())
+    if width == 0:
+        return None
+    grid = np.full((len(values), width), None, dtype=object)
+    cells = np.fromiter(itertools.chain.from_iterable(values), dtype=object, count=int(lengths.sum()))
+    # 按行优先顺序, 掩码为True的位置正好对应各行已有的单元格
+    grid[np.arange(width) < lengths[:, None]] = cells
+    # 只有None和空字符串算空单元格, 数值0不算
+    keep = ((grid != None) & (grid != '')).any(axis=1)  # noqa: E711
+    grid = grid[keep]
+    lengths = lengths[keep]
+    if not len(grid):
+        return None
+    header_width = int(lengths[0])
+    return pd.DataFrame(grid[1:, :header_width], columns=list(grid[0, :header_width])).infer_objects()
+
+
+def fetch_frames(service, spreadsheet_id, options=None, submit=None):
+    """获取spreadsheet中所有可见工作表, 返回 (标题, {工作表名: DataFrame})"""
+    require_pandas()
+    if options is None:
+        options = DownloadOptions()
+    spreadsheet, _ = fetch_spreadsheet_metadata(service, spreadsheet_id)
+    title = spreadsheet.get('properties', {}).get('title', 'google_sheet_data')
+    visible_sheets = [sheet['properties'] for sheet in spreadsheet.get('sheets', [])
+                      if not sheet['properties'].get('hidden', False)]
+    visible_sheets = options.tab_selection(spreadsheet_id).apply(visible_sheets)
+    column_types = {}
+    if options.value_render == VALUE_RENDER_TYPED and visible_sheets:
+        column_types = fetch_column_types(service, spreadsheet_id, visible_sheets)
+
+    frames = {}
+    for sheet_name, values in fetch_tab_values(service, spreadsheet_id, visible_sheets, options, submit=submit):
+        if options.value_render == VALUE_RENDER_TYPED:
+            values = typed_rows(values, column_types.get(sheet_name))
+        with tracer.span('conversion', spreadsheet_id=spreadsheet_id, sheet=sheet_name):
+            frame = values_to_frame(values)
+        if frame is None:
+            logger.info("No data found in sheet: %s", sheet_name)
+            continue
+        frames[sheet_name] = frame
+    return title, frames
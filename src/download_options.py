@@ -0,0 +1,108 @@
+from dataclasses import dataclass, field
+from sheets_fetch import (
+    FETCH_MODE_BATCH, FETCH_MODES, DEFAULT_PAGE_CELLS, DEFAULT_PAGE_CONCURRENCY, VALUE_RENDER_FORMATTED, VALUE_RENDERS,
+    DEFAULT_METADATA_BATCH_SIZE, MAX_METADATA_BATCH_SIZE
+)
+from request_executor import DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_MAX_RETRIES
+from metadata_cache import DEFAULT_METADATA_TTL
+from http_transport import TRANSPORT_HTTPLIB2, TRANSPORTS
+from batch_schedule import SCHEDULE_LARGEST_FIRST, SCHEDULES
+from merge_writer import MERGE_OFF, MERGE_MODES, DEFAULT_MERGE_NAME
+from tab_selection import TabSelection
+from sheets_writers import (
+    FORMAT_XLSX, OUTPUT_FORMATS, PARQUET_COMPRESSIONS, DEFAULT_PARQUET_COMPRESSION, DEFAULT_PARQUET_ROW_GROUP_ROWS
+)
+
+
+@dataclass
+class DownloadOptions:
+    """单个spreadsheet的下载选项"""
+    fetch_mode: str = FETCH_MODE_BATCH
+    # 取值方式: formatted 为显示文本; typed 为数值和日期
+    value_render: str = VALUE_RENDER_FORMATTED
+    # 输出格式: xlsx / csv / jsonl / parquet
+    output_format: str = FORMAT_XLSX
+    # 使用write-only Workbook流式写入(仅xlsx)
+    streaming: bool = False
+    parquet_compression: str = DEFAULT_PARQUET_COMPRESSION
+    parquet_row_group_rows: int = DEFAULT_PARQUET_ROW_GROUP_ROWS
+    # 预计单元格数超过该值的工作表按行分页获取, 0表示不分页
+    page_cells: int = DEFAULT_PAGE_CELLS
+    # 每个工作表同时在途的分页请求数
+    page_concurrency: int = DEFAULT_PAGE_CONCURRENCY
+    # 整个批次共享的每分钟请求数上限, 0表示不限流
+    requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE
+    max_retries: int = DEFAULT_MAX_RETRIES
+    # 元数据缓存的有效秒数, 0表示不使用缓存
+    metadata_ttl: int = DEFAULT_METADATA_TTL
+    # 批量下载开始前用multipart批量请求获取元数据, 每批的请求数; 0表示每个spreadsheet单独请求
+    metadata_batch_size: int = DEFAULT_METADATA_BATCH_SIZE
+    # 增量同步: 跳过内容未变化的文件
+    sync: bool = False
+    # HTTP传输层: httplib2 或 pooled
+    transport: str = TRANSPORT_HTTPLIB2
+    # 生成输出文件的进程数, 0表示在下载线程中直接写入
+    writer_processes: int = 0
+    # 批量下载的提交顺序: largest-first 或 input
+    schedule: str = SCHEDULE_LARGEST_FIRST
+    # 合并模式: off / tabs / concat, 合并输出的文件名(不含扩展名)为 merge_name
+    merge: str = MERGE_OFF
+    merge_name: str = DEFAULT_MERGE_NAME
+    # 工作表筛选: 包含/排除的工作表名模式(glob, 或以 re: 开头的正则表达式), {工作表名: A1范围} 只获取该范围
+    include_tabs: list = field(default_factory=list)
+    exclude_tabs: list = field(default_factory=list)
+    tab_ranges: dict = field(default_factory=dict)
+    # 按spreadsheet ID指定的筛选 {ID: {'include_tabs', 'exclude_tabs', 'tab_ranges'}}, 替代上面的全局筛选
+    sheet_tab_filters: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        if self.fetch_mode not in FETCH_MODES:
+            raise ValueError(f"未知的获取模式: {self.fetch_mode}")
+        if self.value_render not in VALUE_RENDERS:
+            raise ValueError(f"未知的取值方式: {self.value_render}")
+        if self.output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"未知的输出格式: {self.output_format}")
+        if self.parquet_compression not in PARQUET_COMPRESSIONS:
+            raise ValueError(f"未知的Parquet压缩方式: {self.parquet_compression}")
+        if self.parquet_row_group_rows < 1:
+            raise ValueError(f"row group行数必须大于0: {self.parquet_row_group_rows}")
+        if self.page_cells < 0:
+            raise ValueError(f"分页单元格数不能为负数: {self.page_cells}")
+        if self.page_concurrency < 1:
+            raise ValueError(f"分页并发数必须大于0: {self.page_concurrency}")
+        if self.requests_per_minute < 0:
+            raise ValueError(f"每分钟请求数不能为负数: {self.requests_per_minute}")
+        if self.max_retries < 0:
+            raise ValueError(f"重试次数不能为负数: {self.max_retries}")
+        if self.transport not in TRANSPORTS:
+            raise ValueError(f"未知的传输层: {self.transport}")
+        if self.metadata_ttl < 0:
+            raise ValueError(f"元数据缓存时间不能为负数: {self.metadata_ttl}")
+        if not 0 <= self.metadata_batch_size <= MAX_METADATA_BATCH_SIZE:
+            raise ValueError(f"元数据批量请求数必须在0到{MAX_METADATA_BATCH_SIZE}之间: {self.metadata_batch_size}")
+        if self.writer_processes < 0:
+            raise ValueError(f"写入进程数不能为负数: {self.writer_processes}")
+        if self.schedule not in SCHEDULES:
+            raise ValueError(f"未知的调度顺序: {self.schedule}")
+        if self.merge not in MERGE_MODES:
+            raise ValueError(f"未知的合并模式: {self.merge}")
+        if self.merge != MERGE_OFF:
+            if not self.merge_name.strip():
+                raise ValueError("合并输出的文件名不能为空")
+            # 增量同步按单个文件比较内容, 写入进程按单个文件生成输出, 都不适用于合并输出
+            if self.sync:
+                raise ValueError("合并模式不支持增量同步")
+            if self.writer_processes:
+                raise ValueError("合并模式不使用写入进程")
+        # 提前检查模式和A1范围, 无效时抛出ValueError
+        self.tab_selection(None)
+        for spreadsheet_id in self.sheet_tab_filters:
+            self.tab_selection(spreadsheet_id)
+
+    def tab_selection(self, spreadsheet_id):
+        """spreadsheet_id 使用的工作表筛选"""
+        filters = self.sheet_tab_filters.get(spreadsheet_id)
+        if filters is None:
+            filters = {'include_tabs': self.include_tabs, 'exclude_tabs': self.exclude_tabs,
+                       'tab_ranges': self.tab_ranges}
+        return TabSelection.from_filters(filters)
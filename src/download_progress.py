@@ -0,0 +1,182 @@
+import threading
+import time
+
+# 进度事件, 每个事件是一个dict, 'event' 字段为以下类型之一:
+#   plan       开始下载: ids 为提交顺序, costs 为按元数据估算的工作量(未预先获取元数据时为None)
+#   file_start 一个spreadsheet开始获取数据: title, tabs 为可见工作表数
+#   tab_done   一个工作表已写入: sheet, rows
+#   bytes      收到一个响应: bytes 为解压后的字节数
+#   file_done  一个spreadsheet结束: result 为 SpreadsheetResult
+#   paused / resumed / cancelling  用户操作
+EVENT_PLAN = 'plan'
+EVENT_FILE_START = 'file_start'
+EVENT_TAB_DONE = 'tab_done'
+EVENT_BYTES = 'bytes'
+EVENT_FILE_DONE = 'file_done'
+EVENT_PAUSED = 'paused'
+EVENT_RESUMED = 'resumed'
+EVENT_CANCELLING = 'cancelling'
+
+
+class DownloadCancelled(Exception):
+    """下载被用户取消"""
+
+
+class DownloadControl:
+    """一次批量下载的暂停/取消开关和进度事件出口, 可以在任意线程中调用
+
+    工作线程在每次发送请求前、退避等待时和写入每个工作表前调用 checkpoint():
+    暂停时在这里阻塞, 取消后抛出 DownloadCancelled。已经发出的单个请求会等到响应返回,
+    之后不再发送新的请求, 写了一半的临时文件会被删除。
+    on_event(event) 在产生事件的线程中调用, 应当只把事件放入队列。
+    """
+
+    def __init__(self, on_event=None):
+        self.on_event = on_event
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def emit(self, event, **fields):
+        if self.on_event is not None:
+            fields['event'] = event
+            self.on_event(fields)
+
+    def pause(self):
+        if not self.cancelled and not self.paused:
+            self._running.clear()
+            self.emit(EVENT_PAUSED)
+
+    def resume(self):
+        if self.paused:
+            self._running.set()
+            self.emit(EVENT_RESUMED)
+
+    def cancel(self):
+        if not self.cancelled:
+            self._cancelled.set()
+            # 唤醒暂停中的线程, 让它们看到取消
+            self._running.set()
+            self.emit(EVENT_CANCELLING)
+
+    def checkpoint(self):
+        self._running.wait()
+        if self._cancelled.is_set():
+            raise DownloadCancelled("下载已取消")
+
+    def sleep(self, seconds):
+        """可以被取消打断的 time.sleep"""
+        if seconds > 0:
+            self._cancelled.wait(seconds)
+        self.checkpoint()
+
+
+class ProgressTracker:
+    """汇总进度事件, 计算完成比例、吞吐量和剩余时间(ETA); 只在一个线程中使用"""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.files = {}
+        self.order = []
+        self.costs = {}
+        self.files_done = 0
+        self.tabs_done = 0
+        self.rows = 0
+        self.bytes = 0
+        # 已结束的spreadsheet各阶段耗时合计, 用于查看时间花在哪里
+        self.phase_seconds = {'metadata': 0.0, 'fetch': 0.0, 'write': 0.0}
+        self.retries = 0
+        self.throttled = 0
+        self._paused_at = None
+        self._paused_seconds = 0.0
+        # 开始下载数据时已经运行的秒数(认证和预先获取元数据), 不计入ETA的速度估算
+        self._planned_elapsed = None
+
+    def apply(self, event):
+        kind = event['event']
+        if kind == EVENT_PLAN:
+            self.order = list(event['ids'])
+            self._planned_elapsed = self.elapsed()
+            # 没有估算时每个spreadsheet按相同的工作量计算
+            self.costs = event.get('costs') or {spreadsheet_id: 1 for spreadsheet_id in self.order}
+            for spreadsheet_id in self.order:
+                self.files.setdefault(spreadsheet_id, {'status': 'queued', 'title': None, 'tabs': 0,
+                                                       'tabs_done': 0, 'rows': 0})
+        elif kind == EVENT_FILE_START:
+            state = self.files.setdefault(event['spreadsheet_id'], {'tabs_done': 0, 'rows': 0})
+            state.update(status='running', title=event['title'], tabs=event['tabs'])
+        elif kind == EVENT_TAB_DONE:
+            state = self.files.get(event['spreadsheet_id'])
+            if state is not None:
+                state['tabs_done'] += 1
+                state['rows'] += event['rows']
+            self.tabs_done += 1
+            self.rows += event['rows']
+        elif kind == EVENT_BYTES:
+            self.bytes += event['bytes']
+        elif kind == EVENT_FILE_DONE:
+            result = event['result']
+            state = self.files.setdefault(result.spreadsheet_id, {'tabs': 0, 'tabs_done': 0, 'rows': 0})
+            state.update(status=result.status, title=result.title or state.get('title'), error=result.error)
+            self.files_done += 1
+            self.phase_seconds['metadata'] += result.metadata_seconds
+            self.phase_seconds['fetch'] += result.fetch_seconds
+            self.phase_seconds['write'] += result.write_seconds
+            self.retries += result.retries
+            self.throttled += result.throttled
+        elif kind == EVENT_PAUSED:
+            self._paused_at = time.monotonic()
+        elif kind == EVENT_RESUMED and self._paused_at is not None:
+            self._paused_seconds += time.monotonic() - self._paused_at
+            self._paused_at = None
+
+    def elapsed(self):
+        """不含暂停时间的运行秒数"""
+        now = self._paused_at if self._paused_at is not None else time.monotonic()
+        return max(now - self.started_at - self._paused_seconds, 0.0)
+
+    def fraction(self):
+        """按估算工作量加权的完成比例, 进行中的spreadsheet按已写入的工作表数计入"""
+        total = sum(self.costs.values())
+        if not total:
+            return 0.0
+        done = 0.0
+        for spreadsheet_id, cost in self.costs.items():
+            state = self.files.get(spreadsheet_id, {})
+            if state.get('status') not in ('queued', 'running'):
+                done += cost
+            elif state.get('tabs'):
+                done += cost * state['tabs_done'] / state['tabs']
+        return min(done / total, 1.0)
+
+    def eta_seconds(self):
+        fraction = self.fraction()
+        if self._planned_elapsed is None or fraction <= 0 or fraction >= 1:
+            return None
+        elapsed = self.elapsed() - self._planned_elapsed
+        return elapsed * (1 - fraction) / fraction
+
+    def snapshot(self):
+        elapsed = self.elapsed()
+        return {
+            'files_done': self.files_done,
+            'files_total': len(self.order),
+            'tabs_done': self.tabs_done,
+            'rows': self.rows,
+            'megabytes': self.bytes / 1e6,
+            'megabytes_per_second': self.bytes / 1e6 / elapsed if elapsed > 0 else 0.0,
+            'elapsed_seconds': elapsed,
+            'fraction': self.fraction(),
+            'eta_seconds': self.eta_seconds(),
+            'phase_seconds': dict(self.phase_seconds),
+            'retries': self.retries,
+            'throttled': self.throttled,
+        }
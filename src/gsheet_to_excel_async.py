@@ -7,32 +7,99 @@
 ### ============================================
 
 import asyncio
+import contextvars
 import os
+import sys
 import argparse
-from openpyxl import Workbook
-from googleapiclient.discovery import build
+import itertools
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 from googleapiclient.errors import HttpError
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
+from download_options import DownloadOptions
+from metadata_cache import MetadataCache, DEFAULT_METADATA_TTL
+from sync_state import SyncState, WorkbookFingerprint
+from sheets_fetch import (
+    fetch_spreadsheet_metadata, fetch_metadata_batch, fetch_tab_values, FETCH_MODES, FETCH_MODE_BATCH,
+    DEFAULT_PAGE_CELLS, DEFAULT_PAGE_CONCURRENCY, VALUE_RENDERS, VALUE_RENDER_FORMATTED, VALUE_RENDER_TYPED,
+    DEFAULT_METADATA_BATCH_SIZE, MAX_METADATA_BATCH_SIZE
+)
+from value_types import fetch_column_types, typed_rows
+from tab_transfer import TabTransferWriter, WriterProcessPool
+from job_journal import JobJournal, job_options
+from dataframe_engine import require_pandas, fetch_frames
+from sheets_writers import (
+    create_writer, replace_atomically, OUTPUT_FORMATS, FORMAT_XLSX, PARQUET_COMPRESSIONS, DEFAULT_PARQUET_COMPRESSION,
+    DEFAULT_PARQUET_ROW_GROUP_ROWS, OutputNames, safe_filename
+)
+from request_executor import (
+    create_request_executor, RequestStats, task_stats, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_MAX_RETRIES
+)
+from run_report import (
+    RunReport, SpreadsheetResult, REPORT_FILE, STATUS_DOWNLOADED, STATUS_UNCHANGED, STATUS_SKIPPED, STATUS_FAILED,
+    STATUS_CANCELLED, find_worker_reports, merge_run_reports, save_json
+)
+from download_progress import DownloadCancelled, EVENT_PLAN, EVENT_FILE_START, EVENT_TAB_DONE, EVENT_FILE_DONE
+from sheets_session import SheetsSession, API_ENDPOINT_ENV_VAR
+from config_manager import ConfigManager, parse_sheet_list
+from batch_schedule import (
+    SCHEDULES, SCHEDULE_LARGEST_FIRST, estimate_spreadsheet_cells, estimated_cost, largest_first, makespan_summary
+)
+from http_transport import TRANSPORTS, TRANSPORT_HTTPLIB2, TRANSPORT_POOLED
+from merge_writer import MergedOutput, MERGE_MODES, MERGE_OFF, DEFAULT_MERGE_NAME
+from tab_selection import parse_tab_range
+from work_sharding import (
+    LeaseQueue, DEFAULT_LEASE_SECONDS, parse_shard, shard_ids, shard_worker_name, default_worker_name, worker_path
+)
+from tracing import logger, tracer, configure_logging, profiled_call, run_profiled, LOG_LEVELS
 
 # 环境变量名
 CREDENTIALS_ENV_VAR = "GCP_CREDENTIALS_JSON"
 TOKEN_ENV_VAR = "GCP_TOKEN_JSON"
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
+# 默认同时下载的spreadsheet数量
+DEFAULT_MAX_CONCURRENCY = 8
+
+
+# 进程内共享的认证会话
+_session = None
+_session_lock = threading.Lock()
 
 
 def get_sheets_service_v4():
+    return get_session().service()
+
+def get_session():
+    """返回进程内共享的会话, 第一次调用时读取token(必要时进行认证)"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            with tracer.span('auth'):
+                creds = get_credentials()
+            _session = SheetsSession(creds, token_path=os.getenv(TOKEN_ENV_VAR))
+        return _session
+
+def reset_session():
+    """认证文件变化后调用, 下次使用时重新读取"""
+    global _session
+    with _session_lock:
+        _session = None
+
+def get_credentials():
     creds = None
     credentials_json_path = os.getenv(CREDENTIALS_ENV_VAR)
     token_json_path = os.getenv(TOKEN_ENV_VAR)
     
-    print(f"[Auth] 凭证路径: {credentials_json_path}")
-    print(f"[Auth] Token路径: {token_json_path}")
+    logger.debug("[Auth] 凭证路径: %s", credentials_json_path)
+    logger.debug("[Auth] Token路径: %s", token_json_path)
 
     # 首先检查环境变量是否设置
     if not credentials_json_path or not token_json_path:
-        print("[Auth] 环境变量未设置，尝试使用默认路径")
+        logger.info("[Auth] 环境变量未设置，尝试使用默认路径")
         app_data_dir = os.path.join(os.path.expanduser("~"), ".gsheet_downloader")
         credentials_json_path = os.path.join(app_data_dir, "credentials.json")
         token_json_path = os.path.join(app_data_dir, "token.json")
@@ -41,8 +108,8 @@ def get_sheets_service_v4():
         os.environ[CREDENTIALS_ENV_VAR] = credentials_json_path
         os.environ[TOKEN_ENV_VAR] = token_json_path
         
-        print(f"[Auth] 使用默认路径 - 凭证: {credentials_json_path}")
-        print(f"[Auth] 使用默认路径 - Token: {token_json_path}")
+        logger.info("[Auth] 使用默认路径 - 凭证: %s", credentials_json_path)
+        logger.info("[Auth] 使用默认路径 - Token: %s", token_json_path)
 
     # 检查凭证文件是否存在
     if not os.path.exists(credentials_json_path):
@@ -52,23 +119,23 @@ def get_sheets_service_v4():
     if os.path.exists(token_json_path):
         try:
             creds = Credentials.from_authorized_user_file(token_json_path, SCOPES)
-            print("[Auth] 成功加载现有token")
+            logger.info("[Auth] 成功加载现有token")
         except Exception as e:
-            print(f"[Auth] 加载token失败: {str(e)}")
+            logger.warning("[Auth] 加载token失败: %s", e)
             creds = None
     
     # 处理凭证
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             try:
-                print("[Auth] 刷新过期token")
+                logger.info("[Auth] 刷新过期token")
                 creds.refresh(Request())
             except Exception as e:
-                print(f"[Auth] 刷新token失败: {str(e)}")
+                logger.warning("[Auth] 刷新token失败: %s", e)
                 creds = None
         
         if not creds:
-            print("[Auth] 开始新的认证流程")
+            logger.info("[Auth] 开始新的认证流程")
             try:
                 flow = InstalledAppFlow.from_client_secrets_file(
                     credentials_json_path, SCOPES
@@ -82,125 +149,374 @@ def get_sheets_service_v4():
                 os.makedirs(os.path.dirname(token_json_path), exist_ok=True)
                 with open(token_json_path, "w") as token:
                     token.write(creds.to_json())
-                print("[Auth] 新token已保存")
+                logger.info("[Auth] 新token已保存")
             except Exception as e:
                 raise ValueError(f"认证过程失败: {str(e)}")
 
-    return build('sheets', 'v4', credentials=creds)
+    return creds
+
+
+class SheetsWorkerPool:
+    """固定大小的下载线程池, 每个工作线程持有自己的service和HTTP连接"""
+
+    def __init__(self, session, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 page_concurrency=DEFAULT_PAGE_CONCURRENCY, executor=None,
+                 transport=TRANSPORT_HTTPLIB2, writer_processes=0):
+        if max_concurrency < 1:
+            raise ValueError(f"并发数必须大于0: {max_concurrency}")
+        self.session = session
+        # pooled: 所有线程共享会话的连接池, 大小覆盖下载线程和分页线程
+        self._http = None
+        if transport == TRANSPORT_POOLED:
+            self._http = session.pooled_http(max_concurrency * (1 + page_concurrency))
+        # 所有线程共享同一个executor, 限流器因此对整个批次生效
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency,
+            thread_name_prefix='gsheet-worker'
+        )
+        # 大工作表的分页请求在单独的线程中执行, 同样每个线程使用独立的service
+        self._page_executor = ThreadPoolExecutor(
+            max_workers=max_concurrency * page_concurrency,
+            thread_name_prefix='gsheet-page'
+        )
+        # 生成输出文件是CPU密集的, 放到独立进程中, 与其他线程的网络请求并行
+        self.writer_executor = None
+        if writer_processes > 0:
+            self.writer_executor = WriterProcessPool(writer_processes)
+
+    def _thread_service(self):
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            logger.debug("[Pool] %s 创建独立service", threading.current_thread().name)
+            service = self.session.build_service(self.executor, self._http)
+            self._local.service = service
+        return service
+
+    def _call(self, func, args):
+        # 开启 --profile 时在当前线程的cProfile中执行
+        return profiled_call(func, self._thread_service(), *args)
 
-def _download_gsheet(service, spreadsheet_id, output_dir):
-    # 获取电子表格元数据以获得文件名
-    spreadsheet = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
-    sheets = spreadsheet.get('sheets', [])
-    sheet_title = spreadsheet.get('properties', {}).get('title', 'google_sheet_data')
+    async def run(self, func, *args):
+        """在工作线程中执行 func(service, *args)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, func, args)
+
+    def submit_page(self, func, *args):
+        """在分页线程中执行 func(service, *args), 返回Future; 分页线程继承当前任务的请求计数"""
+        context = contextvars.copy_context()
+        return self._page_executor.submit(context.run, self._call, func, args)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+        self._page_executor.shutdown(wait=True, cancel_futures=True)
+        if self.writer_executor is not None:
+            self.writer_executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+
+def _download_gsheet(service, spreadsheet_id, output_dir, options=None):
+    """同步下载路径: 使用DataFrame引擎(需要pandas), 每个工作表的第一行作为列名"""
+    pd, _ = require_pandas()
+    sheet_title, frames = fetch_frames(service, spreadsheet_id, options)
+    if not frames:
+        logger.info("No data found in spreadsheet: %s", sheet_title)
+        return None
 
     # 处理输出路径逻辑
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
-    output_path = os.path.join(output_dir, f"{sheet_title}.xlsx")
-
-    # 初始化一个Excel writer对象
-    excel_writer = pd.ExcelWriter(output_path, engine='openpyxl')
-
-    # 遍历所有工作表并获取数据
-    for sheet in sheets:
-        sheet_name = sheet['properties']['title']
-        result = service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_id,
-            range=sheet_name
-        ).execute()
-        
-        values = result.get('values', [])
-        
-        if values:
-            # 过滤掉完全为空的行
-            values = [row for row in values if any(row)]
-            
-            # 确保所有行的列数与表头一致
-            num_columns = len(values[0])
-            for i in range(1, len(values)):
-                if len(values[i]) < num_columns:
-                    values[i].extend([None] * (num_columns - len(values[i])))
-                elif len(values[i]) > num_columns:
-                    values[i] = values[i][:num_columns]
-            
-            # 将数据转换为DataFrame
-            df = pd.DataFrame(values[1:], columns=values[0])
-            df.to_excel(excel_writer, sheet_name=sheet_name, index=False)
+    output_path = os.path.join(output_dir, f"{safe_filename(sheet_title)}.xlsx")
+
+    def write(path):
+        # 临时文件的扩展名不是.xlsx, 通过文件对象传给ExcelWriter
+        with open(path, 'wb') as f, pd.ExcelWriter(f, engine='openpyxl') as excel_writer:
+            for sheet_name, df in frames.items():
+                df.to_excel(excel_writer, sheet_name=sheet_name, index=False)
+
+    replace_atomically(output_path, write)
+    logger.info("数据已保存到 %s", output_path)
+    return output_path
+
+def load_google_sheet_frames(spreadsheet_id, options=None):
+    """不写文件, 直接返回 {工作表名: DataFrame}, 用于在内存中分析数据(需要pandas)"""
+    service = get_sheets_service_v4()
+    _, frames = fetch_frames(service, spreadsheet_id, options)
+    return frames
+
+def _resolve_output_dir(output_dir):
+    # 验证输出目录
+    if not output_dir or not isinstance(output_dir, str):
+        output_dir = os.path.join(os.path.expanduser("~"), "Downloads")
+        logger.info("[Async] 使用默认输出目录: %s", output_dir)
+    
+    # 确保输出目录是绝对路径
+    output_dir = os.path.abspath(output_dir)
+    logger.debug("[Async] 使用绝对路径: %s", output_dir)
+    return output_dir
+
+async def _download_gsheet_async(pool, spreadsheet_id, output_dir, options, metadata_cache=None,
+                                 sync_state=None, journal=None, prefetched=None, control=None, merged=None,
+                                 output_names=None):
+    """下载一个spreadsheet, 返回 SpreadsheetResult; 失败时不抛出异常, 记录在结果中"""
+    result = SpreadsheetResult(spreadsheet_id)
+    start = time.perf_counter()
+    try:
+        await pool.run(_download_gsheet_blocking, spreadsheet_id, output_dir, options, pool.submit_page,
+                       metadata_cache, sync_state, pool.writer_executor, journal, result, prefetched, control,
+                       merged, output_names)
+    except DownloadCancelled as e:
+        result.status = STATUS_CANCELLED
+        result.error = str(e)
+    except Exception as e:
+        result.status = STATUS_FAILED
+        result.error = str(e)
+    result.total_seconds = round(time.perf_counter() - start, 3)
+    if control is not None:
+        control.emit(EVENT_FILE_DONE, spreadsheet_id=spreadsheet_id, result=result)
+    return result
+
+def _prefetch_metadata(service, spreadsheet_id, metadata_cache=None):
+    """调度前预先获取元数据, 返回 (metadata, 是否来自缓存, 耗时)"""
+    start = time.perf_counter()
+    with tracer.span('metadata', spreadsheet_id=spreadsheet_id, prefetch=True):
+        metadata, from_cache = fetch_spreadsheet_metadata(service, spreadsheet_id, metadata_cache)
+    return metadata, from_cache, time.perf_counter() - start
+
+def _prefetch_metadata_batch(service, spreadsheet_ids, metadata_cache=None, executor=None):
+    """一次multipart批量请求预先获取多个spreadsheet的元数据, 返回 {id: (metadata, 是否来自缓存, 耗时) 或异常}
+
+    耗时为整个批量请求的耗时平均分到每个spreadsheet, 各spreadsheet的元数据阶段耗时相加时不会重复计算。
+    """
+    start = time.perf_counter()
+    with tracer.span('metadata', prefetch=True, batch=len(spreadsheet_ids)):
+        outcomes = fetch_metadata_batch(service, spreadsheet_ids, metadata_cache, executor)
+    share = (time.perf_counter() - start) / max(len(spreadsheet_ids), 1)
+    return {spreadsheet_id: outcome if isinstance(outcome, BaseException) else (*outcome, share)
+            for spreadsheet_id, outcome in outcomes.items()}
+
+async def _prefetch_all_metadata(pool, spreadsheet_ids, options, metadata_cache=None):
+    """下载开始前获取所有元数据, 返回 {id: (metadata, 是否来自缓存, 耗时) 或异常}
+
+    metadata_batch_size > 0 时每批ID一次multipart请求, 各批在工作线程中并行; 否则每个spreadsheet单独请求。
+    """
+    batch_size = options.metadata_batch_size
+    if not batch_size:
+        outcomes = await asyncio.gather(
+            *(pool.run(_prefetch_metadata, spreadsheet_id, metadata_cache) for spreadsheet_id in spreadsheet_ids),
+            return_exceptions=True
+        )
+        return dict(zip(spreadsheet_ids, outcomes))
+    chunks = [spreadsheet_ids[i:i + batch_size] for i in range(0, len(spreadsheet_ids), batch_size)]
+    outcomes = await asyncio.gather(
+        *(pool.run(_prefetch_metadata_batch, chunk, metadata_cache, pool.executor) for chunk in chunks),
+        return_exceptions=True
+    )
+    prefetched = {}
+    for chunk, outcome in zip(chunks, outcomes):
+        if isinstance(outcome, BaseException):
+            # 整个批量请求失败(重试之后), 这一批在下载时单独请求
+            logger.warning("[Async] 批量获取 %s 个元数据失败: %s", len(chunk), outcome)
+            prefetched.update(dict.fromkeys(chunk, outcome))
         else:
-            print(f"No data found in sheet: {sheet_name}")
+            prefetched.update(outcome)
+    return prefetched
 
-    # 保存并关闭Excel文件
-    excel_writer.close()
+def _timed(iterable, result):
+    """逐项产出, 同时把等待每一项的时间(网络请求和解析)累计到 result.fetch_seconds"""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            result.fetch_seconds += time.perf_counter() - start
+            return
+        result.fetch_seconds += time.perf_counter() - start
+        yield item
+
+def _discard_quietly(writer):
+    # 清理写了一半的临时文件
+    if writer is not None:
+        try:
+            writer.discard()
+        except Exception:
+            pass
 
-    print(f"数据已保存到 {output_path}")
+def _download_gsheet_blocking(service, spreadsheet_id, output_dir, options, submit_page=None,
+                              metadata_cache=None, sync_state=None, writer_executor=None, journal=None,
+                              result=None, prefetched=None, control=None, merged=None, output_names=None):
+    """在工作线程中执行: 所有 execute() 调用都是阻塞的; 下载过程中的统计写入 result
 
-async def _download_gsheet_async(service, spreadsheet_id, output_dir):
+    prefetched 为调度前已获取的 (metadata, 是否来自缓存, 耗时), 提供时不再重复请求元数据。
+    control 为 DownloadControl 时报告进度事件, 并在写入每个工作表前检查暂停/取消。
+    merged 为 MergedOutput 时数据写入合并输出, 不生成单独的文件。
+    output_names (OutputNames) 为本次运行共用的文件名登记, 标题相同的spreadsheet不会写入同一个文件。
+    """
+    if result is None:
+        result = SpreadsheetResult(spreadsheet_id)
+    from_cache = False
+    writer = None
+    # 本任务(包括分页线程)发出的请求计入 request_stats
+    request_stats = RequestStats()
+    stats_token = task_stats.set(request_stats)
     try:
-        print(f"[Async] 开始下载单个文件: {spreadsheet_id}")
+        if control is not None:
+            # 在线程池队列中等待期间被取消的任务不再开始
+            control.checkpoint()
+        logger.info("[Async] 开始下载单个文件: %s", spreadsheet_id)
         
-        # 验证输出目录
-        if not output_dir or not isinstance(output_dir, str):
-            output_dir = os.path.join(os.path.expanduser("~"), "Downloads")
-            print(f"[Async] 使用默认输出目录: {output_dir}")
-        
-        # 确保输出目录是绝对路径
-        output_dir = os.path.abspath(output_dir)
-        print(f"[Async] 使用绝对路径: {output_dir}")
+        output_dir = _resolve_output_dir(output_dir)
         
         # 确保输出目录存在
         try:
             os.makedirs(output_dir, exist_ok=True)
-            print(f"[Async] 输出目录已确认: {output_dir}")
+            logger.debug("[Async] 输出目录已确认: %s", output_dir)
         except Exception as e:
             raise ValueError(f"创建输出目录失败: {str(e)}")
         
         if not os.path.exists(output_dir):
             raise ValueError(f"输出目录不存在且无法创建: {output_dir}")
             
-        print(f"[Async] 获取spreadsheet信息")
-        spreadsheet = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
+        logger.debug("[Async] 获取spreadsheet信息")
+        phase_start = time.perf_counter()
+        prefetch_seconds = 0.0
+        if prefetched is not None:
+            spreadsheet, from_cache, prefetch_seconds = prefetched
+        else:
+            with tracer.span('metadata', spreadsheet_id=spreadsheet_id):
+                spreadsheet, from_cache = fetch_spreadsheet_metadata(service, spreadsheet_id, metadata_cache)
         sheets = spreadsheet.get('sheets', [])
-        file_name = spreadsheet.get('properties', {}).get('title', 'untitled')
-        
-        excel_path = os.path.join(output_dir, f"{file_name}.xlsx")
-        print(f"[Async] 输出文件路径: {excel_path}")
-        
-        wb = Workbook()
-        wb.remove(wb.active)
+        title = spreadsheet.get('properties', {}).get('title', 'untitled')
+        result.title = title
         
+        visible_sheets = []
         for sheet in sheets:
             sheet_name = sheet['properties']['title']
-            print(f"[Async] 处理工作表: {sheet_name}")
-            
             if sheet['properties'].get('hidden', False):
-                print(f"[Async] 跳过隐藏工作表: {sheet_name}")
+                logger.debug("[Async] 跳过隐藏工作表: %s", sheet_name)
                 continue
-                
-            result = service.spreadsheets().values().get(
-                spreadsheetId=spreadsheet_id,
-                range=sheet_name
-            ).execute()
-            
-            values = result.get('values', [])
-            if not values:
-                print(f"[Async] 工作表为空: {sheet_name}")
+            visible_sheets.append(sheet['properties'])
+        # 在请求任何数据之前按筛选条件去掉不需要的工作表
+        selection = options.tab_selection(spreadsheet_id)
+        visible_sheets = selection.apply(visible_sheets)
+        result.estimated_cells = estimate_spreadsheet_cells(spreadsheet, selection)
+        if not visible_sheets and not selection.empty:
+            # 不创建writer: 各格式对没有工作表的输出处理不一致(xlsx无法保存, 流式xlsx会生成空文件)
+            logger.warning("[Select] %s 没有符合筛选条件的工作表, 跳过", spreadsheet_id)
+            result.status = STATUS_SKIPPED
+            return result
+        
+        file_name = output_names.reserve(spreadsheet_id, title) if output_names is not None else safe_filename(title)
+        if merged is not None:
+            writer = merged.source_writer(spreadsheet_id, title)
+        elif writer_executor is not None:
+            writer = TabTransferWriter(output_dir, file_name, options, writer_executor)
+        else:
+            writer = create_writer(output_dir, file_name, options)
+        logger.debug("[Async] 输出文件路径: %s", writer.output_path)
+        # 增量同步和任务日志都需要内容指纹
+        fingerprint = WorkbookFingerprint() if sync_state is not None or journal is not None else None
+        
+        column_types = {}
+        if options.value_render == VALUE_RENDER_TYPED and visible_sheets:
+            with tracer.span('metadata', spreadsheet_id=spreadsheet_id, column_types=True):
+                column_types = fetch_column_types(service, spreadsheet_id, visible_sheets)
+        result.metadata_seconds = prefetch_seconds + time.perf_counter() - phase_start
+        phase_start = time.perf_counter()
+        if control is not None:
+            control.emit(EVENT_FILE_START, spreadsheet_id=spreadsheet_id, title=file_name, tabs=len(visible_sheets))
+        
+        tabs = fetch_tab_values(service, spreadsheet_id, visible_sheets, options, submit=submit_page,
+                                probe_tail=from_cache)
+        for sheet_name, values in _timed(tabs, result):
+            if control is not None:
+                control.checkpoint()
+            logger.debug("[Async] 处理工作表: %s", sheet_name)
+            # 分页获取的工作表是生成器, 边写入边获取
+            if not isinstance(values, list):
+                values = _timed(values, result)
+            # 先取第一行判断是否为空
+            rows = iter(values)
+            first_row = next(rows, None)
+            if first_row is None:
+                logger.debug("[Async] 工作表为空: %s", sheet_name)
                 continue
             
-            print(f"[Async] 写入工作表: {sheet_name}")
-            ws = wb.create_sheet(sheet_name)
-            for row in values:
-                ws.append(row)
+            logger.debug("[Async] 写入工作表: %s", sheet_name)
+            rows = itertools.chain([first_row], rows)
+            if fingerprint is not None:
+                rows = fingerprint.wrap_tab(sheet_name, rows)
+            if options.value_render == VALUE_RENDER_TYPED:
+                rows = typed_rows(rows, column_types.get(sheet_name))
+            # append 包含等待分页数据的时间, 分页请求本身记录在 values_fetch 中
+            with tracer.span('append', spreadsheet_id=spreadsheet_id, sheet=sheet_name) as span:
+                row_count = writer.write_tab(sheet_name, rows)
+                span.set(rows=row_count)
+            result.tabs += 1
+            result.rows += row_count
+            if journal is not None:
+                journal.tab_done(spreadsheet_id, sheet_name, row_count, fingerprint.last_tab_digest())
+            if control is not None:
+                control.emit(EVENT_TAB_DONE, spreadsheet_id=spreadsheet_id, sheet=sheet_name, rows=row_count)
+            # 在获取下一个工作表之前释放当前工作表的数据
+            del values, rows
+        
+        digest = fingerprint.finish() if fingerprint is not None else None
+        if sync_state is not None:
+            if sync_state.is_unchanged(spreadsheet_id, writer.output_path, digest, fingerprint.tabs):
+                logger.info("[Sync] 内容未变化, 跳过写入: %s", writer.output_path)
+                writer.discard()
+                if journal is not None:
+                    journal.done(spreadsheet_id, writer.output_path, digest)
+                result.status = STATUS_UNCHANGED
+                result.output_path = writer.output_path
+                return result
         
-        print(f"[Async] 保存Excel文件: {excel_path}")
-        wb.save(excel_path)
-        print(f"[Async] 文件保存成功: {excel_path}")
-        return excel_path
+        logger.debug("[Async] 保存文件: %s", writer.output_path)
+        with tracer.span('save', spreadsheet_id=spreadsheet_id):
+            output_path = writer.close()
+        logger.info("[Async] 文件保存成功: %s", output_path)
+        if sync_state is not None:
+            sync_state.record(spreadsheet_id, output_path, digest, fingerprint.tabs)
+        if journal is not None:
+            journal.done(spreadsheet_id, output_path, digest)
+        result.status = STATUS_DOWNLOADED
+        result.output_path = output_path
+        return result
         
+    except DownloadCancelled:
+        # 取消不算失败: 不记录到任务日志, 恢复任务时重新下载
+        _discard_quietly(writer)
+        raise
     except Exception as e:
+        _discard_quietly(writer)
+        if from_cache:
+            # 缓存的元数据可能已过时(例如工作表被重命名), 下次重新获取
+            metadata_cache.invalidate(spreadsheet_id)
         error_msg = f"下载 {spreadsheet_id} 时出错: {str(e)}"
-        print(f"[Async] {error_msg}")
+        logger.error("[Async] %s", error_msg)
+        if journal is not None:
+            journal.failed(spreadsheet_id, str(e))
         raise Exception(error_msg)
+    finally:
+        task_stats.reset(stats_token)
+        counts = request_stats.snapshot()
+        result.bytes_fetched = counts['bytes_received']
+        result.requests = counts['requests']
+        result.retries = counts['retries']
+        result.throttled = counts['throttled']
+        # 写入阶段: 获取元数据之后, 除等待数据以外的全部时间(类型转换, 哈希, 编码和保存)
+        if result.metadata_seconds:
+            result.write_seconds = round(max(time.perf_counter() - phase_start - result.fetch_seconds, 0.0), 3)
+        result.metadata_seconds = round(result.metadata_seconds, 3)
+        result.fetch_seconds = round(result.fetch_seconds, 3)
 
 # 添加兼容性函数
 async def _async_timeout(seconds):
@@ -218,11 +534,11 @@ def download_google_sheet(spreadsheet_id, output_dir):
 
         _download_gsheet(service, spreadsheet_id, output_dir)
     except HttpError as err:
-        print(f"An HTTP error occurred: {err}")
+        logger.error("An HTTP error occurred: %s", err)
     except ValueError as ve:
-        print(f"ValueError: {ve}")
+        logger.error("ValueError: %s", ve)
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        logger.error("An unexpected error occurred: %s", e)
 
 async def download_google_sheet_async(spreadsheet_id, output_dir):
     try:
@@ -230,59 +546,473 @@ async def download_google_sheet_async(spreadsheet_id, output_dir):
 
         await asyncio.to_thread(_download_gsheet, service, spreadsheet_id, output_dir)
     except HttpError as err:
-        print(f"An HTTP error occurred: {err}")
+        logger.error("An HTTP error occurred: %s", err)
     except ValueError as ve:
-        print(f"ValueError: {ve}")
+        logger.error("ValueError: %s", ve)
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        logger.error("An unexpected error occurred: %s", e)
         
-async def download_multi_google_sheet_async(spreadsheet_id_list, output_dir):
+async def download_multi_google_sheet_async(spreadsheet_id_list, output_dir,
+                                            max_concurrency=DEFAULT_MAX_CONCURRENCY, options=None,
+                                            creds=None, resume=False, report_path=None, control=None,
+                                            worker_name=None, queue=None):
+    """下载多个spreadsheet, 返回 RunReport; 单个spreadsheet失败不影响其他spreadsheet
+
+    resume为True时读取输出目录中的任务日志, 跳过上次任务中已经完成的spreadsheet。
+    worker_name: 多个worker(分片)共用输出目录时, 任务日志、同步状态和运行报告使用各自的文件。
+    queue (LeaseQueue): 队列模式, spreadsheet_id_list 用于创建队列(已存在时使用队列中的列表),
+    本worker只下载领取到的ID, 报告中只包含这些ID; 队列模式不使用任务日志, 中断后重新运行即可继续。
+    control (DownloadControl) 用于暂停/取消和接收进度事件; 取消后未完成的spreadsheet状态为 cancelled。
+    运行报告同时以JSON保存到 report_path (默认为输出目录中的 gsheet_run_report.json)。
+    认证失败等无法开始下载的错误仍然抛出异常。
+    """
+    if options is None:
+        options = DownloadOptions()
+    journal = None
     try:
-        print(f"[Async] 开始多文件下载，sheet_ids={spreadsheet_id_list}, output_dir={output_dir}")
-        service = get_sheets_service_v4()
-        print("[Async] 获取service成功")
-        
-        # 使用 gather 替代 TaskGroup
-        tasks = []
-        for spreadsheet_id in spreadsheet_id_list:
-            print(f"[Async] 创建下载任务: {spreadsheet_id}")
-            task = _download_gsheet_async(service, spreadsheet_id, output_dir)
-            tasks.append(task)
-            
-        print(f"[Async] 创建任务列表: {len(tasks)}个任务")
-        
-        if not tasks:
+        if resume and options.merge != MERGE_OFF:
+            # 合并输出每次重新生成, 恢复时只下载剩余的spreadsheet会丢失已完成部分的数据
+            raise ValueError("合并模式的任务不能恢复, 请重新下载")
+        if options.merge != MERGE_OFF and (worker_name or queue is not None):
+            # 每个worker只有一部分spreadsheet, 无法写入同一个合并输出
+            raise ValueError("合并模式不能与分片或队列同时使用")
+        if resume and queue is not None:
+            raise ValueError("队列模式不需要恢复任务, 重新运行即可继续领取未完成的项目")
+        logger.info("[Async] 开始多文件下载，sheet_ids=%s, output_dir=%s, max_concurrency=%s", spreadsheet_id_list,
+                    output_dir, max_concurrency)
+        resolved_dir = _resolve_output_dir(output_dir)
+        os.makedirs(resolved_dir, exist_ok=True)
+        report = RunReport(resolved_dir, worker=worker_name)
+        all_ids = list(spreadsheet_id_list)
+        if queue is not None:
+            # 加入已有的队列时可以不指定ID
+            sleep = control.sleep if control is not None else time.sleep
+            all_ids = spreadsheet_id_list = await asyncio.to_thread(queue.init, all_ids, sleep=sleep)
+        if not all_ids:
             raise ValueError("没有创建任何下载任务")
-            
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        print("[Async] 所有任务完成")
+        if queue is None:
+            journal = JobJournal(resolved_dir, worker_name)
+        previous_outputs = {}
+        if resume:
+            spreadsheet_id_list = journal.pending_ids(all_ids)
+            job = journal.last_job()
+            previous_outputs = job['done'] if job is not None else {}
+            logger.info("[Journal] 恢复上次任务: 已完成 %s 个, 剩余 %s 个", len(all_ids) - len(spreadsheet_id_list),
+                        len(spreadsheet_id_list))
+        if journal is not None:
+            journal.start(all_ids, options, resume)
         
-        # 检查每个任务的结果
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                print(f"[Async] 任务 {i} 失败: {str(result)}")
-                raise result
+        results = {}
+        if spreadsheet_id_list:
+            results = await _run_downloads(spreadsheet_id_list, output_dir, max_concurrency, options, creds,
+                                           journal, report, control, queue, worker_name)
+        if queue is not None:
+            # 报告中只包含本worker领取的ID
+            all_ids = list(results)
+        
+        for spreadsheet_id in all_ids:
+            result = results.get(spreadsheet_id)
+            if result is None:
+                result = SpreadsheetResult(spreadsheet_id, status=STATUS_SKIPPED,
+                                           output_path=previous_outputs.get(spreadsheet_id))
+            report.results.append(result)
+            if result.ok:
+                logger.info("[Async] %s: %s %s", spreadsheet_id, result.status, result.output_path)
+            elif result.status == STATUS_CANCELLED:
+                logger.info("[Async] %s: 已取消", spreadsheet_id)
             else:
-                print(f"[Async] 任务 {i} 成功: {result}")
+                logger.error("[Async] %s 失败: %s", spreadsheet_id, result.error)
         
-        setattr(download_multi_google_sheet_async, 'success', True)
+        if report.success and journal is not None:
+            journal.finish()
+        report.finished_at = time.time()
+        report.save(report_path or worker_path(os.path.join(resolved_dir, REPORT_FILE), worker_name))
+        logger.info("[Async] 下载结束: %s", report.counts())
+        return report
         
     except Exception as e:
         error_msg = str(e)
-        print(f"[Async] 下载出错: {error_msg}")
-        setattr(download_multi_google_sheet_async, 'last_error', error_msg)
-        setattr(download_multi_google_sheet_async, 'success', False)
+        logger.error("[Async] 下载出错: %s", error_msg)
         raise Exception(error_msg)
+    finally:
+        if journal is not None:
+            journal.close()
+
+async def _drain_queue(pool, queue, output_dir, options, metadata_cache, sync_state, control, max_concurrency,
+                       output_names=None):
+    """队列模式: max_concurrency 个协程各自循环领取下一个ID并下载, 返回 (按完成顺序的ID列表, 结果列表)"""
+    order = []
+    outcomes = []
+    sleep = control.sleep if control is not None else time.sleep
+
+    async def claim_loop():
+        while True:
+            try:
+                spreadsheet_id = await asyncio.to_thread(queue.claim, sleep)
+            except DownloadCancelled:
+                return
+            if spreadsheet_id is None:
+                return
+            logger.debug("[Queue] 领取: %s", spreadsheet_id)
+            result = await _download_gsheet_async(pool, spreadsheet_id, output_dir, options, metadata_cache,
+                                                  sync_state, None, None, control, output_names=output_names)
+            order.append(spreadsheet_id)
+            outcomes.append(result)
+            if result.status == STATUS_CANCELLED:
+                # 取消的项目交还给队列, 其他worker可以立即领取
+                await asyncio.to_thread(queue.release, spreadsheet_id)
+                return
+            await asyncio.to_thread(queue.complete, result)
+
+    queue.start_heartbeat()
+    try:
+        await asyncio.gather(*(claim_loop() for _ in range(max_concurrency)))
+    finally:
+        queue.stop_heartbeat()
+    return order, outcomes
+
+async def _run_downloads(spreadsheet_ids, output_dir, max_concurrency, options, creds, journal, report,
+                         control=None, queue=None, worker_name=None):
+    """并发下载, 返回 {spreadsheet_id: SpreadsheetResult}; queue 为 LeaseQueue 时从队列中领取ID"""
+    if creds is None:
+        session = await asyncio.to_thread(get_session)
+        logger.debug("[Async] 获取会话成功")
+    else:
+        session = SheetsSession(creds)
+    # 在工作线程启动前统一刷新token
+    with tracer.span('auth', refresh=True):
+        await asyncio.to_thread(session.ensure_fresh)
+    
+    executor = create_request_executor(options.requests_per_minute, options.max_retries, control=control)
+    metadata_cache = MetadataCache(ttl=options.metadata_ttl) if options.metadata_ttl > 0 else None
+    sync_state = SyncState(report.output_dir, worker_name) if options.sync else None
+    merged = MergedOutput(report.output_dir, options) if options.merge != MERGE_OFF else None
+    output_names = OutputNames()
+    with SheetsWorkerPool(session, max_concurrency, options.page_concurrency, executor,
+                          options.transport, options.writer_processes) as pool:
+        order = list(spreadsheet_ids)
+        prefetched = {}
+        costs = {}
+        largest = options.schedule == SCHEDULE_LARGEST_FIRST
+        if queue is not None:
+            # 队列按ID列表的顺序领取, 各worker领取到哪些ID事先不知道, 不预先获取元数据
+            download_start = time.perf_counter()
+            order, outcomes = await _drain_queue(pool, queue, output_dir, options, metadata_cache, sync_state,
+                                                 control, max_concurrency, output_names)
+            report.queue = {name: value for name, value in queue.status().items() if name != 'done_ids'}
+            logger.info("[Queue] 本worker完成 %s 个, 队列进度: %s", len(order), report.queue)
+        elif len(order) > 1 and (largest or options.metadata_batch_size):
+            # 先获取所有元数据: largest-first 用来估算工作量, 最大的spreadsheet最先开始, 避免它最后才开始拖长总耗时;
+            # 批量获取时几次往返就能取得所有元数据, 下载时不再逐个请求
+            metadata_start = time.perf_counter()
+            metadata_outcomes = await _prefetch_all_metadata(pool, order, options, metadata_cache)
+            report.metadata_prefetch_seconds = round(time.perf_counter() - metadata_start, 3)
+            logger.info("[Async] 预先获取 %s 个元数据耗时 %ss", len(order), report.metadata_prefetch_seconds)
+            for spreadsheet_id in order:
+                # 获取失败的在下载时重新请求, 错误记录在该spreadsheet的结果中
+                outcome = metadata_outcomes.get(spreadsheet_id)
+                cells = 0
+                if outcome is not None and not isinstance(outcome, BaseException):
+                    prefetched[spreadsheet_id] = outcome
+                    # 按输入顺序登记文件名, 标题相同时哪个spreadsheet使用不带ID的名称与完成顺序无关
+                    output_names.reserve(spreadsheet_id, outcome[0].get('properties', {}).get('title', 'untitled'))
+                    cells = estimate_spreadsheet_cells(outcome[0], options.tab_selection(spreadsheet_id))
+                if largest:
+                    costs[spreadsheet_id] = estimated_cost(cells)
+            if largest:
+                order = largest_first(order, costs)
+                logger.debug("[Async] largest-first顺序: %s", order)
+        
+        if queue is None:
+            if control is not None:
+                control.emit(EVENT_PLAN, ids=order, costs=costs or None)
+            # 线程池按提交顺序执行, 使用 gather 替代 TaskGroup, 实际并发数由线程池大小限制
+            download_start = time.perf_counter()
+            tasks = []
+            for spreadsheet_id in order:
+                logger.debug("[Async] 创建下载任务: %s", spreadsheet_id)
+                tasks.append(_download_gsheet_async(pool, spreadsheet_id, output_dir, options, metadata_cache,
+                                                    sync_state, journal, prefetched.get(spreadsheet_id), control,
+                                                    merged, output_names))
+            logger.debug("[Async] 创建任务列表: %s个任务", len(tasks))
+            outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        makespan = time.perf_counter() - download_start
+        logger.debug("[Async] 所有任务完成")
+    
+    if metadata_cache is not None:
+        metadata_cache.save()
+    if sync_state is not None:
+        sync_state.save()
+        report.sync_summary = sync_state.summary()
+        logger.info("[Sync] 跳过 %s 个未变化的文件, 更新 %s 个", report.sync_summary['skipped'], report.sync_summary['refreshed'])
+    report.request_stats = executor.stats.snapshot()
+    if tracer.enabled:
+        report.trace = tracer.summary()
+    logger.info("[Async] 请求统计: %s", report.request_stats)
+    
+    results = {}
+    for spreadsheet_id, outcome in zip(order, outcomes):
+        if isinstance(outcome, BaseException):
+            # _download_gsheet_async 自身不会抛出异常, 这里只是兜底
+            outcome = SpreadsheetResult(spreadsheet_id, status=STATUS_FAILED, error=str(outcome))
+        if spreadsheet_id in prefetched:
+            outcome.estimated_cells = estimate_spreadsheet_cells(prefetched[spreadsheet_id][0],
+                                                                 options.tab_selection(spreadsheet_id))
+        results[spreadsheet_id] = outcome
+    if merged is not None:
+        report.merge = _finish_merge(merged, results)
+    if costs:
+        # 只计工作线程中获取和写入数据的时间, total_seconds 还包括在线程池队列中等待的时间
+        durations = {spreadsheet_id: result.fetch_seconds + result.write_seconds
+                     for spreadsheet_id, result in results.items() if result.ok}
+        report.schedule = makespan_summary(list(spreadsheet_ids), order, costs, durations, max_concurrency, makespan)
+        logger.info("[Async] 预计makespan %ss (按输入顺序 %ss), 实际 %ss", report.schedule['estimated_makespan_seconds'],
+                    report.schedule['input_order_estimated_makespan_seconds'],
+                    report.schedule['actual_makespan_seconds'])
+    return results
+
+def _finish_merge(merged, results):
+    """保存合并输出, 返回报告中的 merge 字段; 没有任何来源写入时不生成文件"""
+    missing = [spreadsheet_id for spreadsheet_id, result in results.items() if not result.ok]
+    if merged.error is None and not merged.sources:
+        merged.discard()
+        logger.warning("[Merge] 没有可以合并的数据, 不生成合并输出")
+        summary = merged.summary(missing)
+        summary['output_path'] = None
+        return summary
+    try:
+        if merged.error is not None:
+            # 输出中留有出错来源的一部分数据, 不保存
+            raise ValueError(merged.error)
+        with tracer.span('save', merge=True):
+            merged.close()
+    except Exception as e:
+        merged.discard()
+        for result in results.values():
+            if result.ok:
+                result.status = STATUS_FAILED
+                result.error = f"保存合并输出失败: {str(e)}"
+        logger.error("[Merge] 保存合并输出失败: %s", e)
+        summary = merged.summary(list(results))
+        summary['output_path'] = None
+        return summary
+    logger.info("[Merge] 合并了 %s 个spreadsheet, %s 行: %s", merged.sources, merged.rows, merged.output_path)
+    if missing:
+        logger.warning("[Merge] %s 个spreadsheet没有写入合并输出: %s", len(missing), missing)
+    return merged.summary(missing)
+
+def _read_id_lines(path):
+    if path == '-':
+        return sys.stdin.read().splitlines()
+    # utf-8-sig: 兼容Windows记事本保存的带BOM的文件
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        return f.read().splitlines()
+
+def _merge_reports_cli(args, parser, queue=None):
+    """--merge-reports: 合并各worker的运行报告, 返回退出码"""
+    output_dir = _resolve_output_dir(args.output_dir)
+    paths = find_worker_reports(output_dir)
+    if not paths:
+        parser.error(f"输出目录中没有worker的运行报告: {output_dir}")
+    queue_status = None
+    if queue is not None:
+        expected_ids = queue.read_ids()
+        queue_status = queue.status()
+    else:
+        lines = list(args.spreadsheet_ids)
+        if args.ids_from:
+            lines.extend(_read_id_lines(args.ids_from))
+        expected_ids = [sheet_id for sheet_id, _ in parse_sheet_list(lines)] or None
+    # 被强制结束的worker没有写出报告, 它完成的ID以队列中的完成记录为准
+    merged = merge_run_reports(paths, expected_ids, queue_status and queue_status['done_ids'])
+    if queue_status is not None:
+        merged['queue'] = {name: value for name, value in queue_status.items() if name != 'done_ids'}
+    path = save_json(args.report_path or os.path.join(output_dir, REPORT_FILE), merged)
+    logger.info("[Report] 合并了 %s 个worker的报告: %s, 失败 %s 个, 缺失 %s 个: %s", len(paths), merged['counts'],
+                len(merged['failed_ids']), len(merged['missing_ids']), path)
+    return 0 if merged['success'] else 1
+
+def _run_cli(args, make_coroutine):
+    """运行下载, 指定 --profile 时同时记录性能数据"""
+    if not args.profile:
+        return asyncio.run(make_coroutine())
+    return run_profiled(lambda: asyncio.run(make_coroutine()), args.profile)
 
 def main():
-    parser = argparse.ArgumentParser(description="从Google Sheets下载数据并保存为Excel文件")
-    parser.add_argument("spreadsheet_ids", nargs='+', help="需要下载的Google Spreadsheet的ID列表, 可以在URL中找到")
-    parser.add_argument("--output-dir", help="Excel文件的保存目录（不包含文件名）", required=True)
+    parser = argparse.ArgumentParser(description="从Google Sheets下载数据并保存为Excel/CSV/JSONL/Parquet文件")
+    parser.add_argument("spreadsheet_ids", nargs='*', help="需要下载的Google Spreadsheet的ID列表, 可以在URL中找到")
+    parser.add_argument("--ids-from", metavar="FILE",
+                        help="从文件读取spreadsheet ID或URL, 每行一个, 忽略空行和#注释; - 表示从标准输入读取")
+    parser.add_argument("--output-dir", help="输出文件的保存目录（不包含文件名）", required=True)
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help=f"同时下载的spreadsheet数量上限 (默认: {DEFAULT_MAX_CONCURRENCY})")
+    parser.add_argument("--fetch-mode", choices=FETCH_MODES, default=FETCH_MODE_BATCH,
+                        help="batch: 使用 values.batchGet 合并请求多个工作表; per-tab: 每个工作表单独请求")
+    parser.add_argument("--format", dest="output_format", choices=OUTPUT_FORMATS, default=FORMAT_XLSX,
+                        help="输出格式: xlsx(默认); csv 每个工作表一个文件; jsonl; parquet 每个工作表一个文件(需要pyarrow)")
+    parser.add_argument("--parquet-compression", choices=PARQUET_COMPRESSIONS, default=DEFAULT_PARQUET_COMPRESSION,
+                        help=f"Parquet压缩方式 (默认: {DEFAULT_PARQUET_COMPRESSION})")
+    parser.add_argument("--parquet-row-group-rows", type=int, default=DEFAULT_PARQUET_ROW_GROUP_ROWS,
+                        help=f"Parquet每个row group的行数 (默认: {DEFAULT_PARQUET_ROW_GROUP_ROWS})")
+    parser.add_argument("--streaming", action="store_true",
+                        help="使用write-only模式流式写入Excel, 适合行数很多的工作表")
+    parser.add_argument("--page-cells", type=int, default=DEFAULT_PAGE_CELLS,
+                        help=f"预计单元格数超过该值的工作表按行分页获取, 0表示不分页 (默认: {DEFAULT_PAGE_CELLS})")
+    parser.add_argument("--page-concurrency", type=int, default=DEFAULT_PAGE_CONCURRENCY,
+                        help=f"每个工作表同时在途的分页请求数 (默认: {DEFAULT_PAGE_CONCURRENCY})")
+    parser.add_argument("--requests-per-minute", type=int, default=DEFAULT_REQUESTS_PER_MINUTE,
+                        help=f"所有线程共享的每分钟请求数上限, 0表示不限流 (默认: {DEFAULT_REQUESTS_PER_MINUTE})")
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES,
+                        help=f"429/5xx和网络错误的最大重试次数 (默认: {DEFAULT_MAX_RETRIES})")
+    parser.add_argument("--metadata-ttl", type=int, default=DEFAULT_METADATA_TTL,
+                        help=f"元数据缓存的有效秒数, 0表示每次都重新获取 (默认: {DEFAULT_METADATA_TTL})")
+    parser.add_argument("--metadata-batch-size", type=int, default=DEFAULT_METADATA_BATCH_SIZE,
+                        help=f"下载开始前用multipart批量请求获取元数据, 每批的spreadsheet数(最多{MAX_METADATA_BATCH_SIZE}), "
+                             f"0表示每个spreadsheet单独请求 (默认: {DEFAULT_METADATA_BATCH_SIZE})")
+    parser.add_argument("--sync", action="store_true",
+                        help="增量同步: 内容与上次下载相同的文件不重新写入")
+    parser.add_argument("--transport", choices=TRANSPORTS, default=TRANSPORT_HTTPLIB2,
+                        help="httplib2: 每个线程独立连接; pooled: 所有线程共享keep-alive连接池并使用gzip")
+    parser.add_argument("--value-render", choices=VALUE_RENDERS, default=VALUE_RENDER_FORMATTED,
+                        help="formatted: 与界面显示一致的文本; typed: 数字和日期写为数值/日期单元格")
+    parser.add_argument("--writer-processes", type=int, default=0,
+                        help="生成输出文件的进程数, 0表示在下载线程中写入; 多核机器上可设为CPU核数")
+    parser.add_argument("--schedule", choices=SCHEDULES, default=SCHEDULE_LARGEST_FIRST,
+                        help="largest-first: 先获取所有元数据, 按预计单元格数从大到小开始下载; input: 按输入顺序")
+    parser.add_argument("--merge", choices=MERGE_MODES, default=MERGE_OFF,
+                        help="合并为一个输出: tabs 每个来源的工作表单独保留; concat 同名工作表按行拼接并在第一列加上来源")
+    parser.add_argument("--merge-name", default=DEFAULT_MERGE_NAME,
+                        help=f"合并输出的文件名, 不含扩展名 (默认: {DEFAULT_MERGE_NAME})")
+    parser.add_argument("--include-tabs", metavar="PATTERN", action="append", default=[],
+                        help="只下载名称匹配的工作表, 可以多次指定; 通配符 * ? [...], 以 re: 开头时为正则表达式")
+    parser.add_argument("--exclude-tabs", metavar="PATTERN", action="append", default=[],
+                        help="不下载名称匹配的工作表, 可以多次指定, 写法同 --include-tabs")
+    parser.add_argument("--range", dest="tab_ranges", metavar="TAB=A1", action="append", default=[],
+                        help="只获取工作表的指定范围, 例如 Sales=A1:F200 或 Log=2:500, 可以多次指定; 指定了范围的工作表总是下载")
+    parser.add_argument("--config", metavar="PATH",
+                        help="使用GUI配置文件中各Sheet条目保存的工作表筛选, 该条目的筛选替代命令行中的筛选")
+    parser.add_argument("--shard", metavar="i/N",
+                        help="多台主机分担一次下载: 按ID的哈希分为N份, 只下载第i份(从1开始); 各主机使用相同的ID列表")
+    parser.add_argument("--queue", metavar="DIR",
+                        help="多台主机共享的工作队列目录(放在网络文件系统上): 第一个worker用ID列表创建队列, "
+                             "之后的worker可以不指定ID; 每个worker领取未完成的ID, 崩溃的worker的项目在租约过期后被重新领取")
+    parser.add_argument("--lease-seconds", type=int, default=DEFAULT_LEASE_SECONDS,
+                        help=f"队列模式的租约有效期(秒), 运行中的worker自动续租 (默认: {DEFAULT_LEASE_SECONDS})")
+    parser.add_argument("--worker-name",
+                        help="分片/队列模式中的worker名称, 用于任务日志、同步状态和运行报告的文件名 "
+                             "(默认: 分片为 shard-i-of-N, 队列为主机名; 同一主机运行多个worker时需要分别指定)")
+    parser.add_argument("--merge-reports", action="store_true",
+                        help="合并输出目录中各worker的运行报告(gsheet_run_report.<worker>.json)后退出; "
+                             "指定 --queue 或ID列表时同时检查没有结果的ID")
+    parser.add_argument("--report", dest="report_path",
+                        help=f"运行报告(JSON)的保存路径 (默认: 输出目录中的 {REPORT_FILE})")
+    parser.add_argument("--resume", action="store_true",
+                        help="恢复输出目录中上次未完成的任务, 使用上次的ID列表和下载选项, 只下载未完成的spreadsheet")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default='INFO',
+                        help="日志级别, DEBUG 输出每个工作表和线程的处理过程 (默认: INFO)")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="保存性能数据: 以.json结尾时保存各阶段的Chrome trace (chrome://tracing 或 Perfetto 打开), "
+                             "否则保存所有线程合并的cProfile统计 (python -m pstats 打开)")
     
     args = parser.parse_args()
+    configure_logging(args.log_level)
+    if args.max_concurrency < 1:
+        parser.error("--max-concurrency 必须大于0")
+    if args.shard and args.queue:
+        parser.error("--shard 与 --queue 不能同时使用")
+    worker_name = args.worker_name
+    shard = None
+    try:
+        if args.shard:
+            shard = parse_shard(args.shard)
+            worker_name = worker_name or shard_worker_name(*shard)
+        queue = None
+        if args.queue:
+            worker_name = worker_name or default_worker_name()
+            queue = LeaseQueue(args.queue, worker_name, args.lease_seconds)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.merge_reports:
+        sys.exit(_merge_reports_cli(args, parser, queue))
+    if args.resume:
+        if args.spreadsheet_ids or args.ids_from:
+            parser.error("--resume 使用任务日志中的ID列表, 不需要再指定spreadsheet ID")
+        if queue is not None:
+            parser.error("队列模式不需要 --resume, 重新运行即可继续领取未完成的项目")
+        job = JobJournal(_resolve_output_dir(args.output_dir), worker_name).last_job()
+        if job is None:
+            parser.error(f"输出目录中没有可恢复的任务: {args.output_dir}")
+        options = job_options(job)
+        if options.merge != MERGE_OFF:
+            parser.error("合并模式的任务不能恢复, 请重新下载")
+        report = _run_cli(args, lambda: download_multi_google_sheet_async(
+            job['ids'], args.output_dir, max_concurrency=args.max_concurrency, options=options,
+            resume=True, report_path=args.report_path, worker_name=worker_name
+        ))
+        sys.exit(0 if report.success else 1)
+    lines = list(args.spreadsheet_ids)
+    if args.ids_from:
+        try:
+            lines.extend(_read_id_lines(args.ids_from))
+        except OSError as e:
+            parser.error(f"读取ID列表失败: {str(e)}")
+    # 接受ID或完整URL, 重复的ID只下载一次
+    spreadsheet_ids = [sheet_id for sheet_id, _ in parse_sheet_list(lines)]
+    if not spreadsheet_ids and queue is None:
+        parser.error("至少需要指定一个spreadsheet ID")
+    if shard is not None:
+        total = len(spreadsheet_ids)
+        spreadsheet_ids = shard_ids(spreadsheet_ids, *shard)
+        logger.info("[Shard] 分片 %s/%s: %s 个, 共 %s 个", shard[0], shard[1], len(spreadsheet_ids), total)
+    
+    if args.config and not os.path.exists(args.config):
+        parser.error(f"配置文件不存在: {args.config}")
     
     # for spreadsheet_id in args.spreadsheet_ids:
     #     download_google_sheet(spreadsheet_id, args.output_dir)
-    asyncio.run(download_multi_google_sheet_async(args.spreadsheet_ids, args.output_dir))
+    try:
+        tab_ranges = dict(parse_tab_range(item) for item in args.tab_ranges)
+        sheet_tab_filters = ConfigManager(args.config).tab_filters(spreadsheet_ids or None) if args.config else {}
+        options = DownloadOptions(
+            fetch_mode=args.fetch_mode,
+            output_format=args.output_format,
+            streaming=args.streaming,
+            parquet_compression=args.parquet_compression,
+            parquet_row_group_rows=args.parquet_row_group_rows,
+            page_cells=args.page_cells,
+            page_concurrency=args.page_concurrency,
+            requests_per_minute=args.requests_per_minute,
+            max_retries=args.max_retries,
+            metadata_ttl=args.metadata_ttl,
+            metadata_batch_size=args.metadata_batch_size,
+            sync=args.sync,
+            transport=args.transport,
+            writer_processes=args.writer_processes,
+            value_render=args.value_render,
+            schedule=args.schedule,
+            merge=args.merge,
+            merge_name=args.merge_name,
+            include_tabs=args.include_tabs,
+            exclude_tabs=args.exclude_tabs,
+            tab_ranges=tab_ranges,
+            sheet_tab_filters=sheet_tab_filters,
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    if options.merge != MERGE_OFF and worker_name:
+        parser.error("--merge 不能与 --shard/--queue 同时使用")
+    if shard is not None and not spreadsheet_ids:
+        # 列表较短时某些分片可能没有ID, 仍然写入报告, 合并报告时可以看到这个worker
+        report = RunReport(_resolve_output_dir(args.output_dir), worker=worker_name, finished_at=time.time())
+        report.save(args.report_path or worker_path(os.path.join(report.output_dir, REPORT_FILE), worker_name))
+        logger.info("[Shard] 分片 %s 中没有spreadsheet", args.shard)
+        sys.exit(0)
+    report = _run_cli(args, lambda: download_multi_google_sheet_async(
+        spreadsheet_ids, args.output_dir, max_concurrency=args.max_concurrency, options=options,
+        report_path=args.report_path, worker_name=worker_name, queue=queue
+    ))
+    # 有spreadsheet失败时以非0状态退出, 失败的ID见运行报告中的 failed_ids
+    sys.exit(0 if report.success else 1)
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
@@ -1,17 +1,209 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import asyncio
 from config_manager import ConfigManager
-from gsheet_to_excel_async import download_multi_google_sheet_async, get_sheets_service_v4
+from sheets_writers import OUTPUT_FORMATS
+from tracing import logger, configure_logging
+from download_progress import DownloadControl, ProgressTracker, EVENT_FILE_START, EVENT_TAB_DONE, EVENT_FILE_DONE
+import multiprocessing
 import threading
+import queue
+import sys
 import os
 
+# 下载相关的模块依赖googleapiclient、google-auth和openpyxl, 导入需要几百毫秒,
+# 第一次下载或认证时才导入, 启动时只加载Tk和配置
+
+
+def _downloader():
+    import gsheet_to_excel_async
+    return gsheet_to_excel_async
+
+
+def _reset_session():
+    # 还没有导入下载模块时也不存在会话, 不需要为此导入
+    downloader = sys.modules.get('gsheet_to_excel_async')
+    if downloader is not None:
+        downloader.reset_session()
+
+
+async def _download_job(sheet_ids, output_dir, options, resume, control):
+    # 第一次下载时在事件循环线程中导入下载模块, 界面线程不会卡住
+    downloader = _downloader()
+    return await downloader.download_multi_google_sheet_async(sheet_ids, output_dir, options=options,
+                                                              resume=resume, control=control)
+
+
+class _BackgroundLoop:
+    """在后台线程中一直运行的asyncio事件循环, 多次下载共用(认证会话同样在进程内复用)"""
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def submit(self, coroutine):
+        """提交协程, 返回 concurrent.futures.Future"""
+        import asyncio
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='gsheet-loop', daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+
+# 进度窗口每隔多少毫秒处理一次进度事件
+PROGRESS_POLL_MS = 100
+FILE_STATUS_TEXT = {
+    'queued': '等待', 'running': '下载中', 'downloaded': '完成', 'unchanged': '未变化',
+    'skipped': '已跳过', 'failed': '失败', 'cancelled': '已取消',
+}
+
+
+def _format_seconds(seconds):
+    if seconds is None:
+        return '--:--'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+class DownloadProgressWindow:
+    """下载进度窗口: 整体进度、吞吐量、剩余时间和每个文件的进度, 以及暂停/取消
+
+    后台线程产生的进度事件只放入队列, 由界面线程用 after() 定时取出处理,
+    所有Tk调用(包括结束时的消息框)都在界面线程中执行。
+    """
+
+    def __init__(self, app, title_text):
+        self.app = app
+        self.events = queue.Queue()
+        self.control = DownloadControl(on_event=self.events.put)
+        self.tracker = ProgressTracker()
+        self.future = None
+        self._dirty_files = set()
+        self._listed = False
+
+        self.window = tk.Toplevel(app.root)
+        self.window.title("下载进度")
+        self.window.geometry("560x420")
+        self.window.transient(app.root)
+        # 关闭窗口等同于取消
+        self.window.protocol("WM_DELETE_WINDOW", self.cancel)
+
+        self.status_label = ttk.Label(self.window, text=title_text)
+        self.status_label.pack(anchor=tk.W, padx=10, pady=(10, 2))
+        self.progress_bar = ttk.Progressbar(self.window, mode='determinate', maximum=1.0)
+        self.progress_bar.pack(fill=tk.X, padx=10, pady=2)
+        self.eta_label = ttk.Label(self.window, text="")
+        self.eta_label.pack(anchor=tk.W, padx=10, pady=2)
+        self.phase_label = ttk.Label(self.window, text="")
+        self.phase_label.pack(anchor=tk.W, padx=10, pady=2)
+
+        self.file_list = ttk.Treeview(self.window, columns=("title", "status", "tabs", "rows"),
+                                      show="headings", height=10)
+        for column, text, width in (("title", "文件", 240), ("status", "状态", 80), ("tabs", "工作表", 80),
+                                    ("rows", "行数", 90)):
+            self.file_list.heading(column, text=text)
+            self.file_list.column(column, width=width)
+        self.file_list.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+        button_frame = ttk.Frame(self.window)
+        button_frame.pack(pady=5)
+        self.pause_button = ttk.Button(button_frame, text="暂停", command=self.toggle_pause)
+        self.pause_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(button_frame, text="取消", command=self.cancel)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+
+    def start(self, sheet_ids, output_dir, options, resume=False):
+        self.future = self.app.background_loop.submit(
+            _download_job(sheet_ids, output_dir, options, resume, self.control))
+        # 回调在事件循环线程中执行, 同样只放入队列
+        self.future.add_done_callback(lambda future: self.events.put({'event': 'finished'}))
+        self.window.after(PROGRESS_POLL_MS, self.poll)
+
+    def toggle_pause(self):
+        if self.control.paused:
+            self.control.resume()
+            self.pause_button.configure(text="暂停")
+        else:
+            self.control.pause()
+            self.pause_button.configure(text="继续")
+
+    def cancel(self):
+        if self.future is None or self.future.done():
+            return
+        self.control.cancel()
+        self.status_label.configure(text="正在取消, 等待进行中的请求结束...")
+        self.pause_button.configure(state='disabled')
+        self.cancel_button.configure(state='disabled')
+
+    def poll(self):
+        finished = False
+        # 每次取出所有积压的事件, 界面只按最新状态刷新一次
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if event['event'] == 'finished':
+                finished = True
+                continue
+            self.tracker.apply(event)
+            if event['event'] in (EVENT_FILE_START, EVENT_TAB_DONE, EVENT_FILE_DONE):
+                self._dirty_files.add(event['spreadsheet_id'])
+        self.refresh()
+        if finished:
+            self.finish()
+        else:
+            self.window.after(PROGRESS_POLL_MS, self.poll)
+
+    def refresh(self):
+        tracker = self.tracker
+        # 下载顺序确定后(plan事件)一次列出所有文件
+        if tracker.order and not self._listed:
+            self._listed = True
+            for spreadsheet_id in tracker.order:
+                self.file_list.insert('', tk.END, iid=spreadsheet_id, values=(spreadsheet_id, '等待', '', ''))
+        for spreadsheet_id in self._dirty_files:
+            state = tracker.files.get(spreadsheet_id)
+            if state is None or not self.file_list.exists(spreadsheet_id):
+                continue
+            tabs = f"{state['tabs_done']}/{state['tabs']}" if state.get('tabs') else ''
+            self.file_list.item(spreadsheet_id, values=(
+                state.get('title') or spreadsheet_id, FILE_STATUS_TEXT.get(state['status'], state['status']),
+                tabs, f"{state['rows']:,}"))
+        self._dirty_files.clear()
+
+        snapshot = tracker.snapshot()
+        if not self.control.cancelled:
+            if not tracker.order:
+                text = "正在获取元数据..."
+            else:
+                text = (f"文件 {snapshot['files_done']}/{snapshot['files_total']}  "
+                        f"工作表 {snapshot['tabs_done']}  行 {snapshot['rows']:,}  "
+                        f"{snapshot['megabytes']:.1f} MB ({snapshot['megabytes_per_second']:.2f} MB/s)")
+            if self.control.paused:
+                text += "  (已暂停)"
+            self.status_label.configure(text=text)
+        self.progress_bar.configure(value=snapshot['fraction'])
+        self.eta_label.configure(text=f"已用 {_format_seconds(snapshot['elapsed_seconds'])}  "
+                                      f"剩余约 {_format_seconds(snapshot['eta_seconds'])}")
+        phases = snapshot['phase_seconds']
+        self.phase_label.configure(text=f"已完成文件的耗时合计: 元数据 {phases['metadata']:.1f}s  "
+                                        f"获取 {phases['fetch']:.1f}s  写入 {phases['write']:.1f}s  "
+                                        f"重试 {snapshot['retries']} 次  限流 {snapshot['throttled']} 次")
+
+    def finish(self):
+        self.window.destroy()
+        self.app.download_finished(self.future)
+
 class GSheetDownloaderGUI:
     def __init__(self):
         self.root = tk.Tk()
         self.root.title("Google Sheet 下载器")
         self.config_manager = ConfigManager()
         self.download_buttons = []  # 用于存储下载相关的按钮
+        self.background_loop = _BackgroundLoop()
+        self.progress_window = None
         self.setup_ui()
         self.load_recent_sheets()
         self.update_auth_status()  # 添加认证状态检查
@@ -23,6 +215,7 @@ class GSheetDownloaderGUI:
         ttk.Label(url_frame, text="Sheet URL:").pack(side=tk.LEFT)
         self.url_entry = ttk.Entry(url_frame)
         self.url_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        ttk.Button(url_frame, text="批量导入", command=self.import_sheets).pack(side=tk.RIGHT)
         ttk.Button(url_frame, text="添加", command=self.add_sheet).pack(side=tk.RIGHT)
 
         # 已添加的Sheets列表
@@ -59,6 +252,16 @@ class GSheetDownloaderGUI:
         self.dir_entry.insert(0, self.config_manager.config.get('output_dir', ''))
         ttk.Button(dir_frame, text="选择", command=self.select_output_dir).pack(side=tk.RIGHT)
 
+        # 输出格式选择
+        format_frame = ttk.Frame(self.root)
+        format_frame.pack(padx=10, pady=5, fill=tk.X)
+        ttk.Label(format_frame, text="输出格式:").pack(side=tk.LEFT)
+        self.format_var = tk.StringVar(value=self.config_manager.config.get('output_format', 'xlsx'))
+        format_combo = ttk.Combobox(format_frame, textvariable=self.format_var, values=OUTPUT_FORMATS,
+                                    state='readonly', width=10)
+        format_combo.pack(side=tk.LEFT, padx=5)
+        format_combo.bind("<<ComboboxSelected>>", self.select_output_format)
+
         # 下载按钮框架
         download_frame = ttk.Frame(self.root)
         download_frame.pack(pady=10)
@@ -71,23 +274,52 @@ class GSheetDownloaderGUI:
         download_selected_btn.pack(side=tk.LEFT, padx=5)
         self.download_buttons.append(download_selected_btn)
         
+        resume_btn = ttk.Button(download_frame, text="恢复上次任务", command=self.resume_last_job)
+        resume_btn.pack(side=tk.LEFT, padx=5)
+        self.download_buttons.append(resume_btn)
+        
         settings_button = ttk.Button(download_frame, text="认证设置", command=self.show_auth_settings)
         settings_button.pack(side=tk.LEFT, padx=5)
 
     def add_sheet(self):
         url = self.url_entry.get().strip()
         if url:
-            self.config_manager.add_sheet(url)
-            self.load_recent_sheets()
+            sheet = self.config_manager.add_sheet(url)
+            if sheet is not None:
+                self._insert_sheet(sheet)
             self.url_entry.delete(0, tk.END)
 
+    def import_sheets(self):
+        """从文本文件批量添加, 每行一个URL或ID"""
+        file_path = filedialog.askopenfilename(
+            title="选择Sheet列表文件",
+            filetypes=[("文本文件", "*.txt *.csv"), ("所有文件", "*.*")]
+        )
+        if not file_path:
+            return
+        try:
+            with open(file_path, 'r', encoding='utf-8-sig') as f:
+                lines = f.read().splitlines()
+        except OSError as e:
+            messagebox.showerror("错误", f"读取文件失败: {str(e)}")
+            return
+        added = self.config_manager.add_sheets(lines)
+        for sheet in added:
+            self._insert_sheet(sheet)
+        messagebox.showinfo("完成", f"添加了 {len(added)} 个Sheet, 重复或无法识别的已跳过")
+
+    def _insert_sheet(self, sheet, index=tk.END):
+        # 以sheet ID作为行的iid, 修改和删除时直接定位, 不需要重建整个列表
+        self.sheet_list.insert('', index, iid=sheet['id'], values=(sheet['url'],))
+
     def load_recent_sheets(self):
         # 清空现有列表
-        for item in self.sheet_list.get_children():
-            self.sheet_list.delete(item)
+        self.sheet_list.delete(*self.sheet_list.get_children())
         # 加载配置中的sheets
         for sheet in self.config_manager.config['recent_sheets']:
-            self.sheet_list.insert('', tk.END, values=(sheet['url'],))
+            # 旧版本的配置中可能有重复的ID
+            if sheet.get('id') and not self.sheet_list.exists(sheet['id']):
+                self._insert_sheet(sheet)
 
     def select_output_dir(self):
         dir_path = filedialog.askdirectory()
@@ -97,81 +329,86 @@ class GSheetDownloaderGUI:
             self.config_manager.config['output_dir'] = dir_path
             self.config_manager.save_config()
 
-    async def download_with_progress(self, sheet_ids, output_dir):
-        try:
-            await download_multi_google_sheet_async(sheet_ids, output_dir)
-            self.root.after(0, lambda: messagebox.showinfo("完成", "下载完成！"))
-        except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("错误", f"下载出错: {str(e)}"))
+    def select_output_format(self, event=None):
+        self.config_manager.config['output_format'] = self.format_var.get()
+        self.config_manager.save_config()
+
+    def download_options(self):
+        from download_options import DownloadOptions
+        return DownloadOptions(output_format=self.format_var.get(),
+                               sheet_tab_filters=self.config_manager.tab_filters())
+
+    def show_report(self, report):
+        if report.success:
+            messagebox.showinfo("完成", "下载完成！")
+            return
+        failed = report.failed
+        lines = [f"{result.spreadsheet_id}: {result.error}" for result in failed[:5]]
+        if len(failed) > 5:
+            lines.append(f"... 共 {len(failed)} 个")
+        messagebox.showwarning("部分失败", f"{len(failed)}个Sheet下载失败, 其余已完成:\n" + "\n".join(lines) +
+                               "\n\n可以点击\"恢复上次任务\"重试失败的Sheet")
+
+    def start_job(self, sheet_ids, output_dir, options, resume=False, title_text="正在准备下载..."):
+        if self.progress_window is not None:
+            messagebox.showwarning("提示", "已有下载任务正在进行")
+            return
+        # 任务进行中禁用下载按钮, 主窗口的其他操作不受影响
+        for btn in self.download_buttons:
+            btn.configure(state='disabled')
+        self.progress_window = DownloadProgressWindow(self, title_text)
+        self.progress_window.start(sheet_ids, output_dir, options, resume)
+
+    def download_finished(self, future):
+        """在界面线程中处理下载结果"""
+        self.progress_window = None
+        self.update_auth_status()
+        error = future.exception()
+        if error is not None:
+            logger.error("[GUI] 下载出错: %s", error)
+            messagebox.showerror("错误", f"下载出错: {str(error)}")
+            return
+        report = future.result()
+        logger.info("[GUI] 下载完成")
+        if report.cancelled:
+            done = sum(1 for result in report.results if result.ok)
+            messagebox.showinfo("已取消", f"下载已取消, 已完成 {done} 个Sheet\n\n"
+                                         "可以点击\"恢复上次任务\"继续下载未完成的Sheet")
+            return
+        self.show_report(report)
 
     def start_download(self):
-        print("[GUI] 开始下载全部")
+        logger.info("[GUI] 开始下载全部")
         output_dir = self.dir_entry.get().strip()
-        print(f"[GUI] 输出目录: {output_dir}")
         
         # 确保输出目录是有效的
         if not output_dir:
             output_dir = os.path.join(os.path.expanduser("~"), "Downloads")
-            print(f"[GUI] 使用默认下载目录: {output_dir}")
+            logger.info("[GUI] 使用默认下载目录: %s", output_dir)
             self.dir_entry.delete(0, tk.END)
             self.dir_entry.insert(0, output_dir)
         
         # 转换为绝对路径
         output_dir = os.path.abspath(output_dir)
-        print(f"[GUI] 使用绝对路径: {output_dir}")
+        logger.debug("[GUI] 使用绝对路径: %s", output_dir)
         
         try:
             os.makedirs(output_dir, exist_ok=True)
-            print(f"[GUI] 输出目录已确认: {output_dir}")
         except Exception as e:
-            print(f"[GUI] 创建目录失败: {str(e)}")
+            logger.error("[GUI] 创建目录失败: %s", e)
             messagebox.showerror("错误", f"创建输出目录失败: {str(e)}")
             return
 
         # 从配置中获取sheet_ids
-        sheet_ids = []
-        print(f"[GUI] 当前配置中的sheets: {self.config_manager.config['recent_sheets']}")
-        
-        for sheet in self.config_manager.config['recent_sheets']:
-            if sheet.get('id'):
-                sheet_ids.append(sheet['id'])
-                print(f"[GUI] 添加sheet_id: {sheet['id']}")
-        
-        print(f"[GUI] 最终的sheet_ids列表: {sheet_ids}")
+        sheet_ids = self.config_manager.sheet_ids()
+        logger.info("[GUI] 共 %s 个sheet", len(sheet_ids))
         
         if not sheet_ids:
-            print("[GUI] 没有找到有效的sheet_ids")
+            logger.warning("[GUI] 没有找到有效的sheet_ids")
             messagebox.showerror("错误", "请至少添加一个有效的Sheet")
             return
 
-        # 创建并显示进度窗口
-        progress_window = tk.Toplevel(self.root)
-        progress_window.title("下载进度")
-        progress_window.geometry("300x150")
-        progress_window.transient(self.root)
-        progress_window.grab_set()
-        
-        info_label = ttk.Label(progress_window, text="正在准备下载...")
-        info_label.pack(pady=10)
-        
-        progress_bar = ttk.Progressbar(progress_window, mode='indeterminate')
-        progress_bar.pack(fill=tk.X, padx=20, pady=10)
-        progress_bar.start()
-
-        def run_download():
-            try:
-                print(f"[GUI] 开始异步下载，参数：sheet_ids={sheet_ids}, output_dir={output_dir}")
-                asyncio.run(download_multi_google_sheet_async(sheet_ids, output_dir))
-                print("[GUI] 下载完成")
-                progress_window.after(0, progress_window.destroy)
-                messagebox.showinfo("完成", "下载完成！")
-            except Exception as e:
-                print(f"[GUI] 下载出错: {str(e)}")
-                progress_window.after(0, progress_window.destroy)
-                messagebox.showerror("错误", f"下载出错: {str(e)}")
-
-        thread = threading.Thread(target=run_download, daemon=True)
-        thread.start()
+        self.start_job(sheet_ids, output_dir, self.download_options())
 
     def show_context_menu(self, event):
         item = self.sheet_list.identify_row(event.y)
@@ -184,30 +421,58 @@ class GSheetDownloaderGUI:
         if not selected:
             return
             
-        item = selected[0]
-        url = self.sheet_list.item(item)['values'][0]
+        from tab_selection import TabSelection, parse_tab_range, split_list
+        sheet_id = selected[0]
+        sheet = self.config_manager.get_sheet(sheet_id)
         
         # 创建编辑对话框
         dialog = tk.Toplevel(self.root)
         dialog.title("编辑 Sheet")
-        dialog.geometry("400x100")
+        dialog.geometry("420x300")
         
         ttk.Label(dialog, text="Sheet URL:").pack(padx=5, pady=5)
         entry = ttk.Entry(dialog, width=50)
-        entry.insert(0, url)
+        entry.insert(0, sheet['url'])
         entry.pack(padx=5, pady=5)
         
+        # 工作表筛选, 多个值用分号分隔; 为空时下载所有可见工作表
+        filter_entries = {}
+        for key, label, value in (
+            ('include_tabs', "只下载这些工作表 (通配符 * ?, 或 re:正则):", ';'.join(sheet.get('include_tabs', []))),
+            ('exclude_tabs', "排除这些工作表:", ';'.join(sheet.get('exclude_tabs', []))),
+            ('tab_ranges', "只获取指定范围 (工作表名=A1:F200):",
+             ';'.join(f"{name}={a1_range}" for name, a1_range in sheet.get('tab_ranges', {}).items())),
+        ):
+            ttk.Label(dialog, text=label).pack(padx=5, anchor=tk.W)
+            filter_entry = ttk.Entry(dialog, width=50)
+            filter_entry.insert(0, value)
+            filter_entry.pack(padx=5, pady=(0, 5))
+            filter_entries[key] = filter_entry
+        
         def save_changes():
             new_url = entry.get().strip()
             if new_url:
                 # 更新配置
-                for sheet in self.config_manager.config['recent_sheets']:
-                    if sheet['url'] == url:
-                        sheet['url'] = new_url
-                        sheet['id'] = self.config_manager.extract_sheet_id(new_url)
-                        break
-                self.config_manager.save_config()
-                self.load_recent_sheets()
+                try:
+                    include_tabs = split_list(filter_entries['include_tabs'].get())
+                    exclude_tabs = split_list(filter_entries['exclude_tabs'].get())
+                    tab_ranges = dict(parse_tab_range(item) for item in split_list(filter_entries['tab_ranges'].get()))
+                    # 先检查筛选条件, 无效时不修改URL
+                    TabSelection(include_tabs, exclude_tabs, tab_ranges)
+                    with self.config_manager.batch():
+                        sheet = self.config_manager.update_sheet(sheet_id, new_url)
+                        self.config_manager.set_tab_filters(sheet['id'], include_tabs, exclude_tabs, tab_ranges)
+                except ValueError as e:
+                    messagebox.showerror("错误", str(e), parent=dialog)
+                    return
+                if sheet['id'] == sheet_id:
+                    self.sheet_list.item(sheet_id, values=(sheet['url'],))
+                else:
+                    # iid不能修改, 在原位置替换为新的行
+                    index = self.sheet_list.index(sheet_id)
+                    self.sheet_list.delete(sheet_id)
+                    self._insert_sheet(sheet, index)
+                    self.sheet_list.selection_set(sheet['id'])
                 dialog.destroy()
         
         ttk.Button(dialog, text="保存", command=save_changes).pack(pady=5)
@@ -217,17 +482,10 @@ class GSheetDownloaderGUI:
         if not selected:
             return
             
-        if messagebox.askyesno("确认", "确定要删除选中的 Sheet 吗？"):
-            item = selected[0]
-            url = self.sheet_list.item(item)['values'][0]
-            
+        if messagebox.askyesno("确认", f"确定要删除选中的 {len(selected)} 个 Sheet 吗？"):
             # 从配置中删除
-            self.config_manager.config['recent_sheets'] = [
-                sheet for sheet in self.config_manager.config['recent_sheets']
-                if sheet['url'] != url
-            ]
-            self.config_manager.save_config()
-            self.load_recent_sheets()
+            self.config_manager.remove_sheets(selected)
+            self.sheet_list.delete(*selected)
 
     def download_selected(self):
         selected = self.sheet_list.selection()
@@ -246,44 +504,38 @@ class GSheetDownloaderGUI:
                 messagebox.showerror("错误", f"创建输出目录失败: {str(e)}")
                 return
 
-        # 从配置中获取选中项的sheet_ids
-        sheet_ids = []
-        recent_sheets = {sheet['url']: sheet['id'] for sheet in self.config_manager.config['recent_sheets']}
-        
-        for item in selected:
-            url = self.sheet_list.item(item)['values'][0]
-            if url in recent_sheets:
-                sheet_ids.append(recent_sheets[url])
+        # 列表中每行的iid就是sheet ID
+        sheet_ids = list(selected)
         
         if not sheet_ids:
             messagebox.showerror("错误", "无法获取选中Sheet的ID")
             return
 
-        # 创建进度窗口
-        progress_window = tk.Toplevel(self.root)
-        progress_window.title("下载进度")
-        progress_window.geometry("300x150")
-        progress_window.transient(self.root)
-        progress_window.grab_set()
-        
-        info_label = ttk.Label(progress_window, text="正在准备下载...")
-        info_label.pack(pady=10)
-        
-        progress_bar = ttk.Progressbar(progress_window, mode='indeterminate')
-        progress_bar.pack(fill=tk.X, padx=20, pady=10)
-        progress_bar.start()
+        self.start_job(sheet_ids, output_dir, self.download_options())
 
-        def run_download():
-            try:
-                asyncio.run(download_multi_google_sheet_async(sheet_ids, output_dir))
-                progress_window.after(0, progress_window.destroy)
-                messagebox.showinfo("完成", "下载完成！")
-            except Exception as e:
-                progress_window.after(0, progress_window.destroy)
-                messagebox.showerror("错误", f"下载出错: {str(e)}")
+    def resume_last_job(self):
+        from job_journal import JobJournal, job_options
+        output_dir = self.dir_entry.get().strip()
+        if not output_dir:
+            output_dir = os.path.join(os.path.expanduser("~"), "Downloads")
+        output_dir = os.path.abspath(output_dir)
+
+        job = JobJournal(output_dir).last_job()
+        if job is None:
+            messagebox.showinfo("提示", f"输出目录中没有可恢复的任务: {output_dir}")
+            return
+        if job['finished']:
+            messagebox.showinfo("提示", "上次任务已全部完成")
+            return
+        try:
+            options = job_options(job)
+        except ValueError as e:
+            messagebox.showerror("错误", f"任务日志中的下载选项无效: {str(e)}")
+            return
+        sheet_ids = job['ids']
+        logger.info("[GUI] 恢复上次任务: %s个sheet, 已完成 %s 个", len(sheet_ids), len(job['done']))
 
-        thread = threading.Thread(target=run_download, daemon=True)
-        thread.start()
+        self.start_job(sheet_ids, output_dir, options, resume=True, title_text="正在恢复上次任务...")
 
     def update_auth_status(self):
         """更新认证状态和按钮状态"""
@@ -328,6 +580,7 @@ class GSheetDownloaderGUI:
                         os.remove(creds_path)
                     if os.path.exists(token_path):
                         os.remove(token_path)
+                    _reset_session()
                     messagebox.showinfo("成功", "认证信息已删除")
                     self.update_auth_status()
                     dialog.destroy()
@@ -365,6 +618,7 @@ class GSheetDownloaderGUI:
                     # 设置环境变量
                     os.environ['GCP_CREDENTIALS_JSON'] = creds_path
                     os.environ['GCP_TOKEN_JSON'] = os.path.join(app_data_dir, "token.json")
+                    _reset_session()
                     
                     # 关闭当前窗口，打开认证窗口
                     dialog.destroy()
@@ -391,7 +645,7 @@ class GSheetDownloaderGUI:
         
         def start_auth():
             try:
-                service = get_sheets_service_v4()
+                service = _downloader().get_sheets_service_v4()
                 dialog.after(0, lambda: self.auth_success(dialog))
             except Exception as e:
                 dialog.after(0, lambda: messagebox.showerror("错误", f"认证失败: {str(e)}"))
@@ -405,8 +659,12 @@ class GSheetDownloaderGUI:
         messagebox.showinfo("成功", "认证成功！")
 
 def main():
+    # 下载过程的日志输出到控制台
+    configure_logging('INFO')
     app = GSheetDownloaderGUI()
     app.root.mainloop()
 
 if __name__ == "__main__":
+    # 打包后的程序启动写入进程时需要
+    multiprocessing.freeze_support()
     main() 
\ No newline at end of file
@@ -0,0 +1,51 @@
+import httplib2
+import requests
+from google.auth.transport.requests import AuthorizedSession
+from requests.adapters import HTTPAdapter
+
+TRANSPORT_HTTPLIB2 = 'httplib2'
+TRANSPORT_POOLED = 'pooled'
+TRANSPORTS = (TRANSPORT_HTTPLIB2, TRANSPORT_POOLED)
+# 单个请求的超时时间(秒)
+DEFAULT_TIMEOUT = 120
+
+
+class PooledHttp:
+    """兼容 httplib2.Http.request 接口的传输层, 供googleapiclient使用
+
+    基于requests的连接池: 所有工作线程共享同一组keep-alive连接, 连接数上限为 pool_size,
+    并请求gzip压缩的响应。凭证过期时由AuthorizedSession自动刷新。
+    """
+
+    def __init__(self, creds, pool_size, timeout=DEFAULT_TIMEOUT):
+        # googleapiclient的批量请求通过 http.credentials 获取凭证
+        self.credentials = creds
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.session = AuthorizedSession(creds)
+        # pool_block: 连接用完时等待空闲连接, 而不是临时创建用完即关闭的连接
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['Accept-Encoding'] = 'gzip'
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5,
+                connection_type=None):
+        try:
+            response = self.session.request(method, uri, data=body, headers=headers, timeout=self.timeout)
+        except requests.Timeout as e:
+            # 转换为内置的网络异常, 与httplib2传输层一样由请求执行器重试
+            raise TimeoutError(str(e)) from e
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+            raise ConnectionError(str(e)) from e
+        info = {name.lower(): value for name, value in response.headers.items()}
+        info['status'] = str(response.status_code)
+        # requests已经解压了响应内容, 原始的编码和长度不再适用
+        info.pop('content-encoding', None)
+        info.pop('content-length', None)
+        resp = httplib2.Response(info)
+        resp.reason = response.reason
+        return resp, response.content
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,127 @@
+import dataclasses
+import json
+import os
+import threading
+import time
+import uuid
+from download_options import DownloadOptions
+from work_sharding import worker_path
+
+# 保存在输出目录中的任务日志, 每行一条JSON记录, 只追加写入
+JOURNAL_FILE = ".gsheet_job.jsonl"
+
+
+class JobJournal:
+    """批量下载的检查点日志: 记录任务参数、每个工作表和每个spreadsheet的完成情况
+
+    记录类型:
+      job      新任务开始: spreadsheet ID列表和下载选项
+      tab      一个工作表已写入: 行数和内容哈希
+      done     一个spreadsheet已保存: 输出路径和内容指纹
+      failed   一个spreadsheet下载失败
+      finished 整个任务结束
+    进程中途退出时, 日志中已有的记录仍然有效, 恢复时只重新下载没有 done 记录的spreadsheet。
+    """
+
+    def __init__(self, output_dir, worker_name=None):
+        # 多个worker(分片)共用输出目录时, 每个worker使用自己的日志文件
+        self.path = worker_path(os.path.join(output_dir, JOURNAL_FILE), worker_name)
+        self._lock = threading.Lock()
+        self._file = None
+
+    @staticmethod
+    def _read_records(path):
+        records = []
+        if not os.path.exists(path):
+            return records
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # 进程退出时最后一行可能只写了一半
+                    continue
+        return records
+
+    def last_job(self):
+        """返回最近一次任务 {'job_id', 'ids', 'options', 'done': {id: 输出路径}, 'finished'}, 没有时返回None"""
+        job = None
+        for record in self._read_records(self.path):
+            event = record.get('event')
+            if event == 'job':
+                job = {'job_id': record['job_id'], 'ids': record['ids'], 'options': record.get('options', {}),
+                       'done': {}, 'finished': False}
+            elif job is None:
+                continue
+            elif event == 'done':
+                job['done'][record['id']] = record['output_path']
+            elif event == 'finished':
+                job['finished'] = True
+        return job
+
+    def pending_ids(self, spreadsheet_ids):
+        """恢复任务时需要重新下载的ID: 没有 done 记录, 或记录的输出文件已不存在"""
+        job = self.last_job()
+        done = job['done'] if job is not None else {}
+        return [spreadsheet_id for spreadsheet_id in spreadsheet_ids
+                if not (spreadsheet_id in done and os.path.exists(done[spreadsheet_id]))]
+
+    def start(self, spreadsheet_ids, options, resume=False):
+        """开始写入日志; resume为False时新建任务(覆盖旧日志), 为True时追加到上次任务之后"""
+        with self._lock:
+            job = self.last_job() if resume else None
+            if job is None:
+                self._file = open(self.path, 'w', encoding='utf-8')
+                self._append({'event': 'job', 'job_id': uuid.uuid4().hex, 'ids': list(spreadsheet_ids),
+                              'options': dataclasses.asdict(options)}, sync=True)
+            else:
+                self._file = open(self.path, 'a', encoding='utf-8')
+                if not self._ends_with_newline():
+                    # 结束上次写了一半的行, 新记录从新的一行开始
+                    self._file.write('\n')
+                self._append({'event': 'resume', 'job_id': job['job_id']}, sync=True)
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def _append(self, record, sync=False):
+        record['time'] = time.time()
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    def tab_done(self, spreadsheet_id, sheet_name, rows, digest):
+        with self._lock:
+            self._append({'event': 'tab', 'id': spreadsheet_id, 'sheet': sheet_name, 'rows': rows,
+                          'hash': digest})
+
+    def done(self, spreadsheet_id, output_path, fingerprint):
+        with self._lock:
+            self._append({'event': 'done', 'id': spreadsheet_id, 'output_path': output_path,
+                          'fingerprint': fingerprint}, sync=True)
+
+    def failed(self, spreadsheet_id, error):
+        with self._lock:
+            self._append({'event': 'failed', 'id': spreadsheet_id, 'error': error}, sync=True)
+
+    def finish(self):
+        with self._lock:
+            self._append({'event': 'finished'}, sync=True)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def job_options(job):
+    """按任务日志中记录的选项重建DownloadOptions, 忽略当前版本不再支持的字段"""
+    names = {field.name for field in dataclasses.fields(DownloadOptions)}
+    return DownloadOptions(**{name: value for name, value in job['options'].items() if name in names})
@@ -0,0 +1,359 @@
+import csv
+import json
+import os
+import re
+import threading
+from sheets_writers import (
+    FORMAT_XLSX, FORMAT_CSV, FORMAT_JSONL, ParquetTabsWriter, output_path_for, replace_atomically, safe_filename,
+    discard_write_only_workbook, temp_path_for, _remove_quietly, _json_default
+)
+from tab_transfer import encode_tab, decode_chunks
+from tracing import logger
+
+# off: 每个spreadsheet一个输出文件
+# tabs: 合并为一个输出, 每个来源的每个工作表单独一个工作表(或文件), 命名为 "来源 - 工作表"
+# concat: 同名工作表按行拼接为一个工作表, 第一行为表头, 第一列为来源; 之后来源的表头行被跳过
+MERGE_OFF = 'off'
+MERGE_TABS = 'tabs'
+MERGE_CONCAT = 'concat'
+MERGE_MODES = (MERGE_OFF, MERGE_TABS, MERGE_CONCAT)
+DEFAULT_MERGE_NAME = 'merged'
+# concat模式中来源列的列名
+SOURCE_COLUMN = 'source'
+
+# Excel工作表名最多31个字符, 不能包含这些字符
+_MAX_XLSX_SHEET_NAME = 31
+_UNSAFE_SHEET_NAME_CHARS = re.compile(r'[\[\]:*?/\\]')
+
+
+class _AppendSink:
+    """可以多次向同一个工作表追加行的输出, 只在持有 MergedOutput 的锁时调用"""
+    max_name_length = None
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self._targets = {}
+        self._used = set()
+
+    def _clean(self, name):
+        return safe_filename(name)
+
+    def target(self, name):
+        """name 在输出中对应的工作表名/文件名: 替换不允许的字符并截断, 不区分大小写地保证不重复"""
+        target = self._targets.get(name)
+        if target is not None:
+            return target
+        base = self._clean(name)
+        target = base[:self.max_name_length]
+        number = 2
+        while target.lower() in self._used:
+            suffix = f" ({number})"
+            limit = None if self.max_name_length is None else self.max_name_length - len(suffix)
+            target = base[:limit] + suffix
+            number += 1
+        self._used.add(target.lower())
+        self._targets[name] = target
+        return target
+
+    def append(self, target, rows):
+        """追加行, 返回行数"""
+        raise NotImplementedError
+
+    def finish(self, target):
+        """target 之后不会再追加"""
+
+    def close(self):
+        raise NotImplementedError
+
+    def discard(self):
+        raise NotImplementedError
+
+
+class _XlsxSink(_AppendSink):
+    """write-only Workbook: 各工作表的行写入各自的临时文件, 可以交替追加"""
+    max_name_length = _MAX_XLSX_SHEET_NAME
+
+    def __init__(self, output_path):
+        from openpyxl import Workbook
+        super().__init__(output_path)
+        self._wb = Workbook(write_only=True)
+        self._sheets = {}
+
+    def _clean(self, name):
+        return _UNSAFE_SHEET_NAME_CHARS.sub('_', name).strip("'") or '_'
+
+    def append(self, target, rows):
+        ws = self._sheets.get(target)
+        if ws is None:
+            ws = self._sheets[target] = self._wb.create_sheet(target)
+        count = 0
+        for row in rows:
+            ws.append(row)
+            count += 1
+        return count
+
+    def close(self):
+        return replace_atomically(self.output_path, self._wb.save)
+
+    def discard(self):
+        discard_write_only_workbook(self._wb)
+        self._wb = None
+
+
+class _JsonlSink(_AppendSink):
+    """所有工作表写入同一个JSON Lines文件, 每行 {"sheet": 工作表名, "values": [...]}"""
+
+    def __init__(self, output_path):
+        super().__init__(output_path)
+        self._tmp_path = temp_path_for(output_path)
+        self._file = open(self._tmp_path, 'w', encoding='utf-8')
+
+    def _clean(self, name):
+        return name
+
+    def append(self, target, rows):
+        prefix = '{"sheet": ' + json.dumps(target, ensure_ascii=False) + ', "values": '
+        write = self._file.write
+        count = 0
+        for row in rows:
+            write(prefix)
+            write(json.dumps(row, ensure_ascii=False, default=_json_default))
+            write('}\n')
+            count += 1
+        return count
+
+    def close(self):
+        self._file.close()
+        os.replace(self._tmp_path, self.output_path)
+        return self.output_path
+
+    def discard(self):
+        self._file.close()
+        _remove_quietly(self._tmp_path)
+
+
+class _TabFilesSink(_AppendSink):
+    """每个工作表一个文件, 放在输出目录中; 先写临时文件, close() 时统一替换"""
+    extension = ''
+
+    def __init__(self, output_path):
+        super().__init__(output_path)
+        self._tmp_paths = {}
+
+    def _target_path(self, target):
+        return os.path.join(self.output_path, f"{target}.{self.extension}")
+
+    def _tmp_path(self, target):
+        tmp_path = self._tmp_paths.get(target)
+        if tmp_path is None:
+            os.makedirs(self.output_path, exist_ok=True)
+            tmp_path = self._tmp_paths[target] = temp_path_for(self._target_path(target))
+        return tmp_path
+
+    def close(self):
+        for target, tmp_path in self._tmp_paths.items():
+            os.replace(tmp_path, self._target_path(target))
+        return self.output_path
+
+    def discard(self):
+        for tmp_path in self._tmp_paths.values():
+            _remove_quietly(tmp_path)
+
+
+class _CsvSink(_TabFilesSink):
+    extension = 'csv'
+
+    def append(self, target, rows):
+        count = 0
+        # 每次追加时打开文件, 工作表很多时不会同时占用大量文件句柄
+        with open(self._tmp_path(target), 'a', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        return count
+
+
+class _ParquetSink(_TabFilesSink):
+    """第一次追加的第一行作为列名, 每个文件累积 row_group_rows 行写入一个row group"""
+    extension = 'parquet'
+
+    def __init__(self, output_path, compression, row_group_rows):
+        super().__init__(output_path)
+        # 复用按列构造 pyarrow.Table 的逻辑; 没有安装pyarrow时在这里抛出ValueError
+        self._tables = ParquetTabsWriter(output_path, compression, row_group_rows)
+        self._files = {}
+
+    def append(self, target, rows):
+        state = self._files.get(target)
+        rows = iter(rows)
+        count = 0
+        if state is None:
+            header = next(rows, None)
+            if header is None:
+                return 0
+            count = 1
+            names = ParquetTabsWriter._column_names(header, len(header))
+            tables = self._tables
+            writer = tables._pq.ParquetWriter(
+                self._tmp_path(target), tables._pa.schema([(name, tables._pa.string()) for name in names]),
+                compression=tables.compression
+            )
+            state = self._files[target] = {'writer': writer, 'names': names, 'batch': [], 'truncated': 0}
+        for row in rows:
+            state['batch'].append(row)
+            count += 1
+            if len(state['batch']) >= self._tables.row_group_rows:
+                self._flush(state)
+        return count
+
+    def _flush(self, state):
+        if state['batch']:
+            table, truncated = self._tables._to_table(state['batch'], state['names'])
+            state['writer'].write_table(table, row_group_size=len(state['batch']))
+            state['truncated'] += truncated
+            state['batch'] = []
+
+    def finish(self, target):
+        state = self._files.pop(target, None)
+        if state is None:
+            return
+        try:
+            self._flush(state)
+        finally:
+            state['writer'].close()
+        if state['truncated']:
+            logger.warning("[Merge] %s: %s行的列数超过表头, 多出的单元格被截断", target, state['truncated'])
+
+    def close(self):
+        for target in list(self._files):
+            self.finish(target)
+        return super().close()
+
+    def discard(self):
+        for state in self._files.values():
+            state['writer'].close()
+        self._files = {}
+        super().discard()
+
+
+def _create_sink(output_path, options):
+    output_format = options.output_format
+    if output_format == FORMAT_XLSX:
+        return _XlsxSink(output_path)
+    if output_format == FORMAT_JSONL:
+        return _JsonlSink(output_path)
+    if output_format == FORMAT_CSV:
+        return _CsvSink(output_path)
+    return _ParquetSink(output_path, options.parquet_compression, options.parquet_row_group_rows)
+
+
+class MergedOutput:
+    """合并模式: 一次批量下载的所有spreadsheet写入同一个输出, 不生成单独的文件
+
+    每个spreadsheet的工作表先编码为传输块缓存在内存中(与写入进程相同的紧凑编码),
+    这个spreadsheet全部获取完成后, 在锁内一次写入合并输出, 获取失败或取消的spreadsheet不会留下一半的数据。
+    写入合并输出本身出错时(例如磁盘已满), 已经追加的行无法撤回(write-only工作表、已写入的row group),
+    此时 error 记录原因, 之后的来源不再写入, 整个合并输出在保存前丢弃, 不会保存只有一部分来源的输出。
+    内存上限约为 并发数 x 最大的spreadsheet编码后的大小, 与spreadsheet的数量无关。
+    来源按完成顺序写入, 来源名为spreadsheet标题, 标题重复时加上ID。
+    sources/rows 只计完整写入的来源; rows 为写入的行数, 包括表头行(concat模式的表头只写入一次)。
+    """
+
+    def __init__(self, output_dir, options):
+        self.mode = options.merge
+        self.output_path = output_path_for(output_dir, safe_filename(options.merge_name), options)
+        self._sink = _create_sink(self.output_path, options)
+        self._lock = threading.Lock()
+        self._headers = {}
+        self._labels = set()
+        self.sources = 0
+        self.rows = 0
+        self.error = None
+
+    def source_writer(self, spreadsheet_id, title):
+        return MergeSourceWriter(self, spreadsheet_id, title)
+
+    def _label(self, spreadsheet_id, title):
+        label = title if title not in self._labels else f"{title} ({spreadsheet_id})"
+        self._labels.add(label)
+        return label
+
+    def commit(self, spreadsheet_id, title, tabs):
+        """写入一个spreadsheet的全部工作表 [(工作表名, [编码块, ...]), ...]"""
+        with self._lock:
+            if self.error is not None:
+                raise ValueError(f"合并输出已无效, 不再写入: {self.error}")
+            label = self._label(spreadsheet_id, title)
+            count = 0
+            try:
+                for sheet_name, chunks in tabs:
+                    rows = decode_chunks(chunks)
+                    if self.mode == MERGE_TABS:
+                        target = self._sink.target(f"{label} - {sheet_name}")
+                        count += self._sink.append(target, rows)
+                        self._sink.finish(target)
+                    else:
+                        count += self._append_concat(label, sheet_name, rows)
+            except Exception as e:
+                self.error = f"写入 {label} 时出错: {str(e)}"
+                raise
+            self.sources += 1
+            self.rows += count
+        return self.output_path
+
+    def _append_concat(self, label, sheet_name, rows):
+        """追加一个来源的工作表, 返回写入的行数"""
+        header = next(rows, None)
+        if header is None:
+            return 0
+        target = self._sink.target(sheet_name)
+        known = self._headers.get(sheet_name)
+        count = 0
+        if known is None:
+            self._headers[sheet_name] = list(header)
+            count += self._sink.append(target, [[SOURCE_COLUMN] + list(header)])
+        elif list(header) != known:
+            logger.warning("[Merge] %s 的工作表 %s 的表头与第一个来源不同, 按列位置拼接", label, sheet_name)
+        return count + self._sink.append(target, ([label] + list(row) for row in rows))
+
+    def close(self):
+        with self._lock:
+            return self._sink.close()
+
+    def discard(self):
+        with self._lock:
+            self._sink.discard()
+
+    def summary(self, missing_ids):
+        return {
+            'mode': self.mode,
+            'output_path': self.output_path,
+            'sources': self.sources,
+            'rows': self.rows,
+            'missing_ids': list(missing_ids),
+            'error': self.error,
+        }
+
+
+class MergeSourceWriter:
+    """与其他写入器接口相同, 代表合并输出中的一个来源; close() 时写入合并输出, discard() 时丢弃"""
+
+    def __init__(self, merged, spreadsheet_id, title):
+        self.output_path = merged.output_path
+        self._merged = merged
+        self._spreadsheet_id = spreadsheet_id
+        self._title = title
+        self._tabs = []
+
+    def write_tab(self, sheet_name, rows):
+        chunks, count = encode_tab(rows)
+        self._tabs.append((sheet_name, chunks))
+        return count
+
+    def close(self):
+        tabs, self._tabs = self._tabs, []
+        return self._merged.commit(self._spreadsheet_id, self._title, tabs)
+
+    def discard(self):
+        self._tabs = []
@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+import time
+from sheets_writers import replace_atomically
+from tracing import logger
+
+APP_DATA_DIR = os.path.join(os.path.expanduser("~"), ".gsheet_downloader")
+DEFAULT_CACHE_PATH = os.path.join(APP_DATA_DIR, "metadata_cache.json")
+# 缓存的元数据在该秒数内有效, 0表示不使用缓存
+DEFAULT_METADATA_TTL = 300
+DEFAULT_MAX_ENTRIES = 1000
+
+
+class MetadataCache:
+    """按spreadsheet ID缓存元数据的磁盘缓存, 过期时间之外按最近使用(LRU)淘汰"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_METADATA_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._entries = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            return entries if isinstance(entries, dict) else {}
+        except (OSError, ValueError) as e:
+            logger.warning("[Cache] 读取元数据缓存失败, 忽略缓存: %s", e)
+            return {}
+
+    def get(self, spreadsheet_id):
+        """返回未过期的元数据, 没有或已过期时返回None"""
+        if self.ttl <= 0:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(spreadsheet_id)
+            if entry is None:
+                return None
+            if now - entry['fetched_at'] > self.ttl:
+                del self._entries[spreadsheet_id]
+                self._dirty = True
+                return None
+            entry['last_used'] = now
+            self._dirty = True
+            return entry['metadata']
+
+    def put(self, spreadsheet_id, metadata):
+        if self.ttl <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            self._entries[spreadsheet_id] = {
+                'fetched_at': now,
+                'last_used': now,
+                'metadata': metadata,
+            }
+            self._dirty = True
+            self._evict(now)
+
+    def invalidate(self, spreadsheet_id):
+        with self._lock:
+            if self._entries.pop(spreadsheet_id, None) is not None:
+                self._dirty = True
+
+    def _evict(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry['fetched_at'] > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        overflow = len(self._entries) - self.max_entries
+        if overflow > 0:
+            by_last_used = sorted(self._entries, key=lambda key: self._entries[key]['last_used'])
+            for key in by_last_used[:overflow]:
+                del self._entries[key]
+
+    def save(self):
+        """写回磁盘: 先写唯一的临时文件再替换, 避免中途退出或多个进程同时保存时损坏缓存.
+        缓存只用于加速, 写入失败只记录警告, 不影响已经完成的下载"""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._evict(time.time())
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                replace_atomically(self.path, self._write_entries)
+            except OSError as e:
+                logger.warning("[Cache] 保存元数据缓存失败: %s", e)
+                return
+            self._dirty = False
+
+    def _write_entries(self, tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, ensure_ascii=False)
@@ -0,0 +1,200 @@
+import contextvars
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import httplib2
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+from tracing import logger, tracer
+from download_progress import EVENT_BYTES
+
+# Sheets API 读取配额: 每个用户每分钟60次读取请求
+DEFAULT_REQUESTS_PER_MINUTE = 60
+# 令牌桶容量, 允许的瞬时突发请求数
+DEFAULT_BURST = 10
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 64.0
+# 出现这些状态码时重试
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# 网络层面的临时错误
+RETRY_EXCEPTIONS = (ConnectionError, TimeoutError, httplib2.HttpLib2Error)
+
+# 当前下载任务(一个spreadsheet)的请求计数; 分页线程通过复制的上下文继承
+task_stats = contextvars.ContextVar('task_stats', default=None)
+
+
+class TokenBucket:
+    """线程安全的令牌桶, 所有工作线程共享, 在发送请求前排队等待令牌"""
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, burst=DEFAULT_BURST):
+        if requests_per_minute <= 0:
+            raise ValueError(f"每分钟请求数必须大于0: {requests_per_minute}")
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(burst, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, sleep=time.sleep, tokens=1):
+        """取 tokens 个令牌, 必要时阻塞等待, 返回等待的秒数; sleep 用于替换为可以被取消打断的等待"""
+        with self._lock:
+            self._refill(time.monotonic())
+            # 先预留令牌(允许为负), 保证等待的线程按到达顺序获得令牌
+            self._tokens -= tokens
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+        if wait > 0:
+            sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        """收到429后让所有线程至少暂停 seconds 秒"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class RequestStats:
+    """请求计数器, 多个线程共同更新"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.throttle_wait_seconds = 0.0
+        self.backoff_wait_seconds = 0.0
+        self.bytes_received = 0
+        # multipart批量请求中包含的API请求数(requests 只计HTTP请求)
+        self.batched_calls = 0
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'retries': self.retries,
+                'throttled': self.throttled,
+                'throttle_wait_seconds': round(self.throttle_wait_seconds, 3),
+                'backoff_wait_seconds': round(self.backoff_wait_seconds, 3),
+                'bytes_received': self.bytes_received,
+                'batched_calls': self.batched_calls,
+            }
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 响应头, 支持秒数和HTTP日期两种格式"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+class RequestExecutor:
+    """所有Sheets API请求的统一出口: 限流、带抖动的指数退避重试和计数"""
+
+    def __init__(self, limiter=None, max_retries=DEFAULT_MAX_RETRIES,
+                 base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY, control=None):
+        self.limiter = limiter
+        # DownloadControl: 每次发送请求前检查暂停/取消, 并报告收到的字节数
+        self.control = control
+        self._sleep = control.sleep if control is not None else time.sleep
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = RequestStats()
+
+    def _add(self, **counts):
+        self.stats.add(**counts)
+        current = task_stats.get()
+        if current is not None:
+            current.add(**counts)
+        if tracer.enabled:
+            for name, value in counts.items():
+                tracer.count(name, value)
+        if self.control is not None and 'bytes_received' in counts:
+            self.control.emit(EVENT_BYTES, bytes=counts['bytes_received'])
+
+    def backoff_delay(self, attempt, retry_after=None):
+        # full jitter: 在 [0, base * 2^attempt] 内随机, 避免多个线程同时重试
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def call(self, func, cost=1):
+        """执行 func(), 遇到可重试的错误时按退避策略重试; cost 为这次HTTP请求占用的配额(批量请求中的请求数)"""
+        attempt = 0
+        while True:
+            if self.control is not None:
+                self.control.checkpoint()
+            if self.limiter is not None:
+                waited = self.limiter.acquire(self._sleep, cost)
+                if waited:
+                    self._add(throttle_wait_seconds=waited)
+            self._add(requests=1)
+            if cost > 1:
+                self._add(batched_calls=cost)
+            try:
+                return func()
+            except HttpError as e:
+                if e.resp.status not in RETRY_STATUSES or attempt >= self.max_retries:
+                    raise
+                retry_after = parse_retry_after(e.resp.get('retry-after'))
+                if e.resp.status == 429:
+                    self._add(throttled=1)
+                    if self.limiter is not None:
+                        self.limiter.pause(retry_after or self.base_delay)
+                reason = f"HTTP {e.resp.status}"
+            except RETRY_EXCEPTIONS as e:
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = None
+                reason = type(e).__name__
+
+            delay = self.backoff_delay(attempt, retry_after)
+            attempt += 1
+            self._add(retries=1, backoff_wait_seconds=delay)
+            logger.warning("[Executor] 请求失败(%s), %.2f秒后第%d次重试", reason, delay, attempt)
+            self._sleep(delay)
+
+    def request_builder(self):
+        """返回供 googleapiclient.discovery.build 使用的 requestBuilder"""
+        executor = self
+
+        class ExecutorHttpRequest(HttpRequest):
+            def __init__(self, http, postproc, *args, **kwargs):
+                # 在创建时包装, 批量请求(BatchHttpRequest)中的各个部分同样计数
+                def counting_postproc(resp, content):
+                    executor._add(bytes_received=len(content or b''))
+                    return postproc(resp, content)
+
+                super().__init__(http, counting_postproc, *args, **kwargs)
+
+            def execute(self, http=None, num_retries=0):
+                # 重试由executor负责, 关闭googleapiclient自带的重试
+                return executor.call(lambda: HttpRequest.execute(self, http=http))
+
+        return ExecutorHttpRequest
+
+
+def create_request_executor(requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                            max_retries=DEFAULT_MAX_RETRIES, burst=DEFAULT_BURST, control=None):
+    limiter = TokenBucket(requests_per_minute, burst) if requests_per_minute > 0 else None
+    return RequestExecutor(limiter, max_retries=max_retries, control=control)
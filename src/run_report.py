@@ -0,0 +1,198 @@
+import dataclasses
+import glob
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+from sheets_writers import write_json_atomically
+
+# 每次批量下载结束后写入输出目录的运行报告
+REPORT_FILE = "gsheet_run_report.json"
+
+STATUS_DOWNLOADED = 'downloaded'
+# 增量同步时内容未变化, 没有重新写入
+STATUS_UNCHANGED = 'unchanged'
+# 恢复任务时上次运行中已经完成, 或筛选条件没有选中任何工作表
+STATUS_SKIPPED = 'skipped'
+STATUS_FAILED = 'failed'
+# 用户取消时尚未完成, 恢复任务时重新下载
+STATUS_CANCELLED = 'cancelled'
+
+
+@dataclass
+class SpreadsheetResult:
+    """单个spreadsheet的下载结果"""
+    spreadsheet_id: str
+    status: str = STATUS_FAILED
+    title: Optional[str] = None
+    output_path: Optional[str] = None
+    error: Optional[str] = None
+    tabs: int = 0
+    rows: int = 0
+    # 解压后的响应字节数
+    bytes_fetched: int = 0
+    requests: int = 0
+    retries: int = 0
+    throttled: int = 0
+    # 各阶段耗时(秒): 元数据, 等待数据(网络和解析), 写入(转换, 编码和保存)
+    metadata_seconds: float = 0.0
+    fetch_seconds: float = 0.0
+    write_seconds: float = 0.0
+    total_seconds: float = 0.0
+    # 按 gridProperties 估算的单元格数, 没有取得元数据时为None
+    estimated_cells: Optional[int] = None
+
+    @property
+    def ok(self):
+        return self.status not in (STATUS_FAILED, STATUS_CANCELLED)
+
+
+@dataclass
+class RunReport:
+    """一次批量下载的结果, 每个spreadsheet一项, 按输入顺序排列"""
+    output_dir: str
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    results: list = field(default_factory=list)
+    # 整个批次的请求统计
+    request_stats: dict = field(default_factory=dict)
+    # 增量同步的跳过/更新数量, 未开启同步时为None
+    sync_summary: Optional[dict] = None
+    # 开启追踪(--profile *.json)时各阶段span的次数和总耗时, 以及请求/字节/单元格计数
+    trace: Optional[dict] = None
+    # largest-first调度时的预计与实际完成时间(makespan)
+    schedule: Optional[dict] = None
+    # 合并模式的输出路径、写入的来源数和行数, 以及没有写入的spreadsheet
+    merge: Optional[dict] = None
+    # 下载开始前预先获取所有元数据的耗时, 没有预先获取时为None
+    metadata_prefetch_seconds: Optional[float] = None
+    # 分片或队列模式中的worker名称
+    worker: Optional[str] = None
+    # 队列模式: 本worker结束时整个队列的进度
+    queue: Optional[dict] = None
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.ok]
+
+    @property
+    def failed_ids(self):
+        return [result.spreadsheet_id for result in self.failed]
+
+    @property
+    def cancelled(self):
+        return any(result.status == STATUS_CANCELLED for result in self.results)
+
+    @property
+    def success(self):
+        return not self.failed
+
+    def counts(self):
+        counts = {}
+        for result in self.results:
+            counts[result.status] = counts.get(result.status, 0) + 1
+        return counts
+
+    def to_dict(self):
+        return {
+            'output_dir': self.output_dir,
+            'worker': self.worker,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'success': self.success,
+            'counts': self.counts(),
+            'failed_ids': self.failed_ids,
+            'request_stats': self.request_stats,
+            'sync_summary': self.sync_summary,
+            'trace': self.trace,
+            'schedule': self.schedule,
+            'merge': self.merge,
+            'metadata_prefetch_seconds': self.metadata_prefetch_seconds,
+            'queue': self.queue,
+            'results': [dataclasses.asdict(result) for result in self.results],
+        }
+
+    def save(self, path):
+        """先写临时文件再替换, 读取报告的程序不会看到写了一半的文件"""
+        return save_json(path, self.to_dict())
+
+
+def find_worker_reports(output_dir):
+    """输出目录中各worker的运行报告 (gsheet_run_report.<worker>.json)"""
+    root, ext = os.path.splitext(os.path.join(output_dir, REPORT_FILE))
+    return sorted(glob.glob(f"{glob.escape(root)}.*{ext}"))
+
+
+def _is_ok(result):
+    return result.get('status') not in (STATUS_FAILED, STATUS_CANCELLED)
+
+
+def merge_run_reports(report_paths, expected_ids=None, fallback_results=None):
+    """合并多个worker的运行报告, 返回合并后的报告(dict)
+
+    同一个spreadsheet出现在多个报告中时(例如租约过期后被重新领取), 优先使用成功的结果,
+    都成功或都失败时使用较晚结束的报告中的结果。expected_ids 为完整的ID列表时,
+    没有出现在任何报告中的ID记录在 missing_ids 中, 有缺失时 success 为False。
+    fallback_results 为 {ID: 结果} (例如队列的完成记录), 用于补上没有写出报告的worker
+    (进程被强制结束)已经完成的ID。
+    """
+    reports = []
+    for path in report_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+        report['report_path'] = path
+        reports.append(report)
+    reports.sort(key=lambda report: report.get('finished_at') or 0)
+
+    results = {}
+    seen = {}
+    request_stats = {}
+    for report in reports:
+        for name, value in (report.get('request_stats') or {}).items():
+            request_stats[name] = round(request_stats.get(name, 0) + value, 3)
+        for result in report.get('results', []):
+            spreadsheet_id = result['spreadsheet_id']
+            seen[spreadsheet_id] = seen.get(spreadsheet_id, 0) + 1
+            known = results.get(spreadsheet_id)
+            if known is None or _is_ok(result) or not _is_ok(known):
+                results[spreadsheet_id] = dict(result, worker=report.get('worker'))
+
+    for spreadsheet_id, result in (fallback_results or {}).items():
+        if spreadsheet_id not in results:
+            results[spreadsheet_id] = dict(result, spreadsheet_id=spreadsheet_id)
+
+    order = list(expected_ids) if expected_ids is not None else []
+    expected = set(order)
+    order += [spreadsheet_id for spreadsheet_id in results if spreadsheet_id not in expected]
+    merged_results = [results[spreadsheet_id] for spreadsheet_id in order if spreadsheet_id in results]
+    counts = {}
+    for result in merged_results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    failed_ids = [result['spreadsheet_id'] for result in merged_results if not _is_ok(result)]
+    missing_ids = [spreadsheet_id for spreadsheet_id in order if spreadsheet_id not in results]
+    return {
+        'output_dir': reports[0]['output_dir'] if reports else None,
+        'started_at': min((report['started_at'] for report in reports), default=None),
+        'finished_at': max((report.get('finished_at') or 0 for report in reports), default=None),
+        'success': not failed_ids and not missing_ids,
+        'counts': counts,
+        'failed_ids': failed_ids,
+        'missing_ids': missing_ids,
+        'duplicate_ids': [spreadsheet_id for spreadsheet_id, count in seen.items() if count > 1],
+        'request_stats': request_stats,
+        'workers': [{
+            'worker': report.get('worker'),
+            'report_path': report['report_path'],
+            'started_at': report.get('started_at'),
+            'finished_at': report.get('finished_at'),
+            'counts': report.get('counts'),
+        } for report in reports],
+        'results': merged_results,
+    }
+
+
+def save_json(path, data):
+    """先写唯一的临时文件再替换"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return write_json_atomically(path, data, indent=2)
@@ -0,0 +1,342 @@
+from collections import deque
+from urllib.parse import quote
+from googleapiclient.errors import HttpError
+from sheets_session import new_batch_request
+from tracing import logger, tracer
+
+# 单次 batchGet 请求的URL长度上限 (Google前端对GET请求的URL长度有限制)
+MAX_BATCH_URL_LENGTH = 6000
+# 单次 batchGet 预计返回的单元格数量上限, 避免响应过大
+MAX_BATCH_CELLS = 500_000
+# batchGet 出现这些状态码时退回逐个工作表请求
+BATCH_FALLBACK_STATUSES = (400, 413)
+# 请求URL中除 ranges 参数外的固定部分的估算长度
+_BASE_URL_LENGTH = 200
+
+FETCH_MODE_BATCH = 'batch'
+FETCH_MODE_PER_TAB = 'per-tab'
+FETCH_MODES = (FETCH_MODE_BATCH, FETCH_MODE_PER_TAB)
+
+# 预计单元格数超过该值的工作表按行分页获取, 0表示不分页
+DEFAULT_PAGE_CELLS = 200_000
+# 每个工作表同时在途的分页请求数
+DEFAULT_PAGE_CONCURRENCY = 4
+
+# formatted: 与界面显示一致的字符串; typed: 数字返回数值, 日期返回序列号, 由写入前的类型转换生成日期单元格
+VALUE_RENDER_FORMATTED = 'formatted'
+VALUE_RENDER_TYPED = 'typed'
+VALUE_RENDERS = (VALUE_RENDER_FORMATTED, VALUE_RENDER_TYPED)
+_VALUE_RENDER_PARAMS = {
+    VALUE_RENDER_FORMATTED: {},
+    VALUE_RENDER_TYPED: {'valueRenderOption': 'UNFORMATTED_VALUE', 'dateTimeRenderOption': 'SERIAL_NUMBER'},
+}
+
+# spreadsheets.get 只返回下载器实际使用的字段
+METADATA_FIELDS = 'properties.title,sheets.properties(title,hidden,gridProperties(rowCount,columnCount))'
+# 一次multipart批量请求中的元数据请求数, 0表示每个spreadsheet单独请求; Google的上限为每批1000个
+DEFAULT_METADATA_BATCH_SIZE = 100
+MAX_METADATA_BATCH_SIZE = 1000
+
+
+def a1_sheet_range(sheet_name: str) -> str:
+    """将工作表名转换为A1表示法的范围, 名称中的单引号需要转义"""
+    return "'" + sheet_name.replace("'", "''") + "'"
+
+
+def row_window_range(sheet_name, start, end):
+    # 只限定行不限定列, 列数超出 gridProperties 时也不会截断
+    return f"{a1_sheet_range(sheet_name)}!{start}:{end}"
+
+
+def window_range(sheet_properties, start, end):
+    """工作表内第 start 到 end 行的A1范围(行号从1开始); 指定了范围(a1_range)时相对于该范围"""
+    a1_range = sheet_properties.get('a1_range')
+    if a1_range is None:
+        return row_window_range(sheet_properties['title'], start, end)
+    return f"{a1_sheet_range(sheet_properties['title'])}!{a1_range.window(start, end)}"
+
+
+def tab_range(sheet_properties):
+    """获取整个工作表(或指定范围)时请求的A1范围"""
+    a1_range = sheet_properties.get('a1_range')
+    if a1_range is None:
+        return a1_sheet_range(sheet_properties['title'])
+    # 按原样请求, 不按(可能来自缓存、已过时的)rowCount截断: 没有结束行的范围(B2:F)由API取到最后一行,
+    # 结束行超出网格时API只返回网格内的部分; 起始行超出网格的范围已在筛选时跳过
+    return f"{a1_sheet_range(sheet_properties['title'])}!{a1_range}"
+
+
+def fetch_spreadsheet_metadata(service, spreadsheet_id, cache=None):
+    """获取spreadsheet元数据, 返回 (metadata, 是否来自缓存)"""
+    if cache is not None:
+        metadata = cache.get(spreadsheet_id)
+        if metadata is not None:
+            logger.debug("[Fetch] 使用缓存的元数据: %s", spreadsheet_id)
+            return metadata, True
+    metadata = service.spreadsheets().get(
+        spreadsheetId=spreadsheet_id,
+        fields=METADATA_FIELDS
+    ).execute()
+    if cache is not None:
+        cache.put(spreadsheet_id, metadata)
+    return metadata, False
+
+
+def fetch_metadata_batch(service, spreadsheet_ids, cache=None, executor=None):
+    """用一次multipart批量请求获取多个spreadsheet的元数据
+
+    返回 {spreadsheet_id: (metadata, 是否来自缓存) 或异常}; 批量请求中单个部分的错误(404、429等)
+    作为异常返回, 由调用方对这些spreadsheet单独请求。配额按其中的请求数计算, 限流器相应地取多个令牌。
+    """
+    outcomes = {}
+    pending = []
+    for spreadsheet_id in dict.fromkeys(spreadsheet_ids):
+        metadata = cache.get(spreadsheet_id) if cache is not None else None
+        if metadata is not None:
+            outcomes[spreadsheet_id] = (metadata, True)
+        else:
+            pending.append(spreadsheet_id)
+    if not pending:
+        return outcomes
+
+    def collect(spreadsheet_id, response, exception):
+        if exception is not None:
+            outcomes[spreadsheet_id] = exception
+            return
+        if cache is not None:
+            cache.put(spreadsheet_id, response)
+        outcomes[spreadsheet_id] = (response, False)
+
+    batch = new_batch_request(collect)
+    for spreadsheet_id in pending:
+        batch.add(service.spreadsheets().get(spreadsheetId=spreadsheet_id, fields=METADATA_FIELDS),
+                  request_id=spreadsheet_id)
+    if executor is None:
+        batch.execute()
+    else:
+        executor.call(batch.execute, cost=len(pending))
+    failed = [spreadsheet_id for spreadsheet_id in pending if isinstance(outcomes.get(spreadsheet_id), Exception)]
+    if failed:
+        logger.debug("[Fetch] 批量请求中 %d 个元数据请求失败, 将单独重新请求", len(failed))
+    return outcomes
+
+
+def _count_cells(values):
+    # 只在开启追踪时遍历, 平时不增加开销
+    if tracer.enabled:
+        tracer.count('cells', sum(map(len, values)))
+    return values
+
+
+def value_render_params(value_render):
+    """values.get / values.batchGet 的额外查询参数"""
+    try:
+        return _VALUE_RENDER_PARAMS[value_render]
+    except KeyError:
+        raise ValueError(f"未知的取值方式: {value_render}")
+
+
+def estimate_sheet_cells(sheet_properties: dict) -> int:
+    grid = sheet_properties.get('gridProperties', {})
+    return grid.get('rowCount', 0) * grid.get('columnCount', 0)
+
+
+def group_ranges_for_batch(sheet_properties_list, max_url_length=MAX_BATCH_URL_LENGTH,
+                           max_cells=MAX_BATCH_CELLS):
+    """按URL长度和预计响应大小将工作表分组, 每组对应一次 batchGet 请求"""
+    groups = []
+    current = []
+    url_length = _BASE_URL_LENGTH
+    cells = 0
+    for props in sheet_properties_list:
+        # 每个range参数形如 &ranges=<urlencoded>
+        range_length = len('&ranges=') + len(quote(tab_range(props), safe=''))
+        sheet_cells = estimate_sheet_cells(props)
+        if current and (url_length + range_length > max_url_length or cells + sheet_cells > max_cells):
+            groups.append(current)
+            current = []
+            url_length = _BASE_URL_LENGTH
+            cells = 0
+        current.append(props)
+        url_length += range_length
+        cells += sheet_cells
+    if current:
+        groups.append(current)
+    return groups
+
+
+def fetch_tab_values_per_tab(service, spreadsheet_id, sheet_properties_list, params=None):
+    """逐个工作表请求数据, 每个工作表一次 values().get 请求"""
+    for props in sheet_properties_list:
+        sheet_name = props['title']
+        with tracer.span('values_fetch', spreadsheet_id=spreadsheet_id, range=sheet_name):
+            result = service.spreadsheets().values().get(
+                spreadsheetId=spreadsheet_id,
+                range=tab_range(props),
+                **(params or {})
+            ).execute()
+        yield sheet_name, _count_cells(result.get('values', []))
+
+
+def fetch_tab_values_batched(service, spreadsheet_id, sheet_properties_list, params=None):
+    """使用 values().batchGet 一次请求多个工作表, 按请求顺序将结果映射回工作表"""
+    for group in group_ranges_for_batch(sheet_properties_list):
+        ranges = [tab_range(props) for props in group]
+        try:
+            with tracer.span('values_fetch', spreadsheet_id=spreadsheet_id, ranges=len(ranges)):
+                result = service.spreadsheets().values().batchGet(
+                    spreadsheetId=spreadsheet_id,
+                    ranges=ranges,
+                    **(params or {})
+                ).execute()
+        except HttpError as e:
+            if e.resp.status not in BATCH_FALLBACK_STATUSES:
+                raise
+            logger.warning("[Fetch] batchGet失败(%s), 退回逐个工作表请求: %s个工作表", e.resp.status, len(group))
+            yield from fetch_tab_values_per_tab(service, spreadsheet_id, group, params)
+            continue
+
+        value_ranges = result.get('valueRanges', [])
+        if len(value_ranges) != len(group):
+            raise ValueError(f"batchGet返回的范围数量不匹配: 请求{len(group)}个, 返回{len(value_ranges)}个")
+        for props, value_range in zip(group, value_ranges):
+            yield props['title'], _count_cells(value_range.get('values', []))
+
+
+def page_rows_for(sheet_properties, page_cells=DEFAULT_PAGE_CELLS):
+    column_count = max(sheet_properties.get('gridProperties', {}).get('columnCount', 1), 1)
+    return max(page_cells // column_count, 1)
+
+
+def page_ranges(sheet_properties, page_cells=DEFAULT_PAGE_CELLS):
+    """根据 gridProperties 将工作表切分为按行的窗口, 返回 [(range, 行数), ...]"""
+    row_count = sheet_properties.get('gridProperties', {}).get('rowCount', 0)
+    page_rows = page_rows_for(sheet_properties, page_cells)
+    ranges = []
+    for start in range(1, row_count + 1, page_rows):
+        end = min(start + page_rows - 1, row_count)
+        ranges.append((window_range(sheet_properties, start, end), end - start + 1))
+    return ranges
+
+
+def _fetch_range(service, spreadsheet_id, a1_range, params=None):
+    with tracer.span('values_fetch', spreadsheet_id=spreadsheet_id, range=a1_range):
+        result = service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range=a1_range,
+            **(params or {})
+        ).execute()
+    return _count_cells(result.get('values', []))
+
+
+class _PageAligner:
+    """API会省略窗口末尾的空行, 在后续窗口有数据时补回这些空行, 避免后续行错位"""
+
+    def __init__(self):
+        self.pending_blank_rows = 0
+
+    def emit(self, values, window_rows):
+        if values:
+            for _ in range(self.pending_blank_rows):
+                yield []
+            self.pending_blank_rows = 0
+            yield from values
+        self.pending_blank_rows += window_rows - len(values)
+
+
+def fetch_tab_rows_paged(service, spreadsheet_id, sheet_properties, page_cells=DEFAULT_PAGE_CELLS,
+                         submit=None, prefetch=DEFAULT_PAGE_CONCURRENCY, probe_tail=False, params=None):
+    """按行窗口分页获取一个工作表, 按顺序逐行产出
+
+    submit(func, *args) 在其他线程中执行 func(service, *args) 并返回Future,
+    提供时最多同时有 prefetch 个分页请求在途; 未提供时在当前线程中依次请求。
+    probe_tail 为True时(元数据来自缓存, rowCount可能已过时), 继续请求后续窗口直到返回空数据;
+    工作表没有新增行时网格也没有变大, 起始行超出网格的窗口会被API以400拒绝, 同样表示没有更多数据。
+    """
+    aligner = _PageAligner()
+    ranges = page_ranges(sheet_properties, page_cells)
+    if submit is None:
+        for a1_range, window_rows in ranges:
+            yield from aligner.emit(_fetch_range(service, spreadsheet_id, a1_range, params), window_rows)
+    else:
+        yield from _fetch_pages_concurrently(spreadsheet_id, ranges, submit, prefetch, aligner, params)
+
+    if not probe_tail:
+        return
+    sheet_name = sheet_properties['title']
+    page_rows = page_rows_for(sheet_properties, page_cells)
+    start = sheet_properties.get('gridProperties', {}).get('rowCount', 0) + 1
+    a1_range = sheet_properties.get('a1_range')
+    # 指定了结束行的范围不会超出该行
+    end_row = None if a1_range is None or a1_range.end_row is None else a1_range.end_row - a1_range.first_row + 1
+    while end_row is None or start <= end_row:
+        end = start + page_rows - 1 if end_row is None else min(start + page_rows - 1, end_row)
+        try:
+            values = _fetch_range(service, spreadsheet_id, window_range(sheet_properties, start, end), params)
+        except HttpError as e:
+            if e.resp.status != 400:
+                raise
+            logger.debug("[Fetch] 工作表 %s 第%d行之后超出网格, 没有新增的行", sheet_name, start)
+            return
+        if not values:
+            return
+        logger.warning("[Fetch] 工作表 %s 的行数超过缓存的rowCount, 继续获取第%s行之后的数据", sheet_name, start)
+        yield from aligner.emit(values, page_rows)
+        start += page_rows
+
+
+def _fetch_pages_concurrently(spreadsheet_id, ranges, submit, prefetch, aligner, params=None):
+    in_flight = deque()
+    remaining = iter(ranges)
+    try:
+        for a1_range, window_rows in remaining:
+            in_flight.append((submit(_fetch_range, spreadsheet_id, a1_range, params), window_rows))
+            if len(in_flight) >= prefetch:
+                break
+        while in_flight:
+            future, window_rows = in_flight.popleft()
+            values = future.result()
+            next_range = next(remaining, None)
+            if next_range is not None:
+                in_flight.append((submit(_fetch_range, spreadsheet_id, next_range[0], params),
+                                  next_range[1]))
+            yield from aligner.emit(values, window_rows)
+    finally:
+        for future, _ in in_flight:
+            future.cancel()
+
+
+def _is_paged(sheet_properties, page_cells):
+    return page_cells > 0 and estimate_sheet_cells(sheet_properties) > page_cells
+
+
+def fetch_tab_values(service, spreadsheet_id, sheet_properties_list, options, submit=None,
+                     probe_tail=False):
+    """按下载选项获取各工作表数据, 按工作表顺序产出 (工作表名, 行数据的可迭代对象)
+
+    超过 options.page_cells 的大工作表分页获取, 其余工作表按 options.fetch_mode 获取。
+    """
+    if options.fetch_mode == FETCH_MODE_BATCH:
+        fetch_small = fetch_tab_values_batched
+    elif options.fetch_mode == FETCH_MODE_PER_TAB:
+        fetch_small = fetch_tab_values_per_tab
+    else:
+        raise ValueError(f"未知的获取模式: {options.fetch_mode}")
+    params = value_render_params(options.value_render)
+
+    small_sheets = []
+    for props in sheet_properties_list:
+        if not _is_paged(props, options.page_cells):
+            small_sheets.append(props)
+            continue
+        # 保持工作表顺序: 先获取前面累积的小工作表
+        if small_sheets:
+            yield from fetch_small(service, spreadsheet_id, small_sheets, params)
+            small_sheets = []
+        logger.debug("[Fetch] 分页获取工作表: %s", props['title'])
+        yield props['title'], fetch_tab_rows_paged(
+            service, spreadsheet_id, props, options.page_cells,
+            submit=submit, prefetch=options.page_concurrency, probe_tail=probe_tail, params=params
+        )
+    if small_sheets:
+        yield from fetch_small(service, spreadsheet_id, small_sheets, params)
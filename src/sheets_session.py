@@ -0,0 +1,133 @@
+import datetime
+import functools
+import json
+import os
+import threading
+from urllib.parse import urljoin
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from google.auth.transport.requests import Request
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import BatchHttpRequest
+from http_transport import PooledHttp
+from tracing import logger
+
+# 可选: 覆盖Sheets API地址, 用于连接本地的模拟服务器
+API_ENDPOINT_ENV_VAR = "GSHEET_API_ENDPOINT"
+# token在过期前这么多秒内才主动刷新
+REFRESH_MARGIN_SECONDS = 300
+# googleapiclient每次调用这些方法都会重新生成整个资源对象及其全部方法
+_NESTED_RESOURCES = ('spreadsheets', 'values', 'sheets', 'developerMetadata')
+
+
+@functools.lru_cache(maxsize=None)
+def discovery_document():
+    """googleapiclient自带的静态discovery文档, 每个进程只解析一次"""
+    doc = get_static_doc('sheets', 'v4')
+    return json.loads(doc) if doc else None
+
+
+class CachedResource:
+    """包装googleapiclient的Resource, 缓存 spreadsheets()/values() 返回的子资源对象"""
+
+    def __init__(self, resource):
+        self._resource = resource
+        self._children = {}
+
+    def __getattr__(self, name):
+        attr = getattr(self._resource, name)
+        if name not in _NESTED_RESOURCES:
+            return attr
+
+        def child():
+            cached = self._children.get(name)
+            if cached is None:
+                cached = self._children[name] = CachedResource(attr())
+            return cached
+
+        return child
+
+
+def build_sheets_service(creds, executor=None, http=None):
+    """构建service; 未提供 http 时使用独立的httplib2连接, httplib2.Http 不是线程安全的
+
+    提供 executor 时, 该service发出的所有请求都经过executor限流和重试。
+    """
+    if http is None:
+        http = AuthorizedHttp(creds, http=httplib2.Http())
+    kwargs = {}
+    if executor is not None:
+        kwargs['requestBuilder'] = executor.request_builder()
+    api_endpoint = os.getenv(API_ENDPOINT_ENV_VAR)
+    if api_endpoint:
+        kwargs['client_options'] = {'api_endpoint': api_endpoint}
+    doc = discovery_document()
+    if doc is None:
+        return CachedResource(build('sheets', 'v4', http=http, **kwargs))
+    return CachedResource(build_from_document(doc, http=http, **kwargs))
+
+
+def new_batch_request(callback=None):
+    """multipart批量请求; 不使用 service.new_batch_http_request(), 它忽略 GSHEET_API_ENDPOINT"""
+    doc = discovery_document() or {}
+    root_url = os.getenv(API_ENDPOINT_ENV_VAR) or doc.get('rootUrl', 'https://sheets.googleapis.com/')
+    batch_uri = urljoin(root_url.rstrip('/') + '/', doc.get('batchPath', 'batch'))
+    return BatchHttpRequest(callback=callback, batch_uri=batch_uri)
+
+
+class SheetsSession:
+    """可复用的认证会话: 持有凭证, 在过期前统一刷新, 并为每个线程缓存service
+
+    同一进程内的多次下载(例如GUI中多次点击下载)共用一个会话, 不再重复读取token和构建service。
+    """
+
+    def __init__(self, creds, token_path=None):
+        self.creds = creds
+        self.token_path = token_path
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pooled_http = None
+
+    def _needs_refresh(self):
+        expiry = getattr(self.creds, 'expiry', None)
+        if expiry is None or not getattr(self.creds, 'refresh_token', None):
+            return False
+        # google-auth 使用不带时区的UTC时间
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return (expiry - now).total_seconds() < REFRESH_MARGIN_SECONDS
+
+    def ensure_fresh(self):
+        """token即将过期时刷新一次; 在批次开始前调用, 避免多个线程同时刷新"""
+        with self._lock:
+            if not self._needs_refresh():
+                return
+            logger.info("[Session] token即将过期, 提前刷新")
+            self.creds.refresh(Request())
+            if self.token_path:
+                with open(self.token_path, "w") as token:
+                    token.write(self.creds.to_json())
+
+    def pooled_http(self, pool_size):
+        """会话内共享的连接池; 需要的连接数变大时重新创建并关闭旧连接池
+
+        关闭只断开旧连接池中空闲的连接: 正在使用旧连接池的批次不受影响, 请求完成后连接随即关闭。
+        """
+        with self._lock:
+            if self._pooled_http is None or self._pooled_http.pool_size < pool_size:
+                logger.debug("[Session] 创建连接池, 大小: %s", pool_size)
+                if self._pooled_http is not None:
+                    self._pooled_http.close()
+                self._pooled_http = PooledHttp(self.creds, pool_size)
+            return self._pooled_http
+
+    def build_service(self, executor=None, http=None):
+        return build_sheets_service(self.creds, executor, http)
+
+    def service(self):
+        """当前线程复用的service(不经过executor)"""
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            self.ensure_fresh()
+            service = self._local.service = self.build_service()
+        return service
@@ -0,0 +1,357 @@
+import csv
+import datetime
+import json
+import os
+import re
+import tempfile
+import threading
+from tracing import logger
+
+FORMAT_XLSX = 'xlsx'
+FORMAT_CSV = 'csv'
+FORMAT_JSONL = 'jsonl'
+FORMAT_PARQUET = 'parquet'
+OUTPUT_FORMATS = (FORMAT_XLSX, FORMAT_CSV, FORMAT_JSONL, FORMAT_PARQUET)
+
+PARQUET_COMPRESSIONS = ('snappy', 'zstd', 'gzip', 'none')
+DEFAULT_PARQUET_COMPRESSION = 'snappy'
+# Parquet每个row group的行数, 也是写入前在内存中累积的行数
+DEFAULT_PARQUET_ROW_GROUP_ROWS = 50_000
+
+_UNSAFE_FILENAME_CHARS = re.compile(r'[\\/:*?"<>|]')
+# mkstemp创建的文件只有所有者可读写; 临时文件改为按umask的普通权限, 替换后其他用户(例如其他主机上的worker)也能读取
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def safe_filename(name):
+    """工作表名可以包含文件名中不允许的字符"""
+    return _UNSAFE_FILENAME_CHARS.sub('_', name).strip() or '_'
+
+
+class OutputNames:
+    """一次运行(或守护进程)中各spreadsheet的输出文件名
+
+    标题经过 safe_filename 处理; 不同的spreadsheet标题相同时(不区分大小写, 兼容Windows/macOS的文件系统),
+    先登记的使用标题, 之后的在标题后加上ID, 避免并发写入同一个文件。同一个ID总是得到同一个名称。
+    """
+
+    def __init__(self):
+        self._owners = {}
+        self._names = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, spreadsheet_id, title):
+        with self._lock:
+            name = self._names.get(spreadsheet_id)
+            if name is None:
+                name = safe_filename(title)
+                if self._owners.setdefault(name.casefold(), spreadsheet_id) != spreadsheet_id:
+                    name = safe_filename(f"{title} ({spreadsheet_id})")
+                    self._owners.setdefault(name.casefold(), spreadsheet_id)
+                    logger.warning("[Writer] 多个spreadsheet的标题都是 %s, %s 保存为 %s", title, spreadsheet_id, name)
+                self._names[spreadsheet_id] = name
+            return name
+
+
+def temp_path_for(path):
+    """与 path 同目录的唯一临时文件(已创建的空文件), 多个写入方的目标相同时临时文件也互不影响"""
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory or '.', prefix=f".{name}.", suffix='.tmp')
+    try:
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+    finally:
+        os.close(fd)
+    return tmp_path
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _json_default(value):
+    # typed取值方式下的日期/时间单元格
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f"无法序列化的值: {value!r}")
+
+
+def replace_atomically(output_path, write):
+    """先通过 write(临时路径) 写入同目录下的临时文件, 再替换目标文件, 读取方不会看到写了一半的文件"""
+    tmp_path = temp_path_for(output_path)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, output_path)
+    finally:
+        _remove_quietly(tmp_path)
+    return output_path
+
+
+def write_json_atomically(path, data, indent=None):
+    """通过唯一的临时文件写入JSON; 多个进程(worker, 守护进程, GUI)同时写同一个文件时不会互相影响"""
+    def write(tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+    return replace_atomically(path, write)
+
+
+def discard_write_only_workbook(wb):
+    """丢弃write-only Workbook: 关闭各工作表并删除openpyxl为它们创建的临时文件, 不生成xlsx"""
+    for ws in wb.worksheets:
+        if not ws.closed:
+            ws.close()
+        writer = ws._writer
+        if writer is not None and os.path.exists(writer.out):
+            writer.cleanup()
+
+
+class XlsxWorkbookWriter:
+    """普通Workbook: 所有单元格保存在内存中, 直到 close() 时一次写入磁盘"""
+
+    def __init__(self, output_path):
+        # openpyxl导入较慢, 第一次写入xlsx时才导入, GUI启动时不需要
+        from openpyxl import Workbook
+        self.output_path = output_path
+        self._wb = Workbook()
+        self._wb.remove(self._wb.active)
+
+    def write_tab(self, sheet_name, rows):
+        ws = self._wb.create_sheet(sheet_name)
+        count = 0
+        for row in rows:
+            ws.append(row)
+            count += 1
+        return count
+
+    def close(self):
+        return replace_atomically(self.output_path, self._wb.save)
+
+    def discard(self):
+        """内容未变化时丢弃, 不写入磁盘"""
+        self._wb = None
+
+
+class StreamingXlsxWriter:
+    """write-only Workbook: 行数据到达后立即写入临时文件, 每个工作表写完即关闭释放"""
+
+    def __init__(self, output_path):
+        from openpyxl import Workbook
+        self.output_path = output_path
+        self._wb = Workbook(write_only=True)
+
+    def write_tab(self, sheet_name, rows):
+        ws = self._wb.create_sheet(sheet_name)
+        count = 0
+        for row in rows:
+            ws.append(row)
+            count += 1
+        # 关闭后工作表内容只保留在临时文件中
+        ws.close()
+        return count
+
+    def close(self):
+        return replace_atomically(self.output_path, self._wb.save)
+
+    def discard(self):
+        """内容未变化时丢弃, 不写入磁盘"""
+        discard_write_only_workbook(self._wb)
+        self._wb = None
+
+
+class JsonlWriter:
+    """JSON Lines: 每行一个对象 {"sheet": 工作表名, "values": [...]}, 所有工作表写入同一个文件"""
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self._tmp_path = temp_path_for(output_path)
+        self._file = open(self._tmp_path, 'w', encoding='utf-8')
+
+    def write_tab(self, sheet_name, rows):
+        # 工作表名只编码一次, 每行只序列化values部分
+        prefix = '{"sheet": ' + json.dumps(sheet_name, ensure_ascii=False) + ', "values": '
+        write = self._file.write
+        count = 0
+        for row in rows:
+            write(prefix)
+            write(json.dumps(row, ensure_ascii=False, default=_json_default))
+            write('}\n')
+            count += 1
+        return count
+
+    def close(self):
+        self._file.close()
+        os.replace(self._tmp_path, self.output_path)
+        return self.output_path
+
+    def discard(self):
+        self._file.close()
+        _remove_quietly(self._tmp_path)
+
+
+class _TabFilesWriter:
+    """每个工作表一个文件, 放在以spreadsheet标题命名的目录中
+
+    各文件先写入临时文件, close() 时统一替换, discard() 时删除。
+    """
+    extension = ''
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self._written = []
+
+    def _tab_path(self, sheet_name):
+        return os.path.join(self.output_path, f"{safe_filename(sheet_name)}.{self.extension}")
+
+    def write_tab(self, sheet_name, rows):
+        os.makedirs(self.output_path, exist_ok=True)
+        tab_path = self._tab_path(sheet_name)
+        tmp_path = temp_path_for(tab_path)
+        self._written.append((tmp_path, tab_path))
+        return self._write_file(tmp_path, rows)
+
+    def _write_file(self, path, rows):
+        raise NotImplementedError
+
+    def close(self):
+        for tmp_path, tab_path in self._written:
+            os.replace(tmp_path, tab_path)
+        return self.output_path
+
+    def discard(self):
+        for tmp_path, _ in self._written:
+            _remove_quietly(tmp_path)
+
+
+class CsvTabsWriter(_TabFilesWriter):
+    """流式CSV: 行数据到达后直接写入文件"""
+    extension = 'csv'
+
+    def _write_file(self, path, rows):
+        counter = _RowCounter(rows)
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            csv.writer(f).writerows(counter)
+        return counter.count
+
+
+class ParquetTabsWriter(_TabFilesWriter):
+    """列式Parquet: 第一行作为列名, 每累积 row_group_rows 行写入一个row group
+
+    列数由第一批数据确定, 之后更长的行会被截断。依赖可选的 pyarrow。
+    """
+    extension = 'parquet'
+
+    def __init__(self, output_path, compression=DEFAULT_PARQUET_COMPRESSION,
+                 row_group_rows=DEFAULT_PARQUET_ROW_GROUP_ROWS):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError("Parquet输出需要安装 pyarrow: pip install pyarrow")
+        super().__init__(output_path)
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.compression = None if compression == 'none' else compression
+        self.row_group_rows = row_group_rows
+
+    @staticmethod
+    def _column_names(header, width):
+        names = []
+        seen = set()
+        for i in range(width):
+            name = str(header[i]) if i < len(header) and header[i] not in (None, '') else f"column_{i + 1}"
+            while name in seen:
+                name = f"{name}_{i + 1}"
+            seen.add(name)
+            names.append(name)
+        return names
+
+    def _to_table(self, batch, names):
+        width = len(names)
+        columns = [[] for _ in range(width)]
+        truncated = 0
+        for row in batch:
+            if len(row) > width:
+                truncated += 1
+            for i in range(width):
+                value = row[i] if i < len(row) else None
+                columns[i].append(None if value is None or value == '' else str(value))
+        table = self._pa.table(
+            [self._pa.array(column, type=self._pa.string()) for column in columns], names=names
+        )
+        return table, truncated
+
+    def _write_file(self, path, rows):
+        rows = iter(rows)
+        header = next(rows, None)
+        if header is None:
+            return 0
+        count = 1
+        writer = None
+        names = None
+        truncated = 0
+        try:
+            while True:
+                batch = []
+                for row in rows:
+                    batch.append(row)
+                    if len(batch) >= self.row_group_rows:
+                        break
+                if names is None:
+                    width = max([len(header)] + [len(row) for row in batch])
+                    names = self._column_names(header, width)
+                    writer = self._pq.ParquetWriter(
+                        path, self._pa.schema([(name, self._pa.string()) for name in names]),
+                        compression=self.compression
+                    )
+                if not batch:
+                    break
+                table, batch_truncated = self._to_table(batch, names)
+                writer.write_table(table, row_group_size=len(batch))
+                truncated += batch_truncated
+                count += len(batch)
+                if len(batch) < self.row_group_rows:
+                    break
+        finally:
+            if writer is not None:
+                writer.close()
+        if truncated:
+            logger.warning("[Writer] %s: %s行的列数超过表头, 多出的单元格被截断", os.path.basename(path), truncated)
+        return count
+
+
+class _RowCounter:
+    def __init__(self, rows):
+        self._rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        for row in self._rows:
+            self.count += 1
+            yield row
+
+
+def output_path_for(output_dir, file_name, options):
+    """输出路径: xlsx/jsonl 为单个文件, csv/parquet 为目录"""
+    output_format = options.output_format
+    if output_format in (FORMAT_XLSX, FORMAT_JSONL):
+        return os.path.join(output_dir, f"{file_name}.{output_format}")
+    if output_format in (FORMAT_CSV, FORMAT_PARQUET):
+        return os.path.join(output_dir, file_name)
+    raise ValueError(f"未知的输出格式: {output_format}")
+
+
+def create_writer(output_dir, file_name, options):
+    output_format = options.output_format
+    output_path = output_path_for(output_dir, file_name, options)
+    if output_format == FORMAT_XLSX:
+        if options.streaming:
+            return StreamingXlsxWriter(output_path)
+        return XlsxWorkbookWriter(output_path)
+    if output_format == FORMAT_JSONL:
+        return JsonlWriter(output_path)
+    if output_format == FORMAT_CSV:
+        return CsvTabsWriter(output_path)
+    return ParquetTabsWriter(output_path, options.parquet_compression, options.parquet_row_group_rows)
@@ -0,0 +1,429 @@
+### ============================================
+# 后台同步服务: 常驻进程, 按间隔重新同步配置文件中 recent_sheets 列表里的spreadsheet
+#    python sync_daemon.py --config config.json --interval 3600 --port 8765
+# 整个进程只认证一次, 会话、线程池和连接池一直保留; 默认开启增量同步, 内容未变化的文件不重新写入。
+# 每个sheet可以在配置中用 "sync_interval" (秒) 单独设置同步间隔。
+# 控制接口(只监听127.0.0.1):
+#   GET  /status          所有spreadsheet的状态
+#   GET  /status/<id>     单个spreadsheet的状态
+#   POST /sync            立即同步所有spreadsheet
+#   POST /sync/<id>       立即同步一个spreadsheet
+### ============================================
+
+import argparse
+import asyncio
+import dataclasses
+import json
+import math
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from dataclasses import dataclass
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional
+from batch_schedule import estimate_spreadsheet_cells
+from config_manager import ConfigManager
+from download_options import DownloadOptions
+from gsheet_to_excel_async import (
+    get_session, SheetsWorkerPool, _download_gsheet_async, _prefetch_all_metadata, DEFAULT_MAX_CONCURRENCY
+)
+from metadata_cache import MetadataCache
+from request_executor import create_request_executor, DEFAULT_REQUESTS_PER_MINUTE
+from sheets_writers import OutputNames
+from sync_state import SyncState
+from tracing import logger, configure_logging, LOG_LEVELS
+
+# 默认同步间隔(秒)
+DEFAULT_SYNC_INTERVAL = 3600
+DEFAULT_CONTROL_PORT = 8765
+# 没有到期任务时, 最长等待这么多秒后重新检查配置文件
+MAX_IDLE_SECONDS = 60
+
+
+@dataclass
+class SheetSchedule:
+    """一个spreadsheet的调度状态"""
+    spreadsheet_id: str
+    name: str = ''
+    interval: float = DEFAULT_SYNC_INTERVAL
+    next_due: float = 0.0
+    last_started: Optional[float] = None
+    last_finished: Optional[float] = None
+    # 上次同步的结果: SpreadsheetResult
+    last_result: object = None
+    in_flight: bool = False
+    # 通过控制接口手动触发, 优先于定时任务
+    triggered: bool = False
+    runs: int = 0
+    # 按元数据 gridProperties 估算的单元格数(经过工作表筛选), 尚未获取元数据时为None
+    estimated_cells: Optional[int] = None
+
+    def staleness(self, now):
+        """过期了几个同步间隔; 从未同步过的为无穷大"""
+        if self.last_finished is None:
+            return math.inf
+        return (now - self.next_due) / max(self.interval, 1)
+
+    def size(self):
+        """上次获取的字节数, 作为工作量的估计"""
+        return self.last_result.bytes_fetched if self.last_result is not None else 0
+
+    def priority(self, now):
+        """排序键: 手动触发的优先; 其次按过期的整数个同步间隔, 同一档内估算单元格数大的优先, 再按上次的数据量"""
+        staleness = self.staleness(now)
+        if not math.isinf(staleness):
+            # 连续的过期程度几乎不会相等, 不分档时大小永远不起作用
+            staleness = math.floor(staleness)
+        return (not self.triggered, -staleness, -(self.estimated_cells or 0), -self.size())
+
+    def to_dict(self):
+        return {
+            'spreadsheet_id': self.spreadsheet_id,
+            'name': self.name,
+            'interval': self.interval,
+            'next_due': self.next_due,
+            'last_started': self.last_started,
+            'last_finished': self.last_finished,
+            'in_flight': self.in_flight,
+            'triggered': self.triggered,
+            'runs': self.runs,
+            'estimated_cells': self.estimated_cells,
+            'last_result': dataclasses.asdict(self.last_result) if self.last_result is not None else None,
+        }
+
+
+class SyncDaemon:
+    """按优先级调度同步任务: 手动触发的优先, 其次按过期程度(以同步间隔分档)、估算的单元格数和上次的数据量从大到小;
+    同一个spreadsheet同时最多只有一个任务在执行"""
+
+    def __init__(self, config_manager, session=None, interval=DEFAULT_SYNC_INTERVAL,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE):
+        if interval <= 0:
+            raise ValueError(f"同步间隔必须大于0: {interval}")
+        self.config_manager = config_manager
+        self.session = session
+        self.interval = interval
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self._lock = threading.Lock()
+        self._schedules = {}
+        self._config_mtime = None
+        self._loop = None
+        self._wake = None
+        self._stopping = False
+
+    def _load_sheets(self):
+        """配置文件变化时重新读取sheet列表, 保留已有的调度状态"""
+        path = self.config_manager.config_file
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        if mtime == self._config_mtime and self._schedules:
+            return
+        self._config_mtime = mtime
+        self.config_manager.reload()
+        sheets = self.config_manager.config.get('recent_sheets', [])
+        with self._lock:
+            schedules = {}
+            for sheet in sheets:
+                schedule = self._schedules.get(sheet['id']) or SheetSchedule(sheet['id'])
+                schedule.name = sheet.get('name', '')
+                interval = sheet.get('sync_interval') or self.interval
+                if schedule.last_finished is not None and interval != schedule.interval:
+                    schedule.next_due = schedule.last_finished + interval
+                schedule.interval = interval
+                schedules[sheet['id']] = schedule
+            # 从配置中删除的sheet不再调度, 正在执行的任务会正常结束
+            self._schedules = schedules
+        logger.info("[Daemon] 读取配置: %s 个spreadsheet", len(schedules))
+
+    def _options(self):
+        return DownloadOptions(output_format=self.config_manager.config.get('output_format', 'xlsx'),
+                               requests_per_minute=self.requests_per_minute, sync=True,
+                               sheet_tab_filters=self.config_manager.tab_filters())
+
+    def _next_jobs(self, now, slots):
+        """到期且没有在执行的任务, 按优先级排序, 最多返回 slots 个"""
+        with self._lock:
+            due = [s for s in self._schedules.values()
+                   if not s.in_flight and (s.triggered or s.next_due <= now)]
+            due.sort(key=lambda s: s.priority(now))
+            jobs = due[:slots]
+            for schedule in jobs:
+                schedule.in_flight = True
+                schedule.triggered = False
+                schedule.last_started = now
+        return jobs
+
+    def _unestimated(self, now):
+        """到期但还不知道大小的spreadsheet(从未同步过, 或上次没有取得元数据)"""
+        with self._lock:
+            return [s.spreadsheet_id for s in self._schedules.values()
+                    if not s.in_flight and s.estimated_cells is None and (s.triggered or s.next_due <= now)]
+
+    async def _estimate_sizes(self, pool, spreadsheet_ids, options, metadata_cache):
+        """调度前获取元数据估算大小, 返回 {id: (metadata, 是否来自缓存, 耗时)}, 本轮开始的任务不再重复请求"""
+        outcomes = await _prefetch_all_metadata(pool, spreadsheet_ids, options, metadata_cache)
+        prefetched = {}
+        with self._lock:
+            for spreadsheet_id in spreadsheet_ids:
+                schedule = self._schedules.get(spreadsheet_id)
+                if schedule is None:
+                    continue
+                outcome = outcomes.get(spreadsheet_id)
+                if outcome is None or isinstance(outcome, BaseException):
+                    # 按0排序, 错误在同步时记录到结果中
+                    schedule.estimated_cells = 0
+                    continue
+                prefetched[spreadsheet_id] = outcome
+                schedule.estimated_cells = estimate_spreadsheet_cells(outcome[0],
+                                                                      options.tab_selection(spreadsheet_id))
+        return prefetched
+
+    def _in_flight_count(self):
+        with self._lock:
+            return sum(1 for s in self._schedules.values() if s.in_flight)
+
+    def _seconds_until_next_due(self, now):
+        """没有空闲槽位时只等待任务结束(任务结束会唤醒调度循环)"""
+        if self._in_flight_count() >= self.max_concurrency:
+            return MAX_IDLE_SECONDS
+        with self._lock:
+            pending = [s.next_due for s in self._schedules.values() if not s.in_flight]
+        if not pending:
+            return MAX_IDLE_SECONDS
+        return min(max(min(pending) - now, 0.0), MAX_IDLE_SECONDS)
+
+    def _wake_up(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def trigger(self, spreadsheet_id=None):
+        """立即同步一个(或全部)spreadsheet, 可以从其他线程调用; 返回被触发的数量"""
+        with self._lock:
+            if spreadsheet_id is None:
+                targets = list(self._schedules.values())
+            elif spreadsheet_id in self._schedules:
+                targets = [self._schedules[spreadsheet_id]]
+            else:
+                return 0
+            for schedule in targets:
+                schedule.triggered = True
+        self._wake_up()
+        return len(targets)
+
+    def status(self, spreadsheet_id=None):
+        with self._lock:
+            if spreadsheet_id is not None:
+                schedule = self._schedules.get(spreadsheet_id)
+                return schedule.to_dict() if schedule is not None else None
+            return {'sheets': [s.to_dict() for s in self._schedules.values()],
+                    'in_flight': sum(1 for s in self._schedules.values() if s.in_flight)}
+
+    def stop(self):
+        self._stopping = True
+        self._wake_up()
+
+    async def _sync_one(self, pool, schedule, output_dir, options, metadata_cache, sync_state, output_names,
+                        prefetched=None):
+        result = None
+        try:
+            result = await _download_gsheet_async(pool, schedule.spreadsheet_id, output_dir, options,
+                                                  metadata_cache, sync_state, prefetched=prefetched,
+                                                  output_names=output_names)
+        except Exception as e:
+            logger.error("[Daemon] %s 同步出错: %s", schedule.spreadsheet_id, e)
+        finally:
+            finished = time.time()
+            with self._lock:
+                schedule.in_flight = False
+                schedule.last_finished = finished
+                if result is not None:
+                    schedule.last_result = result
+                    if result.estimated_cells is not None:
+                        schedule.estimated_cells = result.estimated_cells
+                schedule.runs += 1
+                schedule.next_due = finished + schedule.interval
+            self._wake.set()
+        if result is None:
+            # 任务本身出错(已记录)或被取消, 不影响其他任务和调度循环
+            return
+        if result.ok:
+            logger.info("[Daemon] %s: %s (%ss, %s行)", schedule.spreadsheet_id, result.status, result.total_seconds,
+                        result.rows)
+        else:
+            logger.error("[Daemon] %s 同步失败: %s", schedule.spreadsheet_id, result.error)
+        # 两个任务之间才保存, 不和下载线程争用文件
+        await asyncio.to_thread(sync_state.save)
+        if metadata_cache is not None:
+            await asyncio.to_thread(metadata_cache.save)
+
+    async def run(self):
+        """运行到 stop() 被调用为止"""
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        if self.session is None:
+            self.session = await asyncio.to_thread(get_session)
+        self._load_sheets()
+        output_dir = os.path.abspath(self.config_manager.config.get('output_dir')
+                                     or os.path.join(os.path.expanduser("~"), "Downloads"))
+        os.makedirs(output_dir, exist_ok=True)
+        options = self._options()
+        # 以下对象在整个进程内复用: 限流器对所有任务生效, 元数据缓存和同步状态常驻内存
+        executor = create_request_executor(options.requests_per_minute, options.max_retries)
+        metadata_cache = MetadataCache(ttl=options.metadata_ttl) if options.metadata_ttl > 0 else None
+        sync_state = SyncState(output_dir)
+        output_names = OutputNames()
+        running = set()
+        logger.info("[Daemon] 开始运行, 输出目录: %s, 并发数: %s", output_dir, self.max_concurrency)
+        with SheetsWorkerPool(self.session, self.max_concurrency, options.page_concurrency, executor,
+                              options.transport) as pool:
+            while not self._stopping:
+                self._wake.clear()
+                self._load_sheets()
+                slots = self.max_concurrency - self._in_flight_count()
+                unestimated = self._unestimated(time.time()) if slots > 0 else []
+                prefetched = {}
+                if unestimated:
+                    # 从未同步过的spreadsheet先取得元数据, 才能按大小排序
+                    await asyncio.to_thread(self.session.ensure_fresh)
+                    prefetched = await self._estimate_sizes(pool, unestimated, self._options(), metadata_cache)
+                jobs = self._next_jobs(time.time(), slots)
+                if jobs:
+                    await asyncio.to_thread(self.session.ensure_fresh)
+                    options = self._options()
+                for schedule in jobs:
+                    logger.info("[Daemon] 开始同步: %s", schedule.spreadsheet_id)
+                    task = asyncio.ensure_future(
+                        self._sync_one(pool, schedule, output_dir, options, metadata_cache, sync_state,
+                                       output_names, prefetched.get(schedule.spreadsheet_id)))
+                    running.add(task)
+                    task.add_done_callback(running.discard)
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self._seconds_until_next_due(time.time()))
+                except asyncio.TimeoutError:
+                    pass
+            logger.info("[Daemon] 停止中, 等待 %s 个任务结束", len(running))
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        logger.info("[Daemon] 已停止")
+
+
+class ControlServer:
+    """本地HTTP控制接口, 在后台线程中运行"""
+
+    def __init__(self, daemon, port=DEFAULT_CONTROL_PORT, host='127.0.0.1'):
+        self.daemon = daemon
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def _handler_class(self):
+        daemon = self.daemon
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                logger.debug("[Control] " + format, *args)
+
+            def _send_json(self, status, body):
+                data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=UTF-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _target(self, prefix):
+                """/prefix 返回 (True, None), /prefix/<id> 返回 (True, id), 其他路径返回 (False, None)"""
+                path = self.path.split('?')[0].rstrip('/')
+                if path == prefix:
+                    return True, None
+                if path.startswith(prefix + '/'):
+                    return True, path[len(prefix) + 1:]
+                return False, None
+
+            def do_GET(self):
+                matched, spreadsheet_id = self._target('/status')
+                if not matched:
+                    self._send_json(404, {'error': f'未知路径: {self.path}'})
+                    return
+                body = daemon.status(spreadsheet_id)
+                if body is None:
+                    self._send_json(404, {'error': f'不在同步列表中: {spreadsheet_id}'})
+                    return
+                self._send_json(200, body)
+
+            def do_POST(self):
+                matched, spreadsheet_id = self._target('/sync')
+                if not matched:
+                    self._send_json(404, {'error': f'未知路径: {self.path}'})
+                    return
+                triggered = daemon.trigger(spreadsheet_id)
+                if spreadsheet_id is not None and not triggered:
+                    self._send_json(404, {'error': f'不在同步列表中: {spreadsheet_id}'})
+                    return
+                self._send_json(202, {'triggered': triggered})
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='gsheet-control', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="后台定时同步配置文件中的Google Sheets")
+    parser.add_argument("--config", default='config.json', help="GUI使用的配置文件 (默认: config.json)")
+    parser.add_argument("--interval", type=int, default=DEFAULT_SYNC_INTERVAL,
+                        help=f"默认同步间隔(秒), 可在配置中用 sync_interval 单独设置 (默认: {DEFAULT_SYNC_INTERVAL})")
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help=f"同时同步的spreadsheet数量上限 (默认: {DEFAULT_MAX_CONCURRENCY})")
+    parser.add_argument("--requests-per-minute", type=int, default=DEFAULT_REQUESTS_PER_MINUTE,
+                        help=f"所有任务共享的每分钟请求数上限, 0表示不限流 (默认: {DEFAULT_REQUESTS_PER_MINUTE})")
+    parser.add_argument("--port", type=int, default=DEFAULT_CONTROL_PORT,
+                        help=f"控制接口端口, 只监听127.0.0.1, 0表示不开启 (默认: {DEFAULT_CONTROL_PORT})")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default='INFO')
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+    try:
+        daemon = SyncDaemon(ConfigManager(args.config), interval=args.interval,
+                            max_concurrency=args.max_concurrency, requests_per_minute=args.requests_per_minute)
+    except ValueError as e:
+        parser.error(str(e))
+
+    control = None
+    if args.port:
+        control = ControlServer(daemon, args.port).start()
+        logger.info("[Daemon] 控制接口: %s", control.address)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, daemon.stop)
+            except (NotImplementedError, RuntimeError):
+                # Windows不支持, Ctrl+C 由 KeyboardInterrupt 处理
+                pass
+        await daemon.run()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if control is not None:
+            control.stop()
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
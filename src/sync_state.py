@@ -0,0 +1,119 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from sheets_writers import write_json_atomically
+from tracing import logger
+from work_sharding import worker_path
+
+# 保存在输出目录中的同步状态文件
+SYNC_STATE_FILE = ".gsheet_sync_state.json"
+
+
+def hash_rows(rows, hasher):
+    """逐行更新hasher的同时原样产出各行, 可直接串在写入器之前"""
+    for row in rows:
+        hasher.update(repr(row).encode('utf-8'))
+        hasher.update(b'\n')
+        yield row
+
+
+class WorkbookFingerprint:
+    """一个spreadsheet的内容指纹: 每个工作表一个值哈希, 整体指纹由工作表名和哈希按顺序组合"""
+
+    def __init__(self):
+        self.tabs = {}
+        self._hashers = []
+
+    def wrap_tab(self, sheet_name, rows):
+        hasher = hashlib.sha256()
+        self._hashers.append((sheet_name, hasher))
+        return hash_rows(rows, hasher)
+
+    def last_tab_digest(self):
+        """最近一个工作表的哈希, 在该工作表的行全部读取之后调用"""
+        return self._hashers[-1][1].hexdigest()
+
+    def finish(self):
+        combined = hashlib.sha256()
+        for sheet_name, hasher in self._hashers:
+            digest = hasher.hexdigest()
+            self.tabs[sheet_name] = digest
+            combined.update(sheet_name.encode('utf-8'))
+            combined.update(digest.encode('ascii'))
+        return combined.hexdigest()
+
+
+class SyncState:
+    """记录每个spreadsheet上次写入时的指纹, 用于跳过内容未变化的下载"""
+
+    def __init__(self, output_dir, worker_name=None):
+        # 多个worker共用输出目录时各自保存状态文件, 读取时合并所有worker的状态
+        self.path = worker_path(os.path.join(output_dir, SYNC_STATE_FILE), worker_name)
+        self._lock = threading.Lock()
+        self._entries = self._load()
+        self.skipped = 0
+        self.refreshed = 0
+        self.tabs_unchanged = 0
+        self.tabs_changed = 0
+
+    def _load(self):
+        root, ext = os.path.splitext(os.path.join(os.path.dirname(self.path), SYNC_STATE_FILE))
+        entries = {}
+        for path in sorted({self.path, f"{root}{ext}", *glob.glob(f"{glob.escape(root)}.*{ext}")}):
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    loaded = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning("[Sync] 读取同步状态失败, 其中的文件将重新写入: %s: %s", path, e)
+                continue
+            # 同一个spreadsheet由不同的worker同步过时, 使用最近一次的记录
+            for spreadsheet_id, entry in loaded.items():
+                known = entries.get(spreadsheet_id)
+                if known is None or entry.get('synced_at', 0) > known.get('synced_at', 0):
+                    entries[spreadsheet_id] = entry
+        return entries
+
+    def is_unchanged(self, spreadsheet_id, output_path, fingerprint, tab_fingerprints):
+        """比较指纹并更新工作表计数; 目标文件不存在时视为已变化"""
+        with self._lock:
+            entry = self._entries.get(spreadsheet_id, {})
+        previous_tabs = entry.get('tabs', {})
+        unchanged_tabs = sum(1 for name, digest in tab_fingerprints.items()
+                             if previous_tabs.get(name) == digest)
+        unchanged = (entry.get('fingerprint') == fingerprint
+                     and entry.get('path') == output_path
+                     and os.path.exists(output_path))
+        with self._lock:
+            self.tabs_unchanged += unchanged_tabs
+            self.tabs_changed += len(tab_fingerprints) - unchanged_tabs
+            if unchanged:
+                self.skipped += 1
+        return unchanged
+
+    def record(self, spreadsheet_id, output_path, fingerprint, tab_fingerprints):
+        with self._lock:
+            self.refreshed += 1
+            self._entries[spreadsheet_id] = {
+                'path': output_path,
+                'fingerprint': fingerprint,
+                'tabs': tab_fingerprints,
+                'synced_at': time.time(),
+            }
+
+    def summary(self):
+        with self._lock:
+            return {
+                'skipped': self.skipped,
+                'refreshed': self.refreshed,
+                'tabs_unchanged': self.tabs_unchanged,
+                'tabs_changed': self.tabs_changed,
+            }
+
+    def save(self):
+        with self._lock:
+            write_json_atomically(self.path, self._entries, indent=2)
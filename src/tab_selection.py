@@ -0,0 +1,154 @@
+import fnmatch
+import re
+from dataclasses import dataclass, field
+from tracing import logger
+
+# 以 re: 开头的模式为正则表达式(匹配整个工作表名), 其他为glob通配符(* ? [...]), 都区分大小写
+REGEX_PREFIX = 're:'
+# 配置文件中每个Sheet条目保存筛选条件的字段
+FILTER_KEYS = ('include_tabs', 'exclude_tabs', 'tab_ranges')
+
+# 不带工作表名的A1范围: A1:F200, A:F, 2:500, B2:F (到最后一行), C5 (单个单元格)
+_A1_RANGE = re.compile(r'^([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?$')
+
+
+def column_number(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number
+
+
+@dataclass(frozen=True)
+class A1Range:
+    """工作表内的矩形范围; 列为空表示所有列, end_row为None表示到最后一行"""
+    first_column: str
+    last_column: str
+    first_row: int
+    end_row: object = None
+
+    def window(self, start, end):
+        """范围内第 start 到 end 行(从1开始)的A1表示, 不含工作表名"""
+        return (f"{self.first_column}{self.first_row + start - 1}:"
+                f"{self.last_column}{self.first_row + end - 1}")
+
+    def __str__(self):
+        end_row = '' if self.end_row is None else self.end_row
+        return f"{self.first_column}{self.first_row}:{self.last_column}{end_row}"
+
+
+def parse_a1_range(text):
+    """解析A1范围, 无法识别时抛出ValueError"""
+    match = _A1_RANGE.match(text.strip().upper())
+    if not match or not (match.group(1) or match.group(2)):
+        raise ValueError(f"无法识别的A1范围: {text}")
+    first_column, first_row, last_column, end_row = match.groups()
+    if last_column is None and end_row is None:
+        # 单个单元格
+        last_column, end_row = first_column, first_row
+    if bool(first_column) != bool(last_column):
+        raise ValueError(f"A1范围的起止必须都指定列或都不指定列: {text}")
+    if not first_column and not (first_row and end_row):
+        raise ValueError(f"只指定行的A1范围必须包含起止行号, 例如 2:500: {text}")
+    first_row = int(first_row) if first_row else 1
+    end_row = int(end_row) if end_row else None
+    if first_row < 1 or (end_row is not None and end_row < first_row):
+        raise ValueError(f"A1范围的行号无效: {text}")
+    if first_column and column_number(last_column) < column_number(first_column):
+        raise ValueError(f"A1范围的列无效: {text}")
+    return A1Range(first_column, last_column, first_row, end_row)
+
+
+def parse_tab_range(text):
+    """解析 "工作表名=A1范围" (命令行和GUI中的写法), 返回 (工作表名, A1范围)"""
+    sheet_name, sep, a1_range = text.rpartition('=')
+    if not sep or not sheet_name:
+        raise ValueError(f"范围的格式应为 工作表名=A1范围, 例如 Sales=A1:F200: {text}")
+    parse_a1_range(a1_range)
+    return sheet_name, a1_range.strip()
+
+
+def split_list(text, separator=';'):
+    """GUI中以分号分隔的列表, 去掉空项"""
+    return [item.strip() for item in text.split(separator) if item.strip()]
+
+
+def _compile_pattern(pattern):
+    if pattern.startswith(REGEX_PREFIX):
+        try:
+            return re.compile(pattern[len(REGEX_PREFIX):]).fullmatch
+        except re.error as e:
+            raise ValueError(f"无效的正则表达式 {pattern}: {str(e)}")
+    return lambda name: fnmatch.fnmatchcase(name, pattern)
+
+
+@dataclass
+class TabSelection:
+    """工作表筛选: include 非空时只保留匹配其中任意一个模式的工作表, 再去掉匹配 exclude 的;
+    ranges 中指定了范围的工作表总是保留, 只获取该范围"""
+    include: list = field(default_factory=list)
+    exclude: list = field(default_factory=list)
+    ranges: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        self._include = [_compile_pattern(pattern) for pattern in self.include]
+        self._exclude = [_compile_pattern(pattern) for pattern in self.exclude]
+        self._ranges = {sheet_name: parse_a1_range(a1_range) for sheet_name, a1_range in self.ranges.items()}
+
+    @classmethod
+    def from_filters(cls, filters):
+        """由 {'include_tabs': [...], 'exclude_tabs': [...], 'tab_ranges': {...}} 创建"""
+        return cls(list(filters.get('include_tabs') or []), list(filters.get('exclude_tabs') or []),
+                   dict(filters.get('tab_ranges') or {}))
+
+    @property
+    def empty(self):
+        return not (self.include or self.exclude or self.ranges)
+
+    def matches(self, sheet_name):
+        if sheet_name in self._ranges:
+            return True
+        if self._include and not any(match(sheet_name) for match in self._include):
+            return False
+        return not any(match(sheet_name) for match in self._exclude)
+
+    def apply(self, sheet_properties_list, quiet=False):
+        """筛选工作表属性列表; 指定了范围的工作表替换为只描述该范围的属性(带 a1_range, 网格大小为范围大小)
+        quiet 为True时不记录日志(只用于估算)"""
+        if self.empty:
+            return sheet_properties_list
+        selected = []
+        for props in sheet_properties_list:
+            sheet_name = props['title']
+            if not self.matches(sheet_name):
+                if not quiet:
+                    logger.debug("[Select] 跳过工作表: %s", sheet_name)
+                continue
+            a1_range = self._ranges.get(sheet_name)
+            if a1_range is not None:
+                props = range_properties(props, a1_range)
+                if not props['gridProperties']['rowCount']:
+                    # 超出网格的范围会被API拒绝
+                    if not quiet:
+                        logger.warning("[Select] 工作表 %s 的范围 %s 超出了工作表的行数, 跳过", sheet_name, a1_range)
+                    continue
+            selected.append(props)
+        missing = set(self._ranges) - {props['title'] for props in sheet_properties_list}
+        if missing and not quiet:
+            logger.warning("[Select] 指定了范围的工作表不存在或已隐藏: %s", sorted(missing))
+        return selected
+
+
+def range_properties(sheet_properties, a1_range):
+    """把工作表属性改为描述 a1_range 的属性, 用于估算大小、分组和分页"""
+    grid = sheet_properties.get('gridProperties', {})
+    grid_rows = grid.get('rowCount', 0)
+    last_row = grid_rows if a1_range.end_row is None else min(a1_range.end_row, grid_rows)
+    if a1_range.first_column:
+        columns = column_number(a1_range.last_column) - column_number(a1_range.first_column) + 1
+    else:
+        columns = grid.get('columnCount', 0)
+    props = dict(sheet_properties)
+    props['gridProperties'] = dict(grid, rowCount=max(last_row - a1_range.first_row + 1, 0), columnCount=columns)
+    props['a1_range'] = a1_range
+    return props
@@ -0,0 +1,191 @@
+import marshal
+import multiprocessing
+import pickle
+import queue
+from concurrent.futures import ProcessPoolExecutor, wait
+from sheets_writers import create_writer, output_path_for
+
+# 每个传输块包含的行数, 写入进程逐块解码, 不会一次展开整个工作表
+TRANSFER_CHUNK_ROWS = 10_000
+# 每个输出文件的传输队列中最多等待的消息数, 下载线程领先写入进程太多时等待, 内存不随工作簿大小增长
+TRANSFER_QUEUE_SIZE = 4
+# 队列已满时每隔这么多秒检查一次写入进程是否已经出错退出
+_PUT_POLL_SECONDS = 0.5
+
+# 传输队列中的消息: ('tab', 工作表名) 开始一个工作表, 之后是该工作表的编码块(bytes), 以 _TAB_END 结束;
+# 最后是 _CLOSE (保存文件) 或 _DISCARD (丢弃)
+_TAB_START = 'tab'
+_TAB_END = 'end'
+_CLOSE = 'close'
+_DISCARD = 'discard'
+
+_CELL_SEP = '\x1f'
+_ROW_SEP = '\x1e'
+_TEXT = b'T'
+_MARSHAL = b'M'
+_PICKLE = b'P'
+
+
+def encode_rows(rows):
+    """把若干行编码为一个bytes, 传给写入进程时只需复制一块内存, 不必逐个pickle字符串
+
+    全部是字符串时使用分隔符拼接的UTF-8文本; 含有其他类型或分隔符本身时退回marshal,
+    含有日期等marshal不支持的类型时使用pickle。
+    """
+    if not rows or [''] in rows:
+        return _binary(rows)
+    try:
+        text = _ROW_SEP.join([_CELL_SEP.join(row) for row in rows])
+    except TypeError:
+        return _binary(rows)
+    cell_seps = sum(len(row) - 1 for row in rows if row)
+    if text.count(_CELL_SEP) != cell_seps or text.count(_ROW_SEP) != len(rows) - 1:
+        return _binary(rows)
+    return _TEXT + text.encode('utf-8')
+
+
+def _binary(rows):
+    try:
+        return _MARSHAL + marshal.dumps(rows)
+    except ValueError:
+        return _PICKLE + pickle.dumps(rows, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def decode_rows(blob):
+    tag = blob[:1]
+    if tag == _MARSHAL:
+        return marshal.loads(blob[1:])
+    if tag == _PICKLE:
+        return pickle.loads(blob[1:])
+    text = blob[1:].decode('utf-8')
+    return [row.split(_CELL_SEP) if row else [] for row in text.split(_ROW_SEP)]
+
+
+def iter_encoded(rows):
+    """把一个工作表的行按 TRANSFER_CHUNK_ROWS 分块编码, 逐块产出 (编码块, 块中的行数)"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= TRANSFER_CHUNK_ROWS:
+            yield encode_rows(batch), len(batch)
+            batch = []
+    if batch:
+        yield encode_rows(batch), len(batch)
+
+
+def encode_tab(rows):
+    """把一个工作表的行全部编码, 返回 ([编码块, ...], 行数)"""
+    chunks = []
+    count = 0
+    for chunk, rows_in_chunk in iter_encoded(rows):
+        chunks.append(chunk)
+        count += rows_in_chunk
+    return chunks, count
+
+
+def decode_chunks(chunks):
+    """逐块解码, 不会一次展开整个工作表"""
+    for chunk in chunks:
+        yield from decode_rows(chunk)
+
+
+class _Discarded(Exception):
+    pass
+
+
+def _queued_rows(transfer_queue):
+    """逐块读取一个工作表的编码块并解码, 直到 _TAB_END"""
+    while True:
+        message = transfer_queue.get()
+        if message == _TAB_END:
+            return
+        if message == _DISCARD:
+            raise _Discarded()
+        yield from decode_rows(message)
+
+
+def write_transferred_tabs(output_dir, file_name, options, transfer_queue):
+    """在写入进程中执行: 从传输队列逐个读取工作表写入, 收到 _CLOSE 时保存并返回输出路径, 收到 _DISCARD 时返回None"""
+    writer = create_writer(output_dir, file_name, options)
+    try:
+        while True:
+            message = transfer_queue.get()
+            if message == _CLOSE:
+                return writer.close()
+            if message == _DISCARD:
+                raise _Discarded()
+            _, sheet_name = message
+            writer.write_tab(sheet_name, _queued_rows(transfer_queue))
+    except _Discarded:
+        writer.discard()
+        return None
+    except Exception:
+        writer.discard()
+        raise
+
+
+class WriterProcessPool:
+    """写入进程池; 每个输出文件在一个写入进程中生成, 数据通过管理进程中的有界队列逐块传入
+
+    spawn: 避免在多线程进程中fork
+    """
+
+    def __init__(self, processes):
+        context = multiprocessing.get_context('spawn')
+        self._executor = ProcessPoolExecutor(max_workers=processes, mp_context=context)
+        self._manager = context.Manager()
+
+    def open(self, output_dir, file_name, options):
+        """提交一个输出文件的写入任务, 返回 (传输队列, Future)"""
+        transfer_queue = self._manager.Queue(TRANSFER_QUEUE_SIZE)
+        future = self._executor.submit(write_transferred_tabs, output_dir, file_name, options, transfer_queue)
+        return transfer_queue, future
+
+    def shutdown(self):
+        # 所有下载线程已经结束; 先关闭管理进程, 没有收到结束消息的写入任务读取队列时出错退出, 不会一直等待
+        self._manager.shutdown()
+        self._executor.shutdown(wait=True)
+
+
+class TabTransferWriter:
+    """与其他写入器接口相同, 但只把行数据编码成传输块, 每块编码完成后立即交给写入进程
+
+    写入进程与下载线程同时工作: 编码和保存文件不占用本进程的GIL, 其他下载线程的网络请求可以继续进行;
+    传输队列有界, 内存中只保留几个传输块。写入进程都在处理其他文件时, 队列满后下载线程等待。
+    """
+
+    def __init__(self, output_dir, file_name, options, process_pool):
+        self.output_path = output_path_for(output_dir, file_name, options)
+        self._queue, self._future = process_pool.open(output_dir, file_name, options)
+
+    def _send(self, message):
+        while True:
+            try:
+                self._queue.put(message, timeout=_PUT_POLL_SECONDS)
+                return
+            except queue.Full:
+                if self._future.done():
+                    # 写入进程出错后不再读取队列
+                    self._future.result()
+                    raise RuntimeError(f"写入进程已结束: {self.output_path}")
+
+    def write_tab(self, sheet_name, rows):
+        self._send((_TAB_START, sheet_name))
+        count = 0
+        for chunk, rows_in_chunk in iter_encoded(rows):
+            self._send(chunk)
+            count += rows_in_chunk
+        self._send(_TAB_END)
+        return count
+
+    def close(self):
+        self._send(_CLOSE)
+        return self._future.result()
+
+    def discard(self):
+        """丢弃: 写入任务尚未开始时直接取消, 否则通知写入进程删除临时文件并等待它结束"""
+        if self._future.cancel():
+            return
+        if not self._future.done():
+            self._send(_DISCARD)
+        wait([self._future])
@@ -0,0 +1,214 @@
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+# 下载流程共用的logger, 消息自带 [Async]/[Fetch] 等前缀
+logger = logging.getLogger('gsheet')
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+
+
+def configure_logging(level='INFO'):
+    """输出到stdout, 只显示消息本身; 低于 level 的日志不做格式化"""
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.handlers[:] = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+class _NullSpan:
+    """未开启追踪时使用的共享空span"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'attrs', 'start')
+
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.tracer._record(self.name, self.start, time.perf_counter(), self.attrs)
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class Tracer:
+    """span计时和计数器; 未开启时 span() 返回共享的空对象, count() 直接返回
+
+    span名称: auth, metadata, values_fetch, conversion, append, save
+    计数器: RequestStats 的各项(requests, bytes_received, retries...) 和 cells
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._origin = time.perf_counter()
+        self._events = []
+        self._totals = {}
+        self._counters = {}
+
+    def enable(self):
+        with self._lock:
+            self._reset()
+            self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name, **attrs):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, attrs)
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def _record(self, name, start, end, attrs):
+        with self._lock:
+            total = self._totals.setdefault(name, [0, 0.0])
+            total[0] += 1
+            total[1] += end - start
+            self._events.append((name, start, end - start, threading.get_ident(), attrs))
+
+    def summary(self):
+        """{'spans': {名称: {'count', 'total_seconds'}}, 'counters': {...}}"""
+        with self._lock:
+            return {
+                'spans': {name: {'count': count, 'total_seconds': round(total, 3)}
+                          for name, (count, total) in self._totals.items()},
+                'counters': dict(self._counters),
+            }
+
+    def chrome_trace(self):
+        """Chrome trace格式(chrome://tracing 或 Perfetto 可直接打开)"""
+        pid = os.getpid()
+        with self._lock:
+            events = [{
+                'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+                'ts': round((start - self._origin) * 1e6, 1), 'dur': round(duration * 1e6, 1),
+                'args': {key: str(value) for key, value in attrs.items()},
+            } for name, start, duration, tid, attrs in self._events]
+            end_ts = round((time.perf_counter() - self._origin) * 1e6, 1)
+            events.extend({'name': name, 'ph': 'C', 'pid': pid, 'tid': 0, 'ts': end_ts, 'args': {name: value}}
+                          for name, value in self._counters.items())
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save_chrome_trace(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f)
+        return path
+
+
+tracer = Tracer()
+
+
+class ThreadProfiler:
+    """cProfile只统计开启它的线程; 每个线程使用各自的Profile, 结束时合并"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profiles = []
+
+    def _thread_profile(self):
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            import cProfile
+            profile = self._local.profile = cProfile.Profile()
+            with self._lock:
+                self._profiles.append(profile)
+        return profile
+
+    def call(self, func, *args):
+        profile = self._thread_profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 当前线程已经有其他profiler在运行
+            return func(*args)
+        try:
+            return func(*args)
+        finally:
+            profile.disable()
+
+    def stats(self):
+        with self._lock:
+            profiles = [profile for profile in self._profiles if profile.getstats()]
+        if not profiles:
+            return None
+        import pstats
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+
+# 开启 --profile 时的cProfile收集器, 工作线程通过 profiled_call 执行任务
+_profiler = None
+
+
+def profiled_call(func, *args):
+    profiler = _profiler
+    if profiler is None:
+        return func(*args)
+    return profiler.call(func, *args)
+
+
+def run_profiled(func, path, top=30):
+    """执行 func() 并保存性能数据: path 以 .json 结尾时保存Chrome trace, 否则保存cProfile统计(pstats格式)"""
+    global _profiler
+    if path.endswith('.json'):
+        tracer.enable()
+        try:
+            return func()
+        finally:
+            tracer.save_chrome_trace(path)
+            tracer.disable()
+            logger.info("[Trace] Chrome trace已保存: %s", path)
+            logger.info("[Trace] %s", tracer.summary())
+
+    _profiler = ThreadProfiler()
+    try:
+        return _profiler.call(func)
+    finally:
+        stats = _profiler.stats()
+        _profiler = None
+        if stats is not None:
+            stats.dump_stats(path)
+            output = io.StringIO()
+            stats.stream = output
+            stats.sort_stats('cumulative').print_stats(top)
+            logger.info("[Profile] cProfile统计已保存: %s (所有线程合并)", path)
+            logger.info("%s", output.getvalue())
@@ -0,0 +1,91 @@
+import datetime
+from sheets_fetch import window_range, group_ranges_for_batch, MAX_BATCH_URL_LENGTH
+from tracing import tracer
+
+# 读取第2行(表头下的第一行数据, 指定了范围时为范围内的第2行)的数字格式, 作为整列的类型
+SAMPLE_ROW = 2
+COLUMN_FORMAT_FIELDS = 'sheets(properties.title,data.rowData.values.effectiveFormat.numberFormat.type)'
+# 每次转换的行数: 按列批量转换时一批数据中每列只确定一次转换函数
+CONVERT_BATCH_ROWS = 10_000
+
+TYPE_DATE = 'DATE'
+TYPE_TIME = 'TIME'
+TYPE_DATE_TIME = 'DATE_TIME'
+
+# Sheets的日期序列号以1899-12-30为第0天
+_EPOCH = datetime.datetime(1899, 12, 30)
+_EPOCH_DATE = _EPOCH.date()
+_SECONDS_PER_DAY = 86400
+
+
+def serial_to_date(serial):
+    return _EPOCH_DATE + datetime.timedelta(days=int(serial // 1))
+
+
+def serial_to_datetime(serial):
+    # 保留到毫秒, 避免浮点误差产生 23:59:59.999999 这样的值
+    return _EPOCH + datetime.timedelta(seconds=round(serial * _SECONDS_PER_DAY, 3))
+
+
+def serial_to_time(serial):
+    seconds = round((serial % 1) * _SECONDS_PER_DAY, 3)
+    return (datetime.datetime.min + datetime.timedelta(seconds=min(seconds, _SECONDS_PER_DAY - 0.001))).time()
+
+
+_CONVERTERS = {
+    TYPE_DATE: serial_to_date,
+    TYPE_DATE_TIME: serial_to_datetime,
+    TYPE_TIME: serial_to_time,
+}
+
+
+def fetch_column_types(service, spreadsheet_id, sheet_properties_list):
+    """一次 spreadsheets.get 读取各工作表样本行的数字格式, 返回 {工作表名: [格式类型或None, ...]}"""
+    column_types = {}
+    # range带有 !2:2 后缀, 为URL长度留出余量
+    for group in group_ranges_for_batch(sheet_properties_list, max_url_length=MAX_BATCH_URL_LENGTH // 2,
+                                        max_cells=float('inf')):
+        result = service.spreadsheets().get(
+            spreadsheetId=spreadsheet_id,
+            ranges=[window_range(props, SAMPLE_ROW, SAMPLE_ROW) for props in group],
+            fields=COLUMN_FORMAT_FIELDS
+        ).execute()
+        for sheet in result.get('sheets', []):
+            row_data = (sheet.get('data') or [{}])[0].get('rowData') or [{}]
+            column_types[sheet['properties']['title']] = [
+                cell.get('effectiveFormat', {}).get('numberFormat', {}).get('type')
+                for cell in row_data[0].get('values', [])
+            ]
+    return column_types
+
+
+def column_converters(column_types):
+    """[(列序号, 转换函数), ...]; 只有日期/时间列需要转换, 数值在JSON中已经是数字"""
+    return [(index, _CONVERTERS[t]) for index, t in enumerate(column_types or []) if t in _CONVERTERS]
+
+
+def convert_columns(rows, converters):
+    """按列原地转换一批行: 每列的转换函数只确定一次, 只转换数值单元格(表头等文本保持不变)"""
+    with tracer.span('conversion', rows=len(rows)):
+        for index, convert in converters:
+            for row in rows:
+                if len(row) > index:
+                    value = row[index]
+                    if type(value) is float or type(value) is int:
+                        row[index] = convert(value)
+    return rows
+
+
+def typed_rows(rows, column_types, batch_rows=CONVERT_BATCH_ROWS):
+    """把UNFORMATTED_VALUE取得的行转换为带类型的值, 逐批产出"""
+    converters = column_converters(column_types)
+    if not converters:
+        yield from rows
+        return
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_rows:
+            yield from convert_columns(batch, converters)
+            batch = []
+    yield from convert_columns(batch, converters)
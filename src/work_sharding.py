@@ -0,0 +1,319 @@
+import hashlib
+import json
+import os
+import re
+import socket
+import threading
+import time
+import uuid
+from urllib.parse import quote
+from run_report import STATUS_FAILED
+from sheets_writers import temp_path_for, write_json_atomically
+from tracing import logger
+
+# 租约的默认有效秒数; 持有租约的worker每隔三分之一有效期续租一次, 崩溃的worker的租约过期后由其他worker接手
+DEFAULT_LEASE_SECONDS = 300
+# 剩余的项目都被其他worker持有时, 等待租约过期或完成的轮询间隔上限
+MAX_POLL_SECONDS = 5.0
+# 不指定ID加入队列时, 等待第一个worker创建队列的秒数
+DEFAULT_JOIN_TIMEOUT = 60
+
+_SHARD = re.compile(r'^\s*(\d+)\s*/\s*(\d+)\s*$')
+_UNSAFE_NAME_CHARS = re.compile(r'[^\w.-]')
+
+
+def parse_shard(text):
+    """解析 i/N (i 从1开始), 返回 (i, N); 格式错误时抛出ValueError"""
+    match = _SHARD.match(text)
+    if not match:
+        raise ValueError(f"分片的格式应为 i/N, 例如 1/4: {text}")
+    index, count = int(match.group(1)), int(match.group(2))
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"分片序号必须在1到{count}之间: {text}")
+    return index, count
+
+
+def shard_of(spreadsheet_id, count):
+    """ID所属的分片(从1开始); 使用稳定的哈希, 不同主机和进程的结果相同"""
+    digest = hashlib.sha1(spreadsheet_id.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count + 1
+
+
+def shard_ids(spreadsheet_ids, index, count):
+    """按ID的哈希划分, 保持输入顺序; 各分片互不重叠, 合起来是完整的列表"""
+    return [spreadsheet_id for spreadsheet_id in spreadsheet_ids if shard_of(spreadsheet_id, count) == index]
+
+
+def shard_worker_name(index, count):
+    return f"shard-{index}-of-{count}"
+
+
+def default_worker_name():
+    """队列模式的默认worker名称; 同一主机上运行多个worker时需要分别指定 --worker-name"""
+    return socket.gethostname() or 'worker'
+
+
+def worker_path(path, worker_name):
+    """在文件名的扩展名前插入worker名称: gsheet_run_report.json -> gsheet_run_report.host-1.json"""
+    if not worker_name:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{_UNSAFE_NAME_CHARS.sub('_', worker_name)}{ext}"
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        # 另一个worker刚创建、还没写完的文件
+        return {}
+
+
+class LeaseQueue:
+    """多台主机共享的工作队列, 保存在网络文件系统的一个目录中, 不需要协调进程
+
+    items.json 为所有ID(第一个worker创建, 之后的worker使用同一个列表);
+    leases/ 中每个ID一个租约文件, 用 O_CREAT|O_EXCL 创建, 同一时刻只有一个worker能取得;
+    done/ 中每个ID一个完成记录(成功或失败都记录, 失败的不会被其他worker重试)。
+    租约按各主机的系统时间判断过期, 主机之间的时钟误差应远小于租约有效期。
+    过期的租约先改名再重新创建, 只有一个worker能接手; 极少数情况下(续租与接手同时发生)
+    同一个ID可能被下载两次, 输出文件都是先写临时文件再替换, 重复下载不会产生损坏的文件。
+    没有使用SQLite: 它的文件锁在网络文件系统上不可靠。
+    """
+
+    def __init__(self, path, worker_name=None, lease_seconds=DEFAULT_LEASE_SECONDS):
+        if lease_seconds <= 0:
+            raise ValueError(f"租约有效期必须大于0: {lease_seconds}")
+        self.path = path
+        self.worker_name = worker_name or default_worker_name()
+        # 同名的多个进程也互相区分
+        self.owner = f"{self.worker_name}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds
+        self._items_path = os.path.join(path, 'items.json')
+        self._lease_dir = os.path.join(path, 'leases')
+        self._done_dir = os.path.join(path, 'done')
+        self._held = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+        self.ids = []
+
+    def _key(self, spreadsheet_id):
+        return quote(spreadsheet_id, safe='')
+
+    def _lease_path(self, spreadsheet_id):
+        return os.path.join(self._lease_dir, f"{self._key(spreadsheet_id)}.lease")
+
+    def _done_path(self, spreadsheet_id):
+        return os.path.join(self._done_dir, f"{self._key(spreadsheet_id)}.json")
+
+    def init(self, spreadsheet_ids, join_timeout=DEFAULT_JOIN_TIMEOUT, sleep=time.sleep):
+        """创建队列, 已存在时使用已有的ID列表; 返回队列中的ID列表
+
+        不指定ID时只加入已有的队列(不会用空列表创建队列): 等待其他worker创建队列, 最多 join_timeout 秒,
+        超时后抛出ValueError。
+        """
+        os.makedirs(self._lease_dir, exist_ok=True)
+        os.makedirs(self._done_dir, exist_ok=True)
+        if not spreadsheet_ids:
+            self.ids = self._wait_for_items(join_timeout, sleep)
+            return self.ids
+        tmp_path = temp_path_for(self._items_path)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'ids': list(spreadsheet_ids), 'created_at': time.time(), 'created_by': self.owner}, f)
+        try:
+            # link 在目标已存在时失败, 多个worker同时启动时只有一个的列表生效
+            os.link(tmp_path, self._items_path)
+            logger.info("[Queue] 创建队列: %s 个spreadsheet", len(spreadsheet_ids))
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+        self.ids = self.read_ids()
+        if spreadsheet_ids and list(spreadsheet_ids) != self.ids:
+            logger.warning("[Queue] 队列已存在, 使用队列中的 %s 个ID, 忽略本次指定的ID列表", len(self.ids))
+        return self.ids
+
+    def _wait_for_items(self, timeout, sleep):
+        deadline = time.monotonic() + timeout
+        logged = False
+        while True:
+            ids = self.read_ids()
+            if ids:
+                return ids
+            if time.monotonic() >= deadline:
+                raise ValueError(f"队列尚未创建: {self.path}; 第一个worker需要指定spreadsheet ID")
+            if not logged:
+                logger.info("[Queue] 等待其他worker创建队列(最多%s秒): %s", timeout, self.path)
+                logged = True
+            sleep(min(1.0, max(deadline - time.monotonic(), 0)))
+
+    def _expired(self, lease_path, now):
+        lease = _read_json(lease_path)
+        if lease is None:
+            return False
+        if 'expires_at' in lease:
+            return lease['expires_at'] < now
+        # 内容还没写完(或损坏), 按修改时间判断
+        try:
+            return os.path.getmtime(lease_path) + self.lease_seconds < now
+        except FileNotFoundError:
+            return False
+
+    def _write_lease(self, lease_path, fd=None):
+        data = {'owner': self.owner, 'worker': self.worker_name, 'expires_at': time.time() + self.lease_seconds}
+        if fd is None:
+            write_json_atomically(lease_path, data)
+            return
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+
+    def _try_lease(self, spreadsheet_id, now):
+        lease_path = self._lease_path(spreadsheet_id)
+        if os.path.exists(lease_path):
+            if not self._expired(lease_path, now):
+                return False
+            # 先改名: 只有一个worker的改名会成功
+            stale_path = f"{lease_path}.{uuid.uuid4().hex}.expired"
+            try:
+                os.rename(lease_path, stale_path)
+            except FileNotFoundError:
+                return False
+            if not self._expired(stale_path, time.time()):
+                # 改名前刚被续租, 放回原处
+                try:
+                    os.link(stale_path, lease_path)
+                except FileExistsError:
+                    pass
+                os.remove(stale_path)
+                return False
+            previous = _read_json(stale_path) or {}
+            os.remove(stale_path)
+            logger.warning("[Queue] %s 的租约已过期(worker: %s), 重新领取", spreadsheet_id, previous.get('worker'))
+        try:
+            fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        self._write_lease(lease_path, fd)
+        with self._lock:
+            self._held.add(spreadsheet_id)
+        return True
+
+    def try_claim(self):
+        """领取下一个ID; 返回 (ID或None, 是否还有其他worker持有的未完成项目)"""
+        now = time.time()
+        waiting = False
+        for spreadsheet_id in self.ids:
+            if os.path.exists(self._done_path(spreadsheet_id)):
+                continue
+            with self._lock:
+                if spreadsheet_id in self._held:
+                    continue
+            if self._try_lease(spreadsheet_id, now):
+                # 领取后再检查一次, 其他worker可能刚好完成并释放了租约
+                if os.path.exists(self._done_path(spreadsheet_id)):
+                    self.release(spreadsheet_id)
+                    continue
+                return spreadsheet_id, True
+            waiting = True
+        return None, waiting
+
+    def claim(self, sleep=time.sleep):
+        """领取下一个ID, 全部完成时返回None; 剩余的项目都被其他worker持有时等待它们完成或租约过期"""
+        while True:
+            spreadsheet_id, waiting = self.try_claim()
+            if spreadsheet_id is not None or not waiting:
+                return spreadsheet_id
+            sleep(min(self.lease_seconds / 4, MAX_POLL_SECONDS))
+
+    def renew(self):
+        """续租当前持有的所有租约; 租约文件不再属于本worker时(已被接手、正在被接手或刚被其他worker创建)不再续租"""
+        with self._lock:
+            held = list(self._held)
+        for spreadsheet_id in held:
+            lease_path = self._lease_path(spreadsheet_id)
+            if not self._owns(lease_path):
+                self._lose(spreadsheet_id, lease_path)
+                continue
+            self._write_lease(lease_path)
+            # 写入的同时其他worker可能改名接手了租约, 以写入后的文件为准
+            if not self._owns(lease_path):
+                self._lose(spreadsheet_id, lease_path)
+
+    def _owns(self, lease_path):
+        lease = _read_json(lease_path)
+        return lease is not None and lease.get('owner') == self.owner
+
+    def _lose(self, spreadsheet_id, lease_path):
+        lease = _read_json(lease_path) or {}
+        logger.warning("[Queue] %s 的租约已被 %s 接手", spreadsheet_id, lease.get('worker') or '其他worker')
+        with self._lock:
+            self._held.discard(spreadsheet_id)
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                self.renew()
+            except OSError as e:
+                logger.warning("[Queue] 续租失败: %s", e)
+
+    def start_heartbeat(self):
+        if self._heartbeat is None:
+            self._stop.clear()
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name='queue-heartbeat', daemon=True)
+            self._heartbeat.start()
+
+    def stop_heartbeat(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+
+    def release(self, spreadsheet_id):
+        """放弃租约(例如下载被取消), 其他worker可以立即领取"""
+        with self._lock:
+            if spreadsheet_id not in self._held:
+                return
+            self._held.discard(spreadsheet_id)
+        lease_path = self._lease_path(spreadsheet_id)
+        lease = _read_json(lease_path)
+        if lease is not None and lease.get('owner') in (self.owner, None):
+            try:
+                os.remove(lease_path)
+            except FileNotFoundError:
+                pass
+
+    def complete(self, result):
+        """记录一个ID的结果(成功或失败)并释放租约"""
+        write_json_atomically(self._done_path(result.spreadsheet_id), {
+            'worker': self.worker_name,
+            'status': result.status,
+            'output_path': result.output_path,
+            'error': result.error,
+            'finished_at': time.time(),
+        })
+        self.release(result.spreadsheet_id)
+
+    def read_ids(self):
+        """读取已有队列的ID列表(不创建队列), 队列不存在时返回空列表"""
+        return (_read_json(self._items_path) or {}).get('ids', [])
+
+    def status(self):
+        """队列进度 {'total', 'done', 'failed', 'leased', 'pending', 'done_ids': {ID: 完成记录}}"""
+        ids = self.ids or self.read_ids()
+        now = time.time()
+        done = {}
+        leased = 0
+        for spreadsheet_id in ids:
+            record = _read_json(self._done_path(spreadsheet_id))
+            if record is not None:
+                done[spreadsheet_id] = record
+            elif os.path.exists(self._lease_path(spreadsheet_id)) and not self._expired(
+                    self._lease_path(spreadsheet_id), now):
+                leased += 1
+        failed = sum(1 for record in done.values() if record.get('status') == STATUS_FAILED)
+        return {'total': len(ids), 'done': len(done), 'failed': failed, 'leased': leased,
+                'pending': len(ids) - len(done) - leased, 'done_ids': done}